@@ -1,65 +1,232 @@
+import hashlib
+import math
+import threading
+from datetime import timedelta
 import streamlit as st
 import pandas as pd
-from src.data_loader import load_transactions
+from src.data_loader import load_transactions_from_bytes
 from src.anomaly_detector import AnomalyDetector
+from src.baselines import AccountBaselines
 from src.narrative_generator import NarrativeGenerator
+from src.narrative_cache import NarrativeCache
+from src.anomaly_store import AnomalyStore
+from src.config import (
+    NARRATIVE_BATCH_PROMPTS,
+    NARRATIVE_TEMPLATES,
+    BASELINES_ENABLED,
+    BASELINE_STATE_PATH,
+    ANOMALY_STORE_PAGE_SIZE
+)
+
+DISPLAY_COLS = ['TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Location', 'AnomalyType', 'Narrative']
+
+# Seconds between refreshes of the results table while narratives are being generated
+PROGRESS_REFRESH_SECONDS = 1.0
 
 st.set_page_config(page_title="Transaction Anomaly Narrator (TAN)", layout="wide")
 
 st.title("🤖 Transaction Anomaly Narrator (TAN)")
 st.caption("An AI-powered tool to detect and explain anomalies in financial transactions.")
 
+
+@st.cache_data(show_spinner="Parsing uploaded file...", max_entries=8)
+def parse_upload(file_hash: str, _file_bytes: bytes, file_name: str) -> pd.DataFrame:
+    """Parses an upload from memory; memoized on the content hash, so reruns skip parsing."""
+    return load_transactions_from_bytes(_file_bytes, file_name)
+
+
+@st.cache_data(show_spinner="Detecting anomalies...", max_entries=8)
+def detect_anomalies(file_hash: str, _transactions_df: pd.DataFrame) -> pd.DataFrame:
+    """Runs detection once per uploaded file, independently of narration."""
+    # Uploads are scored against the persisted account baselines without changing them
+    baselines = AccountBaselines.load(BASELINE_STATE_PATH) if BASELINES_ENABLED else None
+    return AnomalyDetector(_transactions_df, baselines=baselines, update_baselines=False).run_detection()
+
+
+class NarrationJob:
+    """Generates narratives on a background thread so the page stays responsive and cancellable."""
+
+    def __init__(self, file_hash: str, anomalies_df: pd.DataFrame):
+        self.file_hash = file_hash
+        self.anomalies_df = anomalies_df
+        self.narratives = [None] * len(anomalies_df)
+        self.completed = 0
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            narrator = NarrativeGenerator(cache=NarrativeCache())
+            narrations = narrator.iter_narratives(
+                self.anomalies_df.to_dict('records'), batch_prompts=NARRATIVE_BATCH_PROMPTS, templates=NARRATIVE_TEMPLATES
+            )
+            try:
+                for position, narrative in narrations:
+                    self.narratives[position] = narrative
+                    self.completed += 1
+                    if self._cancel.is_set():
+                        break
+            finally:
+                # Cancels requests that have not started yet
+                narrations.close()
+        except Exception as e:
+            self.error = str(e)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def results(self) -> pd.DataFrame:
+        """Returns the anomalies narrated so far, in detection order."""
+        narrated = [i for i, narrative in enumerate(self.narratives) if narrative is not None]
+        results_df = self.anomalies_df.iloc[narrated].copy()
+        results_df['Narrative'] = [self.narratives[i] for i in narrated]
+        return results_df
+
+
+def start_narration(file_hash: str, anomalies_df: pd.DataFrame):
+    """Cancels any running job and starts narrating `anomalies_df` in the background."""
+    previous = st.session_state.narration_job
+    if previous is not None:
+        previous.cancel()
+    job = NarrationJob(file_hash, anomalies_df)
+    job.start()
+    st.session_state.narration_job = job
+
+
+def render_results():
+    """Shows narration progress and the results table; refreshed periodically while a job runs."""
+    job = st.session_state.narration_job
+    total = len(job.narratives)
+
+    if job.error:
+        st.error(f"Narrative generation failed: {job.error}")
+    elif job.running:
+        st.progress(job.completed / total, text=f"Generating narratives... {job.completed} of {total} done.")
+        if st.button("⏹️ Cancel narration"):
+            job.cancel()
+    elif job.cancelled:
+        st.warning(f"Narration cancelled after {job.completed} of {total} anomalies.")
+    else:
+        st.success(f"Processing complete! Narrated {total} anomalies.")
+
+    st.dataframe(job.results()[DISPLAY_COLS], width='stretch')
+
+    if not job.running and st.session_state.get('narration_was_running'):
+        # Redraw the page once more so the periodic refresh stops
+        st.session_state.narration_was_running = False
+        st.rerun()
+    st.session_state.narration_was_running = job.running
+
+
+@st.cache_resource
+def get_anomaly_store() -> AnomalyStore:
+    """Opens the anomaly store once per server process."""
+    return AnomalyStore()
+
+
+def render_history():
+    """Browses the stored anomalies of past runs one page at a time, with indexed filters."""
+    store = get_anomaly_store()
+    account_col, type_col, text_col = st.columns(3)
+    account_id = account_col.text_input("Account ID").strip()
+    anomaly_type = type_col.selectbox("Anomaly type", ["All"] + store.labels())
+    text = text_col.text_input("Search narratives").strip()
+    dates_col, min_col, max_col = st.columns(3)
+    dates = dates_col.date_input("Date range", value=[])
+    min_amount = min_col.number_input("Min amount", min_value=0.0, value=None, step=100.0)
+    max_amount = max_col.number_input("Max amount", min_value=0.0, value=None, step=100.0)
+
+    filters = {
+        "account_id": account_id or None,
+        "anomaly_type": None if anomaly_type == "All" else anomaly_type,
+        "text": text or None,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+    }
+    if len(dates) == 2:
+        filters["start"], filters["end"] = dates[0], dates[1] + timedelta(days=1)
+
+    # Changing a filter starts again at the first page
+    if st.session_state.history_filters != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    total = store.count(**filters)
+    pages = max(1, math.ceil(total / ANOMALY_STORE_PAGE_SIZE))
+    page = store.query(cursor=cursors[-1], **filters)
+    st.caption(f"{total} stored anomalies match. Page {len(cursors)} of {pages}.")
+    st.dataframe(page[DISPLAY_COLS], width='stretch', hide_index=True)
+
+    previous_col, next_col = st.columns(2)
+    if previous_col.button("⬅️ Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next page ➡️", disabled=len(cursors) >= pages):
+        cursors.append(store.page_cursor(page))
+        st.rerun()
+
+
 # --- Session State Initialization ---
-if 'processed_data' not in st.session_state:
-    st.session_state.processed_data = None
+if 'narration_job' not in st.session_state:
+    st.session_state.narration_job = None
+if 'detected_file_hash' not in st.session_state:
+    st.session_state.detected_file_hash = None
+if 'history_filters' not in st.session_state:
+    st.session_state.history_filters = None
+    st.session_state.history_cursors = [None]
 
 # --- Main App Logic ---
-uploaded_file = st.file_uploader("Upload your transactions CSV file", type=["csv"])
+analyze_tab, history_tab = st.tabs(["🔍 Analyze File", "🗂️ History"])
+
+with analyze_tab:
+    uploaded_file = st.file_uploader("Upload your transactions file", type=["csv", "parquet", "feather", "arrow"])
 
-if uploaded_file is not None:
-    try:
-        # Use a temporary file path for loading
-        with open("temp_uploaded.csv", "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        transactions_df = load_transactions("temp_uploaded.csv")
+    if uploaded_file is not None:
+        file_bytes = uploaded_file.getvalue()
+        file_hash = hashlib.sha256(file_bytes).hexdigest()
+        transactions_df = parse_upload(file_hash, file_bytes, uploaded_file.name)
 
-        if transactions_df is not None:
+        if transactions_df is None:
+            st.error("The uploaded file could not be parsed as transaction data.")
+        else:
             st.success(f"Successfully loaded {len(transactions_df)} transactions.")
-            
+
             if st.button("🔍 Run Anomaly Detection", type="primary"):
-                with st.spinner("Detecting anomalies and generating narratives... This may take a moment."):
-                    # Detect anomalies
-                    detector = AnomalyDetector(transactions_df)
-                    anomalies_df = detector.run_detection()
-                    
-                    if not anomalies_df.empty:
-                        # Generate narratives
-                        narrator = NarrativeGenerator()
-                        anomalies_df['Narrative'] = anomalies_df.apply(
-                            lambda row: narrator.generate_narrative(row.to_dict()), axis=1
-                        )
-                        st.session_state.processed_data = anomalies_df
-                    else:
-                        st.session_state.processed_data = pd.DataFrame() # Empty df if no anomalies
-                
-                if st.session_state.processed_data.empty:
+                st.session_state.detected_file_hash = file_hash
+
+            if st.session_state.detected_file_hash == file_hash:
+                anomalies_df = detect_anomalies(file_hash, transactions_df)
+
+                # --- Display Results ---
+                st.divider()
+                st.subheader("Anomaly Detection Results")
+
+                if anomalies_df.empty:
                     st.info("No anomalies were detected in the provided data.")
                 else:
-                    st.success(f"Processing complete! Found {len(st.session_state.processed_data)} anomalies.")
+                    job = st.session_state.narration_job
+                    if job is None or job.file_hash != file_hash:
+                        start_narration(file_hash, anomalies_df)
+                    elif job.cancelled and not job.running and st.button("▶️ Resume narration"):
+                        # Narratives finished before cancelling are served from the cache
+                        start_narration(file_hash, anomalies_df)
 
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
+                    job = st.session_state.narration_job
+                    refresh = PROGRESS_REFRESH_SECONDS if job.running else None
+                    st.fragment(render_results, run_every=refresh)()
 
-# --- Display Results ---
-if st.session_state.processed_data is not None:
-    st.divider()
-    st.subheader("Anomaly Detection Results")
-
-    if not st.session_state.processed_data.empty:
-        # Displayable columns
-        display_cols = ['TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Location', 'AnomalyType', 'Narrative']
-        st.dataframe(st.session_state.processed_data[display_cols], width='stretch')
-    else:
-        # This message shows after a run that finds no anomalies
-        st.write("No anomalies to display.")
\ No newline at end of file
+with history_tab:
+    render_history()
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from generate_data import write_transactions
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_OUTPUT = "data/benchmarks/benchmark_results.json"
+
+# Rows per account in generated datasets, and incident PDFs rendered per run
+ROWS_PER_ACCOUNT = 50
+PDF_SAMPLE_SIZE = 100
+
+# Cold start: `import main` in a fresh interpreter must stay within the budget, without loading
+# the dependencies that only narration, PDF rendering or a .env file need.
+COLD_START_BUDGET_SECONDS = 1.0
+COLD_START_REPEATS = 5
+LAZY_MODULES = ("google.generativeai", "fpdf", "dotenv")
+
+_COLD_START_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - start, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def _peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return round(peak / 1024 ** 2 if platform.system() == "Darwin" else peak / 1024, 1)
+
+
+@contextmanager
+def _stage(results: dict, name: str, rows: int):
+    """Times one pipeline stage and records its duration, throughput and peak RSS."""
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    results[name] = {
+        "seconds": round(seconds, 4),
+        "rows": rows,
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def measure_cold_start(repeats: int = COLD_START_REPEATS) -> dict:
+    """
+    Times `import main` and a full `python main.py --help` process in fresh interpreters.
+
+    Returns:
+        dict: Median timings, the budget, any lazy modules that were loaded at import, and
+              whether the median import time is within budget with no lazy module loaded.
+    """
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    import_seconds, process_seconds, loaded = [], [], set()
+    for _ in range(repeats):
+        probe = subprocess.run([sys.executable, "-c", _COLD_START_PROBE], cwd=project_dir, capture_output=True, text=True, check=True)
+        result = json.loads(probe.stdout.strip().splitlines()[-1])
+        import_seconds.append(result["seconds"])
+        loaded.update(result["loaded"])
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", "--help"], cwd=project_dir, capture_output=True, check=True)
+        process_seconds.append(time.perf_counter() - start)
+
+    median_import = statistics.median(import_seconds)
+    return {
+        "import_main_seconds": round(median_import, 4),
+        "cli_help_process_seconds": round(statistics.median(process_seconds), 4),
+        "budget_seconds": COLD_START_BUDGET_SECONDS,
+        "lazy_modules_loaded": sorted(loaded),
+        "within_budget": median_import <= COLD_START_BUDGET_SECONDS and not loaded,
+    }
+
+
+def _benchmark_size(num_rows: int, seed: int, pdf_sample_size: int) -> dict:
+    """
+    Runs every pipeline stage on a generated dataset of `num_rows` transactions.
+
+    Executed in a fresh worker process per size, so peak RSS is not inherited from
+    earlier, smaller runs.
+    """
+    # Imported here so each worker pays (and measures) its own import cost
+    from src.data_loader import load_transactions
+    from src.anomaly_detector import AnomalyDetector, ParallelAnomalyDetector
+    from src.rules import RuleEngine, load_rule_engine
+    from src.report_generator import create_csv_report
+    from src.pdf_report import PDFReportGenerator
+
+    stages = {}
+    num_accounts = max(1, num_rows // ROWS_PER_ACCOUNT)
+    with tempfile.TemporaryDirectory() as workdir:
+        # Reports are written relative to the working directory
+        os.chdir(workdir)
+        input_path = os.path.join(workdir, "transactions.csv")
+        write_transactions(input_path, num_records=num_rows, num_accounts=num_accounts, seed=seed)
+
+        with _stage(stages, "load_transactions", num_rows):
+            transactions_df = load_transactions(input_path)
+
+        # Each rule on its own, then the whole engine, which shares column extraction and sorts
+        engine = load_rule_engine()
+        for rule in engine.rules:
+            with _stage(stages, f"rule:{rule.type}", num_rows):
+                RuleEngine([rule]).compute_mask(transactions_df)
+
+        with _stage(stages, "rule_engine", num_rows):
+            engine.compute_mask(transactions_df)
+
+        with _stage(stages, "run_detection", num_rows):
+            anomalies_df = AnomalyDetector(transactions_df).run_detection()
+
+        with _stage(stages, "parallel_detection", num_rows):
+            ParallelAnomalyDetector(transactions_df).run_detection()
+
+        anomalies_df['Narrative'] = "Benchmark placeholder narrative."
+        report_df = anomalies_df[['TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Location', 'AnomalyType', 'Narrative']]
+        with _stage(stages, "create_csv_report", len(report_df)):
+            create_csv_report(report_df, "benchmark_report.csv")
+
+        sample = anomalies_df.head(pdf_sample_size).to_dict('records')
+        with _stage(stages, "PDFReportGenerator", len(sample)):
+            PDFReportGenerator().generate_reports(sample)
+
+    return {
+        "rows": num_rows,
+        "accounts": num_accounts,
+        "anomalies": len(anomalies_df),
+        "stages": stages,
+    }
+
+
+def run_benchmarks(sizes: list, seed: int = 42, pdf_sample_size: int = PDF_SAMPLE_SIZE) -> dict:
+    """
+    Benchmarks the CLI cold start, then the pipeline across dataset sizes.
+
+    Returns:
+        dict: Environment metadata, the cold-start measurement and one result entry per size.
+    """
+    print("⏱️ Measuring cold start...")
+    cold_start = measure_cold_start()
+
+    results = []
+    for num_rows in sizes:
+        print(f"⏱️ Benchmarking {num_rows} transactions...")
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_benchmark_size, num_rows, seed, pdf_sample_size).result())
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "cold_start": cold_start,
+        "results": results,
+    }
+
+
+def _print_summary(report: dict):
+    """Prints the cold start and a compact seconds-per-stage table."""
+    cold_start = report["cold_start"]
+    status = "✅ within" if cold_start["within_budget"] else "❌ over"
+    print(f"{status} cold-start budget: import main {cold_start['import_main_seconds']}s "
+          f"(budget {cold_start['budget_seconds']}s), `main.py --help` {cold_start['cli_help_process_seconds']}s")
+    if cold_start["lazy_modules_loaded"]:
+        print(f"   Loaded at import: {', '.join(cold_start['lazy_modules_loaded'])}")
+    table = pd.DataFrame({
+        result["rows"]: {stage: values["seconds"] for stage, values in result["stages"].items()}
+        for result in report["results"]
+    })
+    print(table.to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark each TAN pipeline stage across dataset sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Dataset sizes (rows) to benchmark.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the generated datasets.")
+    parser.add_argument("--pdf-sample", type=int, default=PDF_SAMPLE_SIZE, help="Incident PDFs rendered per size.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Path of the JSON results file.")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.seed, args.pdf_sample)
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    _print_summary(report)
+    print(f"\n✅ Benchmark results saved to '{args.output}'.")
@@ -1,8 +1,7 @@
-import pandas as pd
+import argparse
 import numpy as np
-import random
-from faker import Faker
-from datetime import datetime, timedelta
+import pandas as pd
+from datetime import datetime
 
 # --- Configuration ---
 NUM_RECORDS = 1050
@@ -10,113 +9,207 @@ ACCOUNTS_TO_CREATE = 200
 START_DATE = datetime(2025, 8, 20)
 END_DATE = datetime(2025, 9, 20)
 
-# --- Initialize Faker for realistic data ---
-fake = Faker()
+# Rows generated (and written) per chunk, so memory stays flat for very large datasets
+CHUNK_SIZE = 1_000_000
+
+# Default share of rows receiving each injected anomaly
+ANOMALY_RATES = {
+    'high_value': 15 / NUM_RECORDS,
+    'odd_hour': 15 / NUM_RECORDS,
+    'foreign_location': 15 / NUM_RECORDS,
+    'high_velocity': 20 / NUM_RECORDS,
+    'combined': 3 / NUM_RECORDS,
+}
 
 # --- Lists for generating varied data ---
-MERCHANTS = [
+MERCHANTS = np.array([
     'Amazon', 'Walmart', 'Starbucks', 'Apple Store', 'ExxonMobil', 'Costco', 'Netflix',
     'Delta Airlines', 'Uber', 'Lyft', 'Whole Foods', 'Target', 'Best Buy', 'Home Depot'
-]
-TRANSACTION_TYPES = ['Card', 'Online', 'ATM', 'Transfer']
-DOMESTIC_LOCATIONS = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio', 'San Diego', 'Dallas', 'San Jose']
-FOREIGN_LOCATIONS = ['London', 'Tokyo', 'Paris', 'Sydney', 'Hong Kong', 'Singapore', 'Dubai', 'Moscow', 'Mexico City', 'Toronto']
-
-# --- Generate a base set of accounts for consistency ---
-accounts = []
-for i in range(ACCOUNTS_TO_CREATE):
-    accounts.append({
-        'AccountID': f'ACC{1000 + i}',
-        'AccountHistoryDays': random.randint(30, 1500),
-        'AvgDailySpend': round(random.uniform(50, 800), 2)
+])
+TRANSACTION_TYPES = np.array(['Card', 'Online', 'ATM', 'Transfer'])
+DOMESTIC_LOCATIONS = np.array(['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio', 'San Diego', 'Dallas', 'San Jose'])
+FOREIGN_LOCATIONS = np.array(['London', 'Tokyo', 'Paris', 'Sydney', 'Hong Kong', 'Singapore', 'Dubai', 'Moscow', 'Mexico City', 'Toronto'])
+
+# Velocity bursts: transactions per burst and spacing between them
+VELOCITY_BURST_SIZE = 5
+VELOCITY_BURST_SPACING_SECONDS = 120
+
+
+def _generate_accounts(num_accounts: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Generates the base set of accounts shared by every chunk."""
+    return pd.DataFrame({
+        'AccountID': 'ACC' + pd.Series(np.arange(1000, 1000 + num_accounts)).astype(str),
+        'AccountHistoryDays': rng.integers(30, 1501, num_accounts),
+        'AvgDailySpend': np.round(rng.uniform(50, 800, num_accounts), 2),
     })
 
-print(f"Generating {NUM_RECORDS} transactions for {ACCOUNTS_TO_CREATE} accounts...")
-
-# --- Main loop to generate transaction records ---
-transactions = []
-for i in range(NUM_RECORDS):
-    account = random.choice(accounts)
-    
-    # Generate a normal-looking amount
-    amount = round(account['AvgDailySpend'] * random.uniform(0.1, 2.5), 2)
-    if amount < 5.0: amount = round(random.uniform(5, 50), 2)
-
-    # Generate a random timestamp
-    random_seconds = random.randint(0, int((END_DATE - START_DATE).total_seconds()))
-    timestamp = START_DATE + timedelta(seconds=random_seconds)
-    
-    transactions.append({
-        'TransactionID': f'TXN{10000 + i}',
-        'AccountID': account['AccountID'],
-        'Timestamp': timestamp,
+
+def _move_to_odd_hour(seconds: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Moves offsets (seconds since START_DATE) to a random hour between 1 AM and 4 AM of the same day."""
+    return seconds // 86400 * 86400 + rng.integers(1, 5, len(seconds)) * 3600 + seconds % 3600
+
+
+def _generate_chunk(
+    first_id: int,
+    num_rows: int,
+    accounts: pd.DataFrame,
+    start_seconds: int,
+    end_seconds: int,
+    anomaly_rates: dict,
+    rng: np.random.Generator
+) -> pd.DataFrame:
+    """Generates one time-ordered chunk of transactions with injected anomalies."""
+    account_idx = rng.integers(0, len(accounts), num_rows)
+    avg_spend = accounts['AvgDailySpend'].to_numpy()[account_idx]
+
+    # Normal-looking amounts, with very small ones bumped up
+    amount = np.round(avg_spend * rng.uniform(0.1, 2.5, num_rows), 2)
+    small = amount < 5.0
+    amount[small] = np.round(rng.uniform(5, 50, small.sum()), 2)
+
+    seconds = rng.integers(start_seconds, end_seconds, num_rows)
+    merchant = MERCHANTS[rng.integers(0, len(MERCHANTS), num_rows)].astype(object)
+    location = DOMESTIC_LOCATIONS[rng.integers(0, len(DOMESTIC_LOCATIONS), num_rows)].astype(object)
+
+    # 1. High Value Anomalies (with a more unique-looking merchant)
+    high_value = rng.random(num_rows) < anomaly_rates['high_value']
+    amount[high_value] = np.round(avg_spend[high_value] * rng.uniform(15, 40, high_value.sum()), 2)
+    merchant[high_value] = 'Merchant ' + pd.Series(rng.integers(100, 10000, high_value.sum())).astype(str) + ' Inc.'
+
+    # 2. Odd Hour Anomalies: move the transaction to between 1 AM and 4 AM of the same day
+    odd_hour = rng.random(num_rows) < anomaly_rates['odd_hour']
+    seconds[odd_hour] = _move_to_odd_hour(seconds[odd_hour], rng)
+
+    # 3. Foreign Location Anomalies
+    foreign = rng.random(num_rows) < anomaly_rates['foreign_location']
+    location[foreign] = FOREIGN_LOCATIONS[rng.integers(0, len(FOREIGN_LOCATIONS), foreign.sum())]
+
+    # 4. High Velocity Anomalies: bursts of transactions on one account, 2 minutes apart
+    num_bursts = int(num_rows * anomaly_rates['high_velocity'] / VELOCITY_BURST_SIZE)
+    if num_bursts:
+        burst_rows = rng.choice(num_rows, num_bursts * VELOCITY_BURST_SIZE, replace=False).reshape(num_bursts, VELOCITY_BURST_SIZE)
+        burst_span = VELOCITY_BURST_SIZE * VELOCITY_BURST_SPACING_SECONDS
+        burst_start = rng.integers(start_seconds, max(start_seconds + 1, end_seconds - burst_span), num_bursts)
+        account_idx[burst_rows] = rng.integers(0, len(accounts), num_bursts)[:, None]
+        seconds[burst_rows] = burst_start[:, None] + np.arange(VELOCITY_BURST_SIZE) * VELOCITY_BURST_SPACING_SECONDS
+        avg_spend = accounts['AvgDailySpend'].to_numpy()[account_idx]
+
+    # 5. Combined Anomaly (High Value + Odd Hour + Foreign)
+    combined = rng.random(num_rows) < anomaly_rates['combined']
+    amount[combined] = np.round(avg_spend[combined] * rng.uniform(20, 50, combined.sum()), 2)
+    seconds[combined] = _move_to_odd_hour(seconds[combined], rng)
+    location[combined] = FOREIGN_LOCATIONS[rng.integers(0, len(FOREIGN_LOCATIONS), combined.sum())]
+
+    df = pd.DataFrame({
+        'TransactionID': 'TXN' + pd.Series(np.arange(first_id, first_id + num_rows)).astype(str),
+        'AccountID': accounts['AccountID'].to_numpy()[account_idx],
+        'Timestamp': pd.Timestamp(START_DATE) + pd.to_timedelta(seconds, unit='s'),
         'Amount': amount,
-        'Merchant': random.choice(MERCHANTS),
-        'TransactionType': random.choice(TRANSACTION_TYPES),
-        'Location': random.choice(DOMESTIC_LOCATIONS),
-        'AccountHistoryDays': account['AccountHistoryDays'],
-        'AvgDailySpend': account['AvgDailySpend']
+        'Merchant': merchant,
+        'TransactionType': TRANSACTION_TYPES[rng.integers(0, len(TRANSACTION_TYPES), num_rows)],
+        'Location': location,
+        'AccountHistoryDays': accounts['AccountHistoryDays'].to_numpy()[account_idx],
+        'AvgDailySpend': avg_spend,
     })
-
-df = pd.DataFrame(transactions)
-
-print("Injecting anomalies into the dataset...")
-
-# --- Inject Anomalies ---
-
-# 1. High Value Anomalies (15 records)
-high_value_indices = df.sample(n=15).index
-for idx in high_value_indices:
-    avg_spend = df.loc[idx, 'AvgDailySpend']
-    df.loc[idx, 'Amount'] = round(avg_spend * random.uniform(15, 40), 2)
-    df.loc[idx, 'Merchant'] = fake.company() + " Inc." # Make merchant look more unique
-
-# 2. Odd Hour Anomalies (15 records, avoiding overlap)
-remaining_indices = df.index.difference(high_value_indices)
-odd_hour_indices = pd.Series(remaining_indices).sample(n=15)
-for idx in odd_hour_indices:
-    current_ts = df.loc[idx, 'Timestamp']
-    # Set hour to be between 1 AM and 4 AM
-    odd_hour_ts = current_ts.replace(hour=random.randint(1, 4))
-    df.loc[idx, 'Timestamp'] = odd_hour_ts
-
-# 3. Foreign Location Anomalies (15 records)
-remaining_indices = df.index.difference(high_value_indices).difference(odd_hour_indices)
-foreign_loc_indices = pd.Series(remaining_indices).sample(n=15)
-for idx in foreign_loc_indices:
-    df.loc[idx, 'Location'] = random.choice(FOREIGN_LOCATIONS)
-
-# 4. High Velocity Anomalies (4 clusters of 5 transactions each = 20 records)
-remaining_indices = df.index.difference(high_value_indices).difference(odd_hour_indices).difference(foreign_loc_indices)
-for i in range(4): # Create 4 clusters
-    account = random.choice(accounts)
-    start_time = START_DATE + timedelta(seconds=random.randint(0, int((END_DATE - START_DATE).total_seconds()) - 600))
-    
-    velocity_indices = pd.Series(remaining_indices).sample(n=5)
-    remaining_indices = remaining_indices.difference(velocity_indices)
-    
-    for j, idx in enumerate(velocity_indices):
-        df.loc[idx, 'AccountID'] = account['AccountID']
-        df.loc[idx, 'Timestamp'] = start_time + timedelta(minutes=j*2) # Transactions 2 mins apart
-        df.loc[idx, 'Location'] = fake.city() # Vary the city slightly
-
-# 5. Combined Anomaly (High Value + Odd Hour + Foreign, 3 records)
-remaining_indices = df.index.difference(high_value_indices).difference(odd_hour_indices).difference(foreign_loc_indices)
-combo_indices = pd.Series(remaining_indices).sample(n=3)
-for idx in combo_indices:
-    avg_spend = df.loc[idx, 'AvgDailySpend']
-    df.loc[idx, 'Amount'] = round(avg_spend * random.uniform(20, 50), 2)
-    current_ts = df.loc[idx, 'Timestamp']
-    df.loc[idx, 'Timestamp'] = current_ts.replace(hour=random.randint(1, 4))
-    df.loc[idx, 'Location'] = random.choice(FOREIGN_LOCATIONS)
-
-# --- Finalize and Save ---
-# Shuffle the dataframe so anomalies are not clustered
-df = df.sample(frac=1).reset_index(drop=True)
-
-# Save to CSV
-output_filename = 'presentation_transactions.csv'
-df.to_csv(output_filename, index=False)
-
-print(f"\n✅ Success! {len(df)} records saved to '{output_filename}'.")
-print("The file contains a mix of normal transactions and injected anomalies.")
\ No newline at end of file
+    return df.sort_values('Timestamp', kind='stable').reset_index(drop=True)
+
+
+def iter_transaction_chunks(
+    num_records: int = NUM_RECORDS,
+    num_accounts: int = ACCOUNTS_TO_CREATE,
+    anomaly_rates: dict = None,
+    seed: int = 42,
+    chunk_size: int = CHUNK_SIZE
+):
+    """
+    Generates a synthetic, time-ordered transaction dataset chunk by chunk.
+
+    Each chunk covers its own range of whole days, so the concatenated output is sorted by
+    timestamp (suitable for streaming and incremental detection). Chunks never split a day,
+    so a chunk can exceed `chunk_size` by up to one day of rows. The same arguments always
+    produce the same data.
+
+    Args:
+        num_records (int): Total number of transactions.
+        num_accounts (int): Number of distinct accounts.
+        anomaly_rates (dict): Share of rows per injected anomaly; defaults to ANOMALY_RATES.
+        seed (int): Random seed.
+        chunk_size (int): Rows per chunk.
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of transactions.
+    """
+    rates = {**ANOMALY_RATES, **(anomaly_rates or {})}
+    rng = np.random.default_rng(seed)
+    accounts = _generate_accounts(num_accounts, rng)
+
+    total_days = (END_DATE - START_DATE).days
+    num_chunks = min(total_days, max(1, -(-num_records // chunk_size)))
+    for i in range(num_chunks):
+        first_day = total_days * i // num_chunks
+        last_day = total_days * (i + 1) // num_chunks
+        first_row = num_records * first_day // total_days
+        num_rows = num_records * last_day // total_days - first_row
+        yield _generate_chunk(10000 + first_row, num_rows, accounts, first_day * 86400, last_day * 86400, rates, rng)
+
+
+def generate_transactions(
+    num_records: int = NUM_RECORDS,
+    num_accounts: int = ACCOUNTS_TO_CREATE,
+    anomaly_rates: dict = None,
+    seed: int = 42
+) -> pd.DataFrame:
+    """Generates a whole synthetic dataset in memory. See `iter_transaction_chunks`."""
+    return pd.concat(iter_transaction_chunks(num_records, num_accounts, anomaly_rates, seed), ignore_index=True)
+
+
+def write_transactions(output_filename: str, **kwargs) -> int:
+    """
+    Generates a dataset and writes it chunk by chunk to CSV or, for a .parquet name, Parquet.
+
+    Returns:
+        int: Number of rows written.
+    """
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_transaction_chunks(**kwargs):
+            if output_filename.endswith('.parquet'):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = writer or pq.ParquetWriter(output_filename, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(output_filename, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic transaction dataset with injected anomalies.")
+    parser.add_argument("--rows", type=int, default=NUM_RECORDS, help="Number of transactions.")
+    parser.add_argument("--accounts", type=int, default=ACCOUNTS_TO_CREATE, help="Number of distinct accounts.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows generated and written per chunk.")
+    for name, rate in ANOMALY_RATES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}-rate", type=float, default=rate, help=f"Share of rows with the '{name}' anomaly.")
+    parser.add_argument("--output", default="presentation_transactions.csv", help="Output .csv or .parquet file.")
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows} transactions for {args.accounts} accounts...")
+    rates = {name: getattr(args, f"{name}_rate") for name in ANOMALY_RATES}
+    rows = write_transactions(
+        args.output,
+        num_records=args.rows,
+        num_accounts=args.accounts,
+        anomaly_rates=rates,
+        seed=args.seed,
+        chunk_size=args.chunk_size
+    )
+
+    print(f"\n✅ Success! {rows} records saved to '{args.output}'.")
+    print("The file contains a mix of normal transactions and injected anomalies.")
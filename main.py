@@ -1,50 +1,327 @@
-from src.data_loader import load_transactions
-from src.anomaly_detector import AnomalyDetector
+import argparse
+import os
+import pandas as pd
+from src.data_loader import load_transactions, load_transactions_in_chunks, convert_to_parquet
+from src.anomaly_detector import AnomalyDetector, ParallelAnomalyDetector, StreamingAnomalyDetector
+from src.baselines import AccountBaselines
 from src.narrative_generator import NarrativeGenerator
-from src.report_generator import create_csv_report, PDFReportGenerator
-from src.config import CSV_REPORT_FILENAME
+from src.narrative_cache import NarrativeCache
+from src.report_generator import ReportSink
+from src.anomaly_store import AnomalyStore
+from src.metrics import metrics, profile_run
+from src.config import (
+    GEMINI_API_KEY,
+    REPORTS_DIR,
+    RUN_SUMMARY_FILENAME,
+    CSV_REPORT_FILENAME,
+    DETECTED_ANOMALIES_FILENAME,
+    NARRATION_SKIPPED,
+    ANOMALY_STORE_ENABLED,
+    NARRATIVE_BATCH_PROMPTS,
+    NARRATIVE_TEMPLATES,
+    STREAMING_FILE_SIZE_THRESHOLD_MB,
+    STREAMING_CHUNK_SIZE,
+    PARALLEL_DETECTION_MIN_ROWS,
+    BASELINES_ENABLED,
+    BASELINE_STATE_PATH,
+    PDF_CONSOLIDATED_REPORT,
+    CONSOLIDATED_PDF_FILENAME,
+    SERVICE_INPUT_DIR
+)
 
-def main():
+INPUT_FILE = "data/input/synthetic_transactions.csv"
+DETECTED_ANOMALIES_PATH = os.path.join(REPORTS_DIR, DETECTED_ANOMALIES_FILENAME)
+
+
+def detect(input_file: str, stream: bool = False) -> pd.DataFrame:
     """
-    Main pipeline to run the Transaction Anomaly Narrator.
+    Loads the input and detects anomalies, scoring against (and then updating) the learned
+    account baselines. The anomalies are saved for the `narrate` and `report` commands.
+
+    Args:
+        input_file (str): Transaction file to process.
+        stream (bool): Process the input in chunks, so it never has to fit in memory at once.
+                       The input must be in time order.
+
+    Returns:
+        pd.DataFrame: The anomalous transactions, or None if the input could not be loaded or
+                      streamed.
     """
-    print("🚀 Starting Transaction Anomaly Narrator (TAN) Pipeline...")
-    
-    # 1. Load Data
-    transactions_df = load_transactions("data/input/synthetic_transactions.csv")
-    if transactions_df is None:
+    baselines = AccountBaselines.load(BASELINE_STATE_PATH) if BASELINES_ENABLED else None
+    if stream:
+        with metrics.timer("load_and_detect"):
+            detector = StreamingAnomalyDetector(baselines=baselines)
+            try:
+                anomalies_df = detector.run_detection(load_transactions_in_chunks(input_file, STREAMING_CHUNK_SIZE))
+            except ValueError as e:
+                # Baselines are not saved, so a rerun without --stream starts from the same state
+                print(f"❌ {e} Sort the file by Timestamp, or run without --stream.")
+                return None
+    else:
+        if os.path.exists(input_file) and os.path.getsize(input_file) > STREAMING_FILE_SIZE_THRESHOLD_MB * 1024 ** 2:
+            print(f"💡 {input_file} is larger than {STREAMING_FILE_SIZE_THRESHOLD_MB} MB; if it is in time order, --stream bounds memory use.")
+        with metrics.timer("load"):
+            transactions_df = load_transactions(input_file)
+        if transactions_df is None:
+            return None
+
+        with metrics.timer("detection"):
+            # Large in-memory inputs are partitioned by account across all cores
+            if len(transactions_df) >= PARALLEL_DETECTION_MIN_ROWS:
+                detector = ParallelAnomalyDetector(transactions_df, copy=False, baselines=baselines)
+            else:
+                detector = AnomalyDetector(transactions_df, copy=False, baselines=baselines)
+            anomalies_df = detector.run_detection()
+
+    if baselines is not None:
+        with metrics.timer("baselines_save"):
+            baselines.save(BASELINE_STATE_PATH)
+        print(f"📐 Account baselines saved for {len(baselines)} accounts to: {BASELINE_STATE_PATH}")
+
+    save_anomalies(anomalies_df)
+    return anomalies_df
+
+
+def save_anomalies(anomalies_df: pd.DataFrame):
+    """Saves detected (and possibly narrated) anomalies for later commands."""
+    if not os.path.exists(REPORTS_DIR):
+        os.makedirs(REPORTS_DIR)
+    anomalies_df.to_parquet(DETECTED_ANOMALIES_PATH)
+
+
+def load_anomalies() -> pd.DataFrame:
+    """Loads the anomalies saved by the last detection, or returns None if there are none."""
+    if not os.path.exists(DETECTED_ANOMALIES_PATH):
+        print(f"❌ No detected anomalies at {DETECTED_ANOMALIES_PATH}. Run 'python main.py detect' first.")
+        return None
+    return pd.read_parquet(DETECTED_ANOMALIES_PATH)
+
+
+def narrate(anomalies_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Generates narratives, appending them to the summary report as they complete. If a previous
+    run crashed, the report resumes where it stopped and its narratives come from the cache.
+
+    Returns:
+        pd.DataFrame: `anomalies_df` with a 'Narrative' column.
+    """
+    print("✍️ Generating narratives for detected anomalies...")
+    records = anomalies_df.to_dict('records')
+    narratives = [None] * len(records)
+    with metrics.timer("narration_and_report"):
+        narrative_cache = NarrativeCache()
+        narrator = NarrativeGenerator(cache=narrative_cache)
+        with ReportSink(CSV_REPORT_FILENAME) as report:
+            next_row = 0
+            for position, narrative in narrator.iter_narratives(records, batch_prompts=NARRATIVE_BATCH_PROMPTS, templates=NARRATIVE_TEMPLATES):
+                narratives[position] = narrative
+                # Report rows in detection order, as soon as every earlier row is narrated
+                first_row = next_row
+                while next_row < len(records) and narratives[next_row] is not None:
+                    records[next_row]['Narrative'] = narratives[next_row]
+                    next_row += 1
+                report.write(records[first_row:next_row])
+    anomalies_df['Narrative'] = narratives
+    cache_stats = narrative_cache.stats()
+    print(f"🗃️ Narrative cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
+    return anomalies_df
+
+
+def skip_narration(anomalies_df: pd.DataFrame) -> pd.DataFrame:
+    """Writes the summary report without narratives."""
+    anomalies_df['Narrative'] = NARRATION_SKIPPED
+    with metrics.timer("report"):
+        with ReportSink(CSV_REPORT_FILENAME, resume=False) as report:
+            report.write(anomalies_df)
+    return anomalies_df
+
+
+def store_anomalies(anomalies_df: pd.DataFrame):
+    """Adds anomalies and their narratives to the indexed store behind the app's history view."""
+    if not ANOMALY_STORE_ENABLED:
         return
+    with metrics.timer("anomaly_store"):
+        store = AnomalyStore()
+        try:
+            count = store.add(anomalies_df)
+        finally:
+            store.close()
+    print(f"🗄️ {count} anomalies saved to the anomaly store: {store.path}")
+
+
+def write_pdfs(anomalies_df: pd.DataFrame):
+    """Generates PDF reports, either one per incident (rendered in parallel) or a single consolidated file."""
+    # Imported here so runs without PDFs never load fpdf
+    from src.pdf_report import PDFReportGenerator
 
-    # 2. Detect Anomalies
-    detector = AnomalyDetector(transactions_df)
-    anomalies_df = detector.run_detection()
+    if 'Narrative' not in anomalies_df.columns:
+        anomalies_df['Narrative'] = NARRATION_SKIPPED
+    with metrics.timer("pdf_reports"):
+        pdf_reporter = PDFReportGenerator()
+        anomaly_records = anomalies_df.to_dict('records')
+        if PDF_CONSOLIDATED_REPORT:
+            pdf_reporter.generate_consolidated_report(anomaly_records, CONSOLIDATED_PDF_FILENAME)
+        else:
+            pdf_reporter.generate_reports(anomaly_records)
 
+
+def run_pipeline(input_file: str = INPUT_FILE, narrate_anomalies: bool = True, pdfs: bool = True, stream: bool = False):
+    """
+    Runs each pipeline stage, timing it under `metrics`.
+
+    Args:
+        input_file (str): Transaction file to process.
+        stream (bool): Detect in chunks over a time-ordered input. See `detect`.
+        narrate_anomalies (bool): Generate LLM narratives. Skipped when GEMINI_API_KEY is not set.
+        pdfs (bool): Generate PDF incident reports.
+    """
+    print("🚀 Starting Transaction Anomaly Narrator (TAN) Pipeline...")
+
+    # 1-2. Load Data and Detect Anomalies
+    anomalies_df = detect(input_file, stream=stream)
+    if anomalies_df is None:
+        return
     if anomalies_df.empty:
         print("✅ No anomalies found. Pipeline finished.")
         return
 
     # 3. Generate Narratives
-    print("✍️ Generating narratives for detected anomalies...")
-    narrator = NarrativeGenerator()
-    anomalies_df['Narrative'] = anomalies_df.apply(
-        lambda row: narrator.generate_narrative(row.to_dict()),
-        axis=1
-    )
+    if narrate_anomalies and not GEMINI_API_KEY:
+        print("⚠️ GEMINI_API_KEY is not set; skipping narration.")
+        narrate_anomalies = False
+    if narrate_anomalies:
+        anomalies_df = narrate(anomalies_df)
+        save_anomalies(anomalies_df)
+    else:
+        anomalies_df = skip_narration(anomalies_df)
+    store_anomalies(anomalies_df)
 
     # 4. Generate Reports
-    print("📊 Generating final reports...")
-    
-    # Generate summary CSV report
-    final_report_df = anomalies_df[['TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Location', 'AnomalyType', 'Narrative']]
-    create_csv_report(final_report_df, CSV_REPORT_FILENAME)
-    
-    # Generate individual PDF reports
-    pdf_reporter = PDFReportGenerator()
-    for _, row in anomalies_df.iterrows():
-        pdf_reporter.generate_report(row.to_dict())
+    if pdfs:
+        print("📊 Generating final reports...")
+        write_pdfs(anomalies_df)
 
     print("\n🎉 TAN Pipeline finished successfully!")
-    print(f"➡️ Check the '{CSV_REPORT_FILENAME}' and PDF files in the 'data/reports/' directory.")
+    print(f"➡️ Check the '{CSV_REPORT_FILENAME}' and PDF files in the '{REPORTS_DIR}/' directory.")
+
+
+def detect_command(args):
+    """Detects anomalies and writes the summary report without narratives."""
+    anomalies_df = detect(args.input, stream=args.stream)
+    if anomalies_df is not None:
+        store_anomalies(skip_narration(anomalies_df))
+
+
+def narrate_command(args):
+    """Narrates the anomalies of the last detection into the summary report."""
+    if not GEMINI_API_KEY:
+        print("❌ GEMINI_API_KEY is not set. Please check your .env file.")
+        return
+    anomalies_df = load_anomalies()
+    if anomalies_df is not None and not anomalies_df.empty:
+        anomalies_df = narrate(anomalies_df)
+        save_anomalies(anomalies_df)
+        store_anomalies(anomalies_df)
+
+
+def report_command(args):
+    """Renders PDF reports for the anomalies of the last detection."""
+    anomalies_df = load_anomalies()
+    if anomalies_df is not None and not anomalies_df.empty:
+        write_pdfs(anomalies_df)
+
+
+def run_command(args):
+    """Runs the whole pipeline."""
+    run_pipeline(args.input, narrate_anomalies=not args.no_narrate, pdfs=not args.no_pdf, stream=args.stream)
+
+
+def serve_command(args):
+    """Runs the ingestion service until interrupted."""
+    from src.service import serve
+    serve(args.input_dir, args.socket_port, write_pdfs=not args.no_pdf)
+
+
+def convert_command(args):
+    """Converts a CSV file to Parquet."""
+    convert_to_parquet(args.file)
+
+
+def _shared_options(suppress_defaults: bool = False) -> tuple:
+    """
+    Builds the parent parsers of the options accepted both before and after a command.
+
+    Args:
+        suppress_defaults (bool): Leave unset options out of the namespace. Used for the command
+                                  copies, so an option given before the command is not
+                                  overwritten by the command's default.
+
+    Returns:
+        tuple: Parsers with --input (and --stream), --no-narrate and --no-pdf.
+    """
+    def default(value):
+        return argparse.SUPPRESS if suppress_defaults else value
+
+    input_options = argparse.ArgumentParser(add_help=False)
+    input_options.add_argument("--input", default=default(INPUT_FILE), help="Transaction file (CSV, Parquet, Feather or Arrow IPC).")
+    input_options.add_argument("--stream", action="store_true", default=default(False), help="Detect in chunks to bound memory; the input must be in time order.")
+    narrate_options = argparse.ArgumentParser(add_help=False)
+    narrate_options.add_argument("--no-narrate", action="store_true", default=default(False), help="Skip LLM narratives.")
+    pdf_options = argparse.ArgumentParser(add_help=False)
+    pdf_options.add_argument("--no-pdf", action="store_true", default=default(False), help="Skip PDF incident reports.")
+    return input_options, narrate_options, pdf_options
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command-line interface; without a command, the whole pipeline runs."""
+    parser = argparse.ArgumentParser(description="Transaction Anomaly Narrator (TAN).", parents=_shared_options())
+    parser.set_defaults(handler=run_command, run_summary=True)
+    input_options, narrate_options, pdf_options = _shared_options(suppress_defaults=True)
+    commands = parser.add_subparsers(title="commands", metavar="command")
+    commands.add_parser(
+        "run", parents=[input_options, narrate_options, pdf_options], help="Detect, narrate and report (the default)."
+    ).set_defaults(handler=run_command)
+    commands.add_parser(
+        "detect", parents=[input_options], help="Detect anomalies and write the summary report without narratives."
+    ).set_defaults(handler=detect_command)
+    commands.add_parser(
+        "narrate", help="Narrate the anomalies of the last detection into the summary report."
+    ).set_defaults(handler=narrate_command)
+    commands.add_parser(
+        "report", help="Render PDF reports for the anomalies of the last detection."
+    ).set_defaults(handler=report_command)
+
+    serve = commands.add_parser("serve", parents=[pdf_options], help="Run the long-running ingestion service.")
+    serve.add_argument("--input-dir", default=SERVICE_INPUT_DIR, help="Directory to watch for transaction files.")
+    serve.add_argument("--socket-port", type=int, help="Read newline-delimited JSON transactions from this localhost port instead.")
+    # The service writes its own summary on shutdown
+    serve.set_defaults(handler=serve_command, run_summary=False)
+
+    convert = commands.add_parser("convert", help="Convert a CSV file to Parquet for faster loading.")
+    convert.add_argument("file", help="CSV file to convert.")
+    convert.set_defaults(handler=convert_command, run_summary=False)
+    return parser
+
+
+def main(argv: list = None):
+    """
+    Command-line entry point of the Transaction Anomaly Narrator.
+
+    Stage timings, counters and peak memory are written to a JSON run summary in the reports
+    directory. Set TAN_PROFILE=cprofile or TAN_PROFILE=pyinstrument to also profile the run.
+    """
+    args = build_parser().parse_args(argv)
+    if not args.run_summary:
+        args.handler(args)
+        return
+
+    metrics.reset()
+    try:
+        with profile_run(REPORTS_DIR):
+            args.handler(args)
+    finally:
+        metrics.write_summary(os.path.join(REPORTS_DIR, RUN_SUMMARY_FILENAME))
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
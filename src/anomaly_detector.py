@@ -1,51 +1,84 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from src.config import (
-    HIGH_VALUE_MULTIPLIER,
-    ODD_HOURS_START,
-    ODD_HOURS_END,
-    VELOCITY_THRESHOLD_COUNT,
-    VELOCITY_WINDOW_MINUTES,
-    DOMESTIC_LOCATIONS
+    DETECTOR_STATE_PATH,
+    DETECTION_MAX_WORKERS,
+    DETECTION_PARTITIONS_PER_WORKER
 )
+from src.metrics import metrics
+from src.rules import RuleEngine, load_rule_engine
+from src.baselines import AccountBaselines
+
+
+def _record_anomaly_counts(mask: np.ndarray, engine: RuleEngine):
+    """Adds the number of rows flagged by each rule, and in total, to the run metrics."""
+    for label, bit in engine.bits.items():
+        metrics.increment(f"anomalies.{label}", int(np.count_nonzero(mask & mask.dtype.type(bit))))
+    metrics.increment("anomalies_total", int(np.count_nonzero(mask)))
+
 
 class AnomalyDetector:
     """
-    Detects anomalies in transaction data based on a set of predefined rules.
+    Detects anomalies in transaction data based on a configurable set of rules.
     """
 
-    def __init__(self, transactions_df: pd.DataFrame):
+    def __init__(
+        self,
+        transactions_df: pd.DataFrame,
+        copy: bool = True,
+        history: pd.DataFrame = None,
+        engine: RuleEngine = None,
+        baselines: AccountBaselines = None,
+        update_baselines: bool = True
+    ):
         """
         Initializes the detector with transaction data.
         
         Args:
             transactions_df (pd.DataFrame): DataFrame containing transaction records.
+            copy (bool): Work on a private copy of the data. Pass False when the caller no longer
+                         needs the frame, to avoid holding two copies in memory; the detector
+                         then adds its result columns to it.
+            history (pd.DataFrame): Optional earlier transactions (the engine's `state_columns`),
+                                    all preceding `transactions_df`. They count towards windowed
+                                    rules but are never flagged themselves.
+            engine (RuleEngine): The rules to apply; defaults to `load_rule_engine()`.
+            baselines (AccountBaselines): Optional learned per-account baselines for the rules
+                                          that use them. Rows are scored against the baselines
+                                          as they were before this frame.
+            update_baselines (bool): Fold this frame into `baselines` after scoring it.
         """
-        self.df = transactions_df.copy()
+        self.df = transactions_df.copy() if copy else transactions_df
+        self.history = history
+        self.engine = engine or load_rule_engine()
+        self.baselines = baselines
+        self.update_baselines = update_baselines
 
-    def _detect_high_value(self) -> pd.Series:
-        """Rule 1: Detects transactions with an unusually high amount."""
-        return self.df['Amount'] > (self.df['AvgDailySpend'] * HIGH_VALUE_MULTIPLIER)
+    def _compute_mask(self) -> np.ndarray:
+        """Applies every rule and packs the results into a bitmask, one bit per rule of the engine."""
+        return self.engine.compute_mask(self.df, self.history, self.baselines)
 
-    def _detect_odd_hours(self) -> pd.Series:
-        """Rule 2: Detects transactions occurring at unusual times."""
-        return self.df['Timestamp'].dt.hour.between(ODD_HOURS_START, ODD_HOURS_END, inclusive='left')
-
-    def _detect_location_mismatch(self) -> pd.Series:
-        """Rule 3: Detects transactions from foreign locations."""
-        return ~self.df['Location'].isin(DOMESTIC_LOCATIONS)
-
-    def _detect_high_velocity(self) -> pd.Series:
-        """Rule 4: Detects a high frequency of transactions in a short time."""
-        # Sort by account and time to ensure correct windowing
-        self.df = self.df.sort_values(by=['AccountID', 'Timestamp'])
+    def flag_anomalies(self) -> pd.DataFrame:
+        """
+        Applies all anomaly detection rules to every transaction.
 
-        # CORRECTED LINE: Added on='Timestamp' to specify the time column for the window
-        velocity_check = self.df.groupby('AccountID').rolling(
-            f'{VELOCITY_WINDOW_MINUTES}min', on='Timestamp'
-        ).count()['TransactionID'] # Counting on a non-time column is more robust
+        Returns:
+            pd.DataFrame: All transactions, with new 'AnomalyMask' (one bit per rule, in the
+                          engine's rule order) and 'AnomalyType' columns. Unflagged rows have
+                          a mask of 0 and the type 'None'.
+        """
+        mask = self._compute_mask()
+        _record_anomaly_counts(mask, self.engine)
+        if self.baselines is not None and self.update_baselines:
+            self.baselines.update(self.df)
 
-        # The result is a MultiIndex Series, we need to align it back to the original df index
-        return velocity_check.reset_index(level=0, drop=True) > VELOCITY_THRESHOLD_COUNT
+        # Decode labels through the engine's lookup table instead of concatenating strings per row
+        self.df['AnomalyMask'] = mask
+        self.df['AnomalyType'] = self.engine.decode(mask)
+        return self.df
 
     def run_detection(self) -> pd.DataFrame:
         """
@@ -53,33 +86,278 @@ class AnomalyDetector:
         
         Returns:
             pd.DataFrame: A DataFrame containing only the anomalous transactions,
-                          with a new 'AnomalyType' column.
+                          with new 'AnomalyMask' (one bit per rule) and 'AnomalyType' columns.
         """
         print("🔍 Running anomaly detection rules...")
-        
-        # Apply each detection rule
-        high_value_flags = self._detect_high_value()
-        odd_hours_flags = self._detect_odd_hours()
-        location_flags = self._detect_location_mismatch()
-        velocity_flags = self._detect_high_velocity()
-
-        # Combine flags into a dictionary
-        anomaly_flags = {
-            "High Value": high_value_flags,
-            "Odd Hour": odd_hours_flags,
-            "Foreign Location": location_flags,
-            "High Velocity": velocity_flags,
-        }
-
-        # Create the 'AnomalyType' column by joining reasons for flagged transactions
-        self.df['AnomalyType'] = 'None'
-        for reason, flags in anomaly_flags.items():
-            self.df.loc[flags, 'AnomalyType'] = self.df.loc[flags, 'AnomalyType'].apply(
-                lambda x: f"{reason}" if x == 'None' else f"{x}, {reason}"
-            )
+        flagged_df = self.flag_anomalies()
 
         # Filter for rows that are flagged as anomalous
-        anomalies_df = self.df[self.df['AnomalyType'] != 'None'].copy()
+        anomalies_df = flagged_df[flagged_df['AnomalyMask'] != 0].copy()
         
         print(f"✅ Detection complete. Found {len(anomalies_df)} anomalous transactions.")
-        return anomalies_df
\ No newline at end of file
+        return anomalies_df
+
+
+def _detect_partition(ipc_path: str, start: int, stop: int, engine: RuleEngine, baselines: AccountBaselines = None) -> np.ndarray:
+    """Worker task: runs the rules on rows [start, stop) of a memory-mapped Arrow IPC file."""
+    import pyarrow as pa
+
+    # Memory-mapped reads are zero-copy: only this partition's pages are touched
+    table = pa.ipc.open_file(pa.memory_map(ipc_path)).read_all()
+    partition_df = table.slice(start, stop - start).to_pandas()
+    return AnomalyDetector(partition_df, copy=False, engine=engine, baselines=baselines)._compute_mask()
+
+
+class ParallelAnomalyDetector(AnomalyDetector):
+    """
+    Runs the detection rules on AccountID hash partitions in a process pool.
+
+    Every rule is either row-local or scoped to one partition of its windowed rules (the
+    account, for velocity), so partitions are independent. The columns read by the rules are
+    written once, grouped by partition, to a memory-mapped Arrow IPC file; each worker maps it,
+    reads only its own rows and sends back just the rule mask, so no DataFrame is pickled in either direction. Masks are scattered back to the
+    original row positions, so results (row order included) are identical to `AnomalyDetector`.
+    """
+
+    def __init__(
+        self,
+        transactions_df: pd.DataFrame,
+        copy: bool = True,
+        max_workers: int = DETECTION_MAX_WORKERS,
+        partitions_per_worker: int = DETECTION_PARTITIONS_PER_WORKER,
+        engine: RuleEngine = None,
+        baselines: AccountBaselines = None,
+        update_baselines: bool = True
+    ):
+        """
+        Initializes the detector with transaction data.
+
+        Args:
+            transactions_df (pd.DataFrame): DataFrame containing transaction records.
+            copy (bool): Work on a private copy of the data; see `AnomalyDetector`.
+            max_workers (int): Worker processes; None uses every core.
+            partitions_per_worker (int): Partitions per worker. More, smaller partitions keep
+                                         workers busy when a few accounts are very large.
+            engine (RuleEngine): The rules to apply; defaults to `load_rule_engine()`.
+            baselines (AccountBaselines): Optional learned per-account baselines; each worker
+                                          only receives its partition's accounts.
+            update_baselines (bool): Fold the data into `baselines` after scoring it.
+        """
+        super().__init__(transactions_df, copy=copy, engine=engine, baselines=baselines, update_baselines=update_baselines)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.num_partitions = max(1, self.max_workers * partitions_per_worker)
+
+    def _partition_rows(self, column: str):
+        """
+        Hash-partitions the rows by `column`.
+
+        Returns:
+            tuple: The row order grouping rows by partition (stable, so rows keep their input
+                   order within a partition), and the [start, stop) bounds of every partition
+                   in that order.
+        """
+        hashes = pd.util.hash_pandas_object(self.df[column], index=False).to_numpy()
+        partitions = (hashes % np.uint64(self.num_partitions)).astype(np.int64)
+        order = np.argsort(partitions, kind='stable')
+        bounds = np.searchsorted(partitions[order], np.arange(self.num_partitions + 1))
+        return order, bounds
+
+    def _partition_baselines(self, rows: np.ndarray) -> AccountBaselines:
+        """Returns the baselines of the accounts in `rows`, if the rules use any."""
+        if self.baselines is None or not self.engine.uses_baselines:
+            return None
+        return self.baselines.select(self.df['AccountID'].take(rows))
+
+    def _compute_mask(self) -> np.ndarray:
+        """Computes the rule bitmask partition by partition across the worker processes."""
+        # Windowed rules over different partition columns cannot share one partitioning
+        partition_columns = self.engine.partition_columns or {'AccountID'}
+        if len(self.df) == 0 or self.max_workers == 1 or len(partition_columns) > 1:
+            return super()._compute_mask()
+
+        import pyarrow as pa
+
+        order, bounds = self._partition_rows(partition_columns.pop())
+        columns = [column for column in self.engine.columns if column in self.df.columns]
+        table = pa.Table.from_pandas(self.df[columns].take(order), preserve_index=False)
+        tasks = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        mask = np.empty(len(self.df), dtype=self.engine.mask_dtype)
+        with tempfile.TemporaryDirectory() as workdir:
+            ipc_path = os.path.join(workdir, "partitions.arrow")
+            with pa.OSFile(ipc_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            del table
+
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+                futures = [
+                    executor.submit(_detect_partition, ipc_path, start, stop, self.engine, self._partition_baselines(order[start:stop]))
+                    for start, stop in tasks
+                ]
+                # Merge in partition order, placing each mask at its rows' original positions
+                for (start, stop), future in zip(tasks, futures):
+                    mask[order[start:stop]] = future.result()
+        return mask
+
+
+class StreamingAnomalyDetector:
+    """
+    Runs the detection rules chunk by chunk over a time-ordered transaction stream.
+
+    Row-local rules only need the current chunk. For windowed rules such as velocity, the
+    engine's `state_columns` (account and timestamp) of every transaction that is still inside
+    the longest rule window of the newest timestamp seen so far are carried over as history for
+    the next chunk, so the flags are identical to running `AnomalyDetector` on the whole file
+    while peak memory is bounded by the chunk size.
+    """
+
+    def __init__(self, tail: pd.DataFrame = None, engine: RuleEngine = None, baselines: AccountBaselines = None):
+        """
+        Initializes the stream.
+
+        Args:
+            tail (pd.DataFrame): Optional carried-over state rows from a previous run, to
+                                 resume a stream where it stopped.
+            engine (RuleEngine): The rules to apply; defaults to `load_rule_engine()`.
+            baselines (AccountBaselines): Optional learned per-account baselines, updated after
+                                          every chunk, so each chunk is scored against the
+                                          baselines as of its start.
+        """
+        self.engine = engine or load_rule_engine()
+        self.baselines = baselines
+        self._tail = tail if tail is not None and not tail.empty else None
+        self.rows_processed = 0
+        self.anomalies_found = 0
+
+    @property
+    def history(self) -> pd.DataFrame:
+        """The carried-over state rows, or None for a fresh stream."""
+        return self._tail
+
+    @property
+    def watermark(self):
+        """Timestamp of the newest transaction seen so far, or None for a fresh stream."""
+        return None if self._tail is None else self._tail['Timestamp'].max()
+
+    def process_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Detects anomalies in the next chunk of the stream.
+
+        Args:
+            chunk (pd.DataFrame): Transactions that are not older than any transaction in
+                                  previously processed chunks.
+
+        Returns:
+            pd.DataFrame: The anomalous transactions of this chunk (with 'AnomalyMask' and
+                          'AnomalyType' columns), indexed like `chunk`.
+
+        Raises:
+            ValueError: If the chunk contains a transaction older than the previous chunks.
+        """
+        if chunk.empty:
+            return chunk.assign(AnomalyMask=self.engine.mask_dtype.type(0), AnomalyType='None')
+
+        watermark = self.watermark
+        if watermark is not None and chunk['Timestamp'].min() < watermark:
+            raise ValueError(
+                "Streaming detection requires time-ordered input: a chunk starts at "
+                f"{chunk['Timestamp'].min()}, before the previous chunk ended at {watermark}."
+            )
+
+        flagged = AnomalyDetector(chunk, history=self._tail, engine=self.engine, baselines=self.baselines).flag_anomalies()
+        anomalies_df = flagged[flagged['AnomalyMask'] != 0]
+
+        # Carry over the transactions that can still fall in a later transaction's window
+        # (always including the newest ones, which hold the watermark)
+        keys = chunk[self.engine.state_columns]
+        if self._tail is not None:
+            keys = pd.concat([self._tail, keys], ignore_index=True)
+        window_start = keys['Timestamp'].max() - self.engine.max_window
+        self._tail = keys[keys['Timestamp'] >= window_start].reset_index(drop=True)
+
+        self.rows_processed += len(chunk)
+        self.anomalies_found += len(anomalies_df)
+        return anomalies_df
+
+    def iter_anomalies(self, chunks):
+        """
+        Processes an iterable of chunks, yielding the anomalies found in each one.
+
+        Args:
+            chunks: Iterable of transaction DataFrames, e.g. from `load_transactions_in_chunks`.
+
+        Yields:
+            pd.DataFrame: The anomalous transactions of each chunk.
+        """
+        for chunk in chunks:
+            yield self.process_chunk(chunk)
+
+    def run_detection(self, chunks) -> pd.DataFrame:
+        """
+        Processes every chunk and returns all anomalies found in the stream.
+
+        Returns:
+            pd.DataFrame: The anomalous transactions, in stream order.
+        """
+        print("🔍 Running streaming anomaly detection rules...")
+        anomaly_chunks = list(self.iter_anomalies(chunks))
+        anomalies_df = pd.concat(anomaly_chunks) if anomaly_chunks else pd.DataFrame()
+        print(f"✅ Detection complete. Scanned {self.rows_processed} transactions, found {self.anomalies_found} anomalous transactions.")
+        return anomalies_df
+
+
+class IncrementalAnomalyDetector(StreamingAnomalyDetector):
+    """
+    Detects anomalies in successive batches (e.g. hourly files) across separate runs.
+
+    The carried-over window state is persisted to a local Parquet file after every
+    batch, so a velocity burst spanning two files is flagged exactly as a full recompute over
+    the concatenated history would flag it, while each run only reads the new batch.
+    """
+
+    def __init__(self, state_path: str = DETECTOR_STATE_PATH, engine: RuleEngine = None, baselines: AccountBaselines = None):
+        """
+        Loads the persisted state, if any.
+
+        Args:
+            state_path (str): Location of the Parquet state file.
+            engine (RuleEngine): The rules to apply; defaults to `load_rule_engine()`.
+            baselines (AccountBaselines): Optional learned per-account baselines; saving them
+                                          is left to the caller.
+        """
+        self.state_path = state_path
+        tail = pd.read_parquet(state_path) if os.path.exists(state_path) else None
+        super().__init__(tail, engine, baselines)
+
+    def process_batch(self, batch_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Detects anomalies in a new batch and persists the updated state.
+
+        Args:
+            batch_df (pd.DataFrame): Transactions not older than any previously processed batch.
+
+        Returns:
+            pd.DataFrame: The anomalous transactions of the batch.
+        """
+        print(f"🔍 Running incremental anomaly detection on {len(batch_df)} new transactions...")
+        anomalies_df = self.process_chunk(batch_df)
+        self.save_state()
+        print(f"✅ Detection complete. Found {len(anomalies_df)} anomalous transactions.")
+        return anomalies_df
+
+    def save_state(self):
+        """Writes the carried-over transactions to the state file."""
+        if self._tail is None:
+            return
+        directory = os.path.dirname(self.state_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Plain strings keep the file independent of any batch's category set
+        categorical = {col: str for col, dtype in self._tail.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)}
+        self._tail.astype(categorical).to_parquet(self.state_path, index=False)
+
+    def reset_state(self):
+        """Forgets all carried-over transactions and deletes the state file."""
+        self._tail = None
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
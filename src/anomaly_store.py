@@ -0,0 +1,258 @@
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from src.config import (
+    ANOMALY_STORE_PATH,
+    ANOMALY_STORE_PAGE_SIZE,
+    NARRATION_SKIPPED
+)
+from src.metrics import metrics
+
+# Stored anomaly columns, in the order returned by `query`.
+STORE_COLUMNS = [
+    'TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Merchant', 'TransactionType',
+    'Location', 'AnomalyType', 'Narrative'
+]
+
+# Timestamps are stored as UTC text in this format, so text order is time order.
+STORE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Separator between anomaly labels in an 'AnomalyType' value.
+LABEL_SEPARATOR = ", "
+
+
+def _to_utc_text(timestamps: pd.Series) -> pd.Series:
+    """Formats timestamps as sortable UTC text; naive timestamps are taken to be UTC."""
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert("UTC")
+    return timestamps.dt.strftime(STORE_TIMESTAMP_FORMAT)
+
+
+def _timestamp_bound(value) -> str:
+    """Formats a query bound (date, datetime or string) like the stored timestamps."""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC")
+    return timestamp.strftime(STORE_TIMESTAMP_FORMAT)
+
+
+def _match_expression(text: str) -> str:
+    """Quotes every search term, so user input never reaches FTS5 as query syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+class AnomalyStore:
+    """
+    Local SQLite store of detected anomalies and their narratives, kept across runs.
+
+    Anomalies are indexed by account and time, by anomaly label and by amount, and narratives
+    are indexed for full-text search (FTS5), so `query` returns one page of any filtered view
+    without loading the history into memory. Pages are ordered newest first and use keyset
+    pagination: pass the `cursor` of a page to get the next one, which costs the same on the
+    first page and after months of history.
+    """
+
+    def __init__(self, path: str = ANOMALY_STORE_PATH):
+        """
+        Opens (or creates) the store.
+
+        Args:
+            path (str): Location of the SQLite file.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS anomalies (
+                TransactionID TEXT PRIMARY KEY,
+                AccountID TEXT,
+                Timestamp TEXT NOT NULL,
+                Amount REAL,
+                Merchant TEXT,
+                TransactionType TEXT,
+                Location TEXT,
+                AnomalyType TEXT,
+                Narrative TEXT,
+                stored_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_anomalies_time ON anomalies (Timestamp, TransactionID);
+            CREATE INDEX IF NOT EXISTS idx_anomalies_account ON anomalies (AccountID, Timestamp);
+            CREATE INDEX IF NOT EXISTS idx_anomalies_amount ON anomalies (Amount);
+
+            -- One row per label of a combined 'AnomalyType', so single labels are indexed too
+            CREATE TABLE IF NOT EXISTS anomaly_labels (
+                Label TEXT NOT NULL,
+                TransactionID TEXT NOT NULL,
+                PRIMARY KEY (Label, TransactionID)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_anomaly_labels_transaction ON anomaly_labels (TransactionID);
+
+            -- Full-text index over the narratives, kept in sync by `add` (row-level triggers
+            -- make bulk writes several times slower)
+            CREATE VIRTUAL TABLE IF NOT EXISTS anomalies_fts USING fts5(
+                Narrative, content='anomalies', content_rowid='rowid'
+            );
+
+            CREATE TEMP TABLE IF NOT EXISTS incoming (TransactionID TEXT PRIMARY KEY);
+            """
+        )
+        self._conn.commit()
+
+    def add(self, anomalies_df: pd.DataFrame) -> int:
+        """
+        Inserts or updates anomalies, keyed on TransactionID.
+
+        A missing or skipped narrative never replaces a stored one, so re-running detection
+        alone keeps the narratives of earlier runs.
+
+        Args:
+            anomalies_df (pd.DataFrame): Anomalies with at least TransactionID, Timestamp and
+                                         AnomalyType; other store columns may be absent.
+
+        Returns:
+            int: Number of rows written.
+        """
+        if anomalies_df.empty:
+            return 0
+        rows = pd.DataFrame({
+            column: anomalies_df[column] if column in anomalies_df.columns else None
+            for column in STORE_COLUMNS
+        })
+        rows = rows.astype({column: object for column in STORE_COLUMNS if column not in ('Amount', 'Timestamp')})
+        rows['TransactionID'] = rows['TransactionID'].astype(str)
+        rows['Timestamp'] = _to_utc_text(rows['Timestamp'])
+        rows['Narrative'] = rows['Narrative'].where(rows['Narrative'] != NARRATION_SKIPPED)
+        rows = rows.astype(object).where(rows.notna(), None)
+        now = time.time()
+        records = [(*row, now) for row in rows.itertuples(index=False)]
+        labels = [
+            (label, transaction_id)
+            for transaction_id, anomaly_type in zip(rows['TransactionID'], rows['AnomalyType'])
+            for label in str(anomaly_type).split(LABEL_SEPARATOR)
+        ]
+
+        columns = ", ".join(STORE_COLUMNS)
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in STORE_COLUMNS if column not in ('TransactionID', 'Narrative')
+        )
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO incoming (TransactionID) VALUES (?)", ((row[0],) for row in records))
+            # Unindex the narratives about to be replaced, upsert, then index the new ones
+            self._conn.execute(
+                """
+                INSERT INTO anomalies_fts (anomalies_fts, rowid, Narrative)
+                SELECT 'delete', rowid, Narrative FROM anomalies
+                WHERE TransactionID IN (SELECT TransactionID FROM incoming) AND Narrative IS NOT NULL
+                """
+            )
+            self._conn.executemany(
+                f"""
+                INSERT INTO anomalies ({columns}, stored_at) VALUES ({", ".join("?" * (len(STORE_COLUMNS) + 1))})
+                ON CONFLICT (TransactionID) DO UPDATE SET {updates},
+                    Narrative = COALESCE(excluded.Narrative, anomalies.Narrative),
+                    stored_at = excluded.stored_at
+                """,
+                records
+            )
+            self._conn.execute(
+                """
+                INSERT INTO anomalies_fts (rowid, Narrative)
+                SELECT rowid, Narrative FROM anomalies
+                WHERE TransactionID IN (SELECT TransactionID FROM incoming) AND Narrative IS NOT NULL
+                ORDER BY rowid
+                """
+            )
+            self._conn.execute("DELETE FROM anomaly_labels WHERE TransactionID IN (SELECT TransactionID FROM incoming)")
+            self._conn.executemany("INSERT OR IGNORE INTO anomaly_labels (Label, TransactionID) VALUES (?, ?)", labels)
+            self._conn.execute("DELETE FROM incoming")
+            self._conn.commit()
+        metrics.increment("store_rows_written", len(records))
+        return len(records)
+
+    def _where(self, account_id=None, anomaly_type=None, start=None, end=None, min_amount=None, max_amount=None, text=None) -> tuple:
+        """Builds the WHERE clause and parameters shared by `query` and `count`."""
+        clauses, params = [], []
+        if account_id:
+            clauses.append("AccountID = ?")
+            params.append(str(account_id))
+        if anomaly_type:
+            clauses.append("TransactionID IN (SELECT TransactionID FROM anomaly_labels WHERE Label = ?)")
+            params.append(anomaly_type)
+        if start is not None:
+            clauses.append("Timestamp >= ?")
+            params.append(_timestamp_bound(start))
+        if end is not None:
+            clauses.append("Timestamp < ?")
+            params.append(_timestamp_bound(end))
+        if min_amount is not None:
+            clauses.append("Amount >= ?")
+            params.append(float(min_amount))
+        if max_amount is not None:
+            clauses.append("Amount <= ?")
+            params.append(float(max_amount))
+        if text and text.strip():
+            clauses.append("rowid IN (SELECT rowid FROM anomalies_fts WHERE anomalies_fts MATCH ?)")
+            params.append(_match_expression(text))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, page_size: int = ANOMALY_STORE_PAGE_SIZE, cursor: tuple = None, **filters) -> pd.DataFrame:
+        """
+        Returns one page of stored anomalies, newest first.
+
+        Args:
+            page_size (int): Maximum rows returned.
+            cursor (tuple): `page_cursor` of the previous page, or None for the first page.
+            **filters: Any of account_id, anomaly_type (a single label), start and end
+                       (timestamps; end is exclusive), min_amount, max_amount, and text (words
+                       that must all appear in the narrative).
+
+        Returns:
+            pd.DataFrame: Up to `page_size` anomalies with the STORE_COLUMNS.
+        """
+        where, params = self._where(**filters)
+        if cursor is not None:
+            where += (" AND " if where else " WHERE ") + "(Timestamp, TransactionID) < (?, ?)"
+            params += list(cursor)
+        sql = f"SELECT {', '.join(STORE_COLUMNS)} FROM anomalies{where} ORDER BY Timestamp DESC, TransactionID DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + [page_size]).fetchall()
+        page = pd.DataFrame(rows, columns=STORE_COLUMNS)
+        page['Timestamp'] = pd.to_datetime(page['Timestamp'], format=STORE_TIMESTAMP_FORMAT, utc=True)
+        return page
+
+    @staticmethod
+    def page_cursor(page: pd.DataFrame):
+        """Returns the cursor that continues after `page`, or None if it is empty."""
+        if page.empty:
+            return None
+        last = page.iloc[-1]
+        return last['Timestamp'].strftime(STORE_TIMESTAMP_FORMAT), last['TransactionID']
+
+    def count(self, **filters) -> int:
+        """Returns the number of stored anomalies matching the `query` filters."""
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM anomalies{where}", params).fetchone()[0]
+
+    def labels(self) -> list:
+        """Returns every anomaly label in the store, sorted."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT Label FROM anomaly_labels ORDER BY Label")]
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._conn.close()
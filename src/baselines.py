@@ -0,0 +1,298 @@
+import os
+import numpy as np
+import pandas as pd
+from src.config import (
+    BASELINE_STATE_PATH,
+    BASELINE_EWMA_HALFLIFE,
+    BASELINE_MIN_LOCATION_SHARE
+)
+
+# Scale factor turning a median absolute deviation into a standard deviation estimate
+MAD_TO_STD = 1.4826
+
+HOURS_PER_DAY = 24
+
+
+def _category_positions(index: pd.Index, values: pd.Series) -> np.ndarray:
+    """Looks up every value in `index` (-1 when absent); categorical values are looked up once per category."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        lookup = np.append(index.get_indexer(values.cat.categories.astype(str)), -1)
+        return lookup[values.cat.codes.to_numpy()]
+    return index.get_indexer(values.astype(str))
+
+
+def _gather(array: np.ndarray, positions: np.ndarray, fill=np.nan) -> np.ndarray:
+    """Returns array[positions] as floats, with `fill` where the position is -1."""
+    out = np.full(len(positions), fill, dtype=float)
+    known = positions >= 0
+    out[known] = array[positions[known]]
+    return out
+
+
+class AccountBaselines:
+    """
+    Learned per-account behaviour: spend level and spread, and usual hours and locations.
+
+    Everything is stored in flat arrays indexed by the account's position in `accounts`:
+
+    - `ewma_mean` / `ewma_var`: exponentially weighted mean and variance of the amount, with a
+      half-life of BASELINE_EWMA_HALFLIFE transactions, so they follow drift.
+    - `median` / `mad`: robust amount centre and spread. They are exact for the first batch of
+      an account and afterwards exponentially blended with each new batch's values.
+    - `hour_share`: exponentially weighted share of transactions per hour of day (accounts x 24).
+    - Usual locations: exponentially weighted share per (account, location), kept sparse.
+    - `count` and `last_seen`: transactions absorbed and the newest timestamp, so re-reading the
+      same file never counts a transaction twice.
+
+    `update` folds a batch in with a handful of grouped reductions over the batch; nothing
+    loops over accounts in Python.
+    """
+
+    # Per-account arrays, saved and loaded together
+    ARRAYS = ('count', 'last_seen', 'ewma_mean', 'ewma_var', 'median', 'mad', 'hour_share')
+
+    def __init__(self, halflife: float = BASELINE_EWMA_HALFLIFE):
+        """
+        Creates an empty store.
+
+        Args:
+            halflife (float): Transactions after which an observation's weight halves.
+        """
+        self.halflife = halflife
+        self.accounts = pd.Index([], dtype=object)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+        self.ewma_mean = np.zeros(0)
+        self.ewma_var = np.zeros(0)
+        self.median = np.zeros(0)
+        self.mad = np.zeros(0)
+        self.hour_share = np.zeros((0, HOURS_PER_DAY), dtype=np.float32)
+        # Sparse location shares: parallel arrays sorted by (account position, location code)
+        self.locations = pd.Index([], dtype=object)
+        self.location_account = np.zeros(0, dtype=np.int64)
+        self.location_code = np.zeros(0, dtype=np.int64)
+        self.location_share = np.zeros(0, dtype=np.float32)
+
+    @property
+    def alpha(self) -> float:
+        """Weight of the newest transaction in the exponentially weighted statistics."""
+        return 1 - 0.5 ** (1 / self.halflife)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def positions(self, accounts: pd.Series) -> np.ndarray:
+        """Returns each account's position in the store, or -1 for unknown accounts."""
+        return _category_positions(self.accounts, accounts)
+
+    # --- Lookups used by the detection rules ---
+
+    def lookup(self, name: str, positions: np.ndarray) -> np.ndarray:
+        """Returns the per-account array `name` for each position (NaN for unknown accounts)."""
+        return _gather(getattr(self, name), positions)
+
+    def hour_shares(self, positions: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Returns the account's share of transactions in each row's hour (NaN when unknown)."""
+        out = np.full(len(positions), np.nan)
+        known = (positions >= 0) & ~np.isnan(hours)
+        out[known] = self.hour_share[positions[known], hours[known].astype(np.int64)]
+        return out
+
+    def location_shares(self, positions: np.ndarray, locations: pd.Series) -> np.ndarray:
+        """Returns the account's share of transactions at each row's location (NaN for unknown accounts)."""
+        out = np.full(len(positions), np.nan)
+        known = positions >= 0
+        out[known] = 0.0
+        codes = _category_positions(self.locations, locations)
+        seen = known & (codes >= 0)
+        if seen.any() and len(self.location_share):
+            keys = self._location_keys(self.location_account, self.location_code)
+            wanted = self._location_keys(positions[seen], codes[seen])
+            found = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            hit = keys[found] == wanted
+            out[np.flatnonzero(seen)[hit]] = self.location_share[found[hit]]
+        return out
+
+    def drift_scores(self) -> pd.Series:
+        """
+        Returns, per account, how far the recent (EWMA) spend level has moved from the robust
+        median, in robust standard deviations. Large values indicate drifting behaviour.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (self.ewma_mean - self.median) / (MAD_TO_STD * self.mad)
+        return pd.Series(scores, index=self.accounts, name='DriftScore')
+
+    def _location_keys(self, account_positions: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return account_positions.astype(np.int64) * max(1, len(self.locations)) + codes
+
+    # --- Maintenance ---
+
+    def _add_accounts(self, accounts: pd.Index):
+        """Appends empty baselines for new accounts."""
+        new = len(accounts)
+        self.accounts = self.accounts.append(accounts)
+        self.count = np.concatenate([self.count, np.zeros(new, dtype=np.int64)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(new, np.iinfo(np.int64).min)])
+        for name in ('ewma_mean', 'ewma_var', 'median', 'mad'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(new, np.nan)]))
+        self.hour_share = np.concatenate([self.hour_share, np.zeros((new, HOURS_PER_DAY), dtype=np.float32)])
+
+    def _add_locations(self, locations: pd.Series) -> np.ndarray:
+        """Extends the location vocabulary and returns each row's location code (-1 if missing)."""
+        names = pd.Index(locations.dropna().astype(str).unique())
+        new = names.difference(self.locations)
+        if len(new):
+            # Appending keeps existing codes valid
+            self.locations = self.locations.append(new)
+        return _category_positions(self.locations, locations)
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Folds a batch of transactions into the baselines.
+
+        Rows at or before their account's `last_seen` timestamp, and rows missing an account,
+        amount or timestamp, are ignored.
+
+        Args:
+            df (pd.DataFrame): Transactions with 'AccountID', 'Timestamp', 'Amount' and,
+                               optionally, 'Location'.
+
+        Returns:
+            int: Number of transactions absorbed.
+        """
+        valid = df['AccountID'].notna() & df['Amount'].notna() & df['Timestamp'].notna()
+        df = df.loc[valid.to_numpy(), [c for c in ('AccountID', 'Timestamp', 'Amount', 'Location') if c in df.columns]]
+        if df.empty:
+            return 0
+
+        new_accounts = pd.Index(df['AccountID'].astype(str).unique()).difference(self.accounts)
+        if len(new_accounts):
+            self._add_accounts(new_accounts)
+        positions = self.positions(df['AccountID'])
+        timestamps = pd.DatetimeIndex(df['Timestamp']).as_unit('ns').asi8
+        fresh = timestamps > self.last_seen[positions]
+        if not fresh.any():
+            return 0
+        df, positions, timestamps = df[fresh], positions[fresh], timestamps[fresh]
+
+        # Sort by (account, time); every statistic below is a grouped weighted sum in this order
+        order = np.lexsort((timestamps, positions))
+        positions, timestamps = positions[order], timestamps[order]
+        amounts = df['Amount'].to_numpy(dtype=float)[order]
+        hours = df['Timestamp'].dt.hour.to_numpy()[order]
+        n_accounts = len(self.accounts)
+
+        sizes = np.bincount(positions, minlength=n_accounts)
+        group_start = np.concatenate([[0], np.cumsum(sizes)])[positions]
+        remaining = group_start + sizes[positions] - 1 - np.arange(len(positions))
+
+        # An exponentially weighted average over a batch of n values x_1..x_n, starting from a
+        # prior p, is (1-a)^n * p + sum_i a * (1-a)^(n-i) * x_i. New accounts use their first
+        # value as the prior, which just adds (1-a)^n to the first value's weight.
+        alpha = self.alpha
+        weights = alpha * (1 - alpha) ** remaining
+        prior = (1 - alpha) ** sizes.astype(float)
+        is_new = self.count == 0
+        first_rows = np.flatnonzero(remaining == sizes[positions] - 1)
+        new_first = first_rows[is_new[positions[first_rows]]]
+        weights[new_first] += prior[positions[new_first]]
+        prior[is_new] = 0.0
+
+        touched = sizes > 0
+        keep = prior[touched]
+        old_mean = np.nan_to_num(self.ewma_mean[touched])
+        old_square = np.nan_to_num(self.ewma_var[touched]) + old_mean ** 2
+        mean = keep * old_mean + np.bincount(positions, weights * amounts, n_accounts)[touched]
+        square = keep * old_square + np.bincount(positions, weights * amounts ** 2, n_accounts)[touched]
+        self.ewma_mean[touched] = mean
+        self.ewma_var[touched] = np.maximum(square - mean ** 2, 0.0)
+
+        hour_weights = np.bincount(positions * HOURS_PER_DAY + hours, weights, n_accounts * HOURS_PER_DAY)
+        self.hour_share[touched] = (
+            keep[:, None] * self.hour_share[touched] + hour_weights.reshape(n_accounts, HOURS_PER_DAY)[touched]
+        ).astype(np.float32)
+
+        # Robust statistics of the batch, blended with the stored ones for known accounts
+        grouped = pd.Series(amounts).groupby(positions)
+        batch_median = grouped.median()
+        batch_mad = pd.Series(np.abs(amounts - batch_median.reindex(positions).to_numpy())).groupby(positions).median()
+        idx = batch_median.index.to_numpy()
+        blend = prior[idx]
+        self.median[idx] = np.where(blend > 0, blend * np.nan_to_num(self.median[idx]) + (1 - blend) * batch_median.to_numpy(), batch_median.to_numpy())
+        self.mad[idx] = np.where(blend > 0, blend * np.nan_to_num(self.mad[idx]) + (1 - blend) * batch_mad.to_numpy(), batch_mad.to_numpy())
+
+        if 'Location' in df.columns:
+            codes = self._add_locations(df['Location'])[order]
+            self._update_locations(positions, codes, weights, prior, touched)
+
+        self.count += sizes
+        last_rows = np.flatnonzero(remaining == 0)
+        self.last_seen[positions[last_rows]] = timestamps[last_rows]
+        return len(positions)
+
+    def _update_locations(self, positions, codes, weights, prior, touched):
+        """Decays the stored location shares of touched accounts and adds the batch's weights."""
+        width = max(1, len(self.locations))
+        stored_keys = self.location_account * width + self.location_code
+        stored_shares = self.location_share * np.where(touched[self.location_account], prior[self.location_account], 1.0)
+        located = codes >= 0
+        batch_keys = positions[located] * width + codes[located]
+
+        keys, inverse = np.unique(np.concatenate([stored_keys, batch_keys]), return_inverse=True)
+        shares = np.bincount(inverse, np.concatenate([stored_shares, weights[located]]), len(keys))
+        # Prune negligible shares so the sparse table stays compact
+        significant = shares >= BASELINE_MIN_LOCATION_SHARE
+        keys, shares = keys[significant], shares[significant]
+        self.location_account = keys // width
+        self.location_code = keys % width
+        self.location_share = shares.astype(np.float32)
+
+    def select(self, accounts: pd.Series) -> "AccountBaselines":
+        """Returns a store holding only the given accounts, e.g. to ship one partition to a worker."""
+        positions = np.unique(self.positions(pd.Series(accounts).dropna()))
+        positions = positions[positions >= 0]
+        subset = AccountBaselines(self.halflife)
+        subset.accounts = self.accounts[positions]
+        for name in self.ARRAYS:
+            setattr(subset, name, getattr(self, name)[positions])
+        subset.locations = self.locations
+        remap = np.full(len(self.accounts), -1, dtype=np.int64)
+        remap[positions] = np.arange(len(positions))
+        kept = remap[self.location_account] >= 0
+        subset.location_account = remap[self.location_account[kept]]
+        subset.location_code = self.location_code[kept]
+        subset.location_share = self.location_share[kept]
+        return subset
+
+    # --- Persistence ---
+
+    def save(self, file_path: str = BASELINE_STATE_PATH):
+        """Writes the store to a compressed NumPy archive."""
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        with open(file_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                halflife=np.float64(self.halflife),
+                accounts=self.accounts.to_numpy(dtype=str),
+                locations=self.locations.to_numpy(dtype=str),
+                location_account=self.location_account,
+                location_code=self.location_code,
+                location_share=self.location_share,
+                **arrays
+            )
+
+    @classmethod
+    def load(cls, file_path: str = BASELINE_STATE_PATH) -> "AccountBaselines":
+        """Reads a store written by `save`; returns an empty store if the file does not exist."""
+        if not os.path.exists(file_path):
+            return cls()
+        with np.load(file_path) as data:
+            baselines = cls(float(data['halflife']))
+            baselines.accounts = pd.Index(data['accounts'].astype(object))
+            baselines.locations = pd.Index(data['locations'].astype(object))
+            for name in cls.ARRAYS + ('location_account', 'location_code', 'location_share'):
+                setattr(baselines, name, data[name])
+        return baselines
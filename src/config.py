@@ -1,14 +1,55 @@
 import os
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from a .env file in the working directory or the project root.
+# python-dotenv is only imported when such a file exists, keeping it off the startup path.
+ENV_FILE_CANDIDATES = (".env", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+for _env_file in ENV_FILE_CANDIDATES:
+    if os.path.exists(_env_file):
+        from dotenv import load_dotenv
+        load_dotenv(_env_file)
+        break
 
 # --- LLM Configuration ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+
+# Narration concurrency: number of parallel LLM requests and the shared request-rate ceiling.
+NARRATIVE_MAX_WORKERS = 8
+NARRATIVE_REQUESTS_PER_MINUTE = 60
+
+# Retries for rate-limit (429) and transient server errors, using exponential backoff with jitter.
+NARRATIVE_MAX_RETRIES = 5
+NARRATIVE_BACKOFF_BASE_SECONDS = 1.0
+NARRATIVE_BACKOFF_MAX_SECONDS = 30.0
+
+# Batch narration: pack several transactions into one prompt that asks for JSON keyed by TransactionID.
+# Batches grow until either limit is reached; missing or malformed answers fall back to single prompts.
+NARRATIVE_BATCH_PROMPTS = True
+NARRATIVE_BATCH_MAX_PROMPT_CHARS = 24_000
+NARRATIVE_BATCH_MAX_SIZE = 25
+
+# Templated narration: anomalies are grouped by signature "<anomaly types> | <location class> | <amount band>"
+# (location class is online, domestic or foreign; amount bands are split at NARRATIVE_AMOUNT_BANDS).
+# Each group of at least NARRATIVE_TEMPLATE_MIN_GROUP anomalies gets one LLM-written template whose
+# placeholders are filled per transaction. Signatures matching a NARRATIVE_BESPOKE_SIGNATURES
+# pattern (fnmatch syntax, e.g. "*High Velocity* | * | *") always get their own narratives.
+NARRATIVE_TEMPLATES = True
+NARRATIVE_TEMPLATE_MIN_GROUP = 3
+NARRATIVE_AMOUNT_BANDS = [100, 1_000, 10_000]
+NARRATIVE_BESPOKE_SIGNATURES = ["* | * | 10000+"]
+
+# Persistent narrative cache, keyed on a hash of the model name and prompt.
+NARRATIVE_CACHE_PATH = "data/cache/narratives.sqlite3"
+NARRATIVE_CACHE_MAX_ENTRIES = 100_000
+NARRATIVE_CACHE_MAX_AGE_DAYS = 30
 
 # --- Anomaly Detection Thresholds ---
 
+# Rules file (JSON, or YAML with PyYAML installed) choosing the rules to run, their labels and
+# per-segment thresholds; see rules.example.json. When it does not exist, the built-in rules run
+# with the defaults below.
+RULES_CONFIG_PATH = os.getenv("TAN_RULES_CONFIG", "rules.json")
+
 # High Value Anomaly: Flag transactions where the amount is > X times the account's average daily spend.
 HIGH_VALUE_MULTIPLIER = 10.0
 
@@ -24,6 +65,99 @@ VELOCITY_WINDOW_MINUTES = 10
 # Any transaction outside this list is considered a foreign mismatch.
 DOMESTIC_LOCATIONS = ["New York", "Chicago", "Miami", "Internet"]
 
+# --- Ingestion Configuration ---
+
+# Input schema: dtype used for monetary columns ("float32" halves their memory at the cost of
+# precision above ~$100k) and the timestamp format passed to pd.to_datetime.
+AMOUNT_DTYPE = "float64"
+TIMESTAMP_FORMAT = "ISO8601"
+
+# Streaming mode (`--stream`) processes a time-ordered input STREAMING_CHUNK_SIZE rows at a time,
+# so peak memory is bounded by the chunk size rather than the file size. It is opt-in, as unsorted
+# files cannot be streamed; in-memory runs on files larger than STREAMING_FILE_SIZE_THRESHOLD_MB
+# print a hint to use it.
+STREAMING_FILE_SIZE_THRESHOLD_MB = 512
+STREAMING_CHUNK_SIZE = 500_000
+
+# Incremental detection: per-account velocity window state persisted between runs.
+DETECTOR_STATE_PATH = "data/state/detector_state.parquet"
+
+# Learned per-account baselines (EWMA and robust amount statistics, usual hours and locations),
+# updated after every detection run. The half-life is in transactions per account; location
+# shares below the minimum are pruned to keep the store compact.
+BASELINES_ENABLED = True
+BASELINE_STATE_PATH = "data/state/account_baselines.npz"
+BASELINE_EWMA_HALFLIFE = 20
+BASELINE_MIN_LOCATION_SHARE = 0.001
+
+# Parallel detection: in-memory inputs with at least this many rows are hash-partitioned by
+# AccountID across worker processes (None = all cores), with several partitions per worker
+# to even out skewed accounts.
+PARALLEL_DETECTION_MIN_ROWS = 2_000_000
+DETECTION_MAX_WORKERS = None
+DETECTION_PARTITIONS_PER_WORKER = 4
+
 # --- Reporting Configuration ---
 REPORTS_DIR = "data/reports"
-CSV_REPORT_FILENAME = "anomaly_report.csv"
\ No newline at end of file
+CSV_REPORT_FILENAME = "anomaly_report.csv"
+
+# Detected anomalies saved by `main.py detect`, read back by the `narrate` and `report` commands.
+DETECTED_ANOMALIES_FILENAME = "detected_anomalies.parquet"
+
+# Narrative recorded when narration is skipped (--no-narrate, or no GEMINI_API_KEY).
+NARRATION_SKIPPED = "Narrative not generated."
+
+# Indexed SQLite store of anomalies and narratives across runs, with full-text search on narratives.
+# The app's history view reads it ANOMALY_STORE_PAGE_SIZE rows at a time.
+ANOMALY_STORE_ENABLED = True
+ANOMALY_STORE_PATH = "data/state/anomalies.sqlite3"
+ANOMALY_STORE_PAGE_SIZE = 50
+
+# Incremental report sink: buffered rows are flushed every REPORT_FLUSH_ROWS rows or
+# REPORT_FLUSH_SECONDS seconds, whichever comes first. A crashed run resumes where its last
+# flush ended. REPORT_COMPRESSION is None, "gzip" or "zstd".
+REPORT_FLUSH_ROWS = 500
+REPORT_FLUSH_SECONDS = 10.0
+REPORT_COMPRESSION = None
+
+# PDF incident reports: worker processes (None = all cores) and records rendered per task.
+PDF_MAX_WORKERS = None
+PDF_CHUNK_SIZE = 50
+
+# Emit one consolidated multi-incident PDF with a table of contents instead of one file per incident.
+PDF_CONSOLIDATED_REPORT = False
+CONSOLIDATED_PDF_FILENAME = "INCIDENTS_CONSOLIDATED.pdf"
+
+# --- Ingestion Service ---
+
+# Long-running service (src/service.py): files dropped into SERVICE_INPUT_DIR (or JSON lines sent
+# to the local socket) are micro-batched through detection, narration and reporting. A batch is
+# closed at SERVICE_BATCH_MAX_ROWS rows or SERVICE_BATCH_MAX_WAIT_SECONDS after its first arrival.
+# At most SERVICE_QUEUE_SIZE arrivals wait in the queue; sources block beyond that (backpressure).
+SERVICE_INPUT_DIR = "data/incoming"
+SERVICE_POLL_SECONDS = 1.0
+SERVICE_QUEUE_SIZE = 16
+SERVICE_BATCH_MAX_ROWS = 50_000
+SERVICE_BATCH_MAX_WAIT_SECONDS = 2.0
+SERVICE_REPORT_FILENAME = "service_report.csv"
+SERVICE_SUMMARY_FILENAME = "service_summary.json"
+# The service report skips TransactionIDs already reported in the last SERVICE_REPORT_DEDUP_BATCHES
+# batches, instead of remembering every ID for the life of the service.
+SERVICE_REPORT_DEDUP_BATCHES = 100
+SERVICE_WRITE_PDFS = True
+
+# End-to-end latency percentiles are computed over the last SERVICE_LATENCY_WINDOW transactions
+# and logged every SERVICE_STATS_INTERVAL_SECONDS; detector state and baselines are saved every
+# SERVICE_STATE_SAVE_SECONDS.
+SERVICE_LATENCY_WINDOW = 100_000
+SERVICE_STATS_INTERVAL_SECONDS = 60
+SERVICE_STATE_SAVE_SECONDS = 60
+
+# --- Instrumentation ---
+
+# Structured JSON summary of stage timings, counters and peak memory, written to REPORTS_DIR.
+RUN_SUMMARY_FILENAME = "run_summary.json"
+MEMORY_SAMPLE_INTERVAL_SECONDS = 0.05
+
+# Set this environment variable to "cprofile" or "pyinstrument" to profile a run.
+PROFILE_ENV_VAR = "TAN_PROFILE"
\ No newline at end of file
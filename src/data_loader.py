@@ -1,19 +1,91 @@
+import io
+import os
 import pandas as pd
+from src.config import AMOUNT_DTYPE, TIMESTAMP_FORMAT
+from src.metrics import metrics
 
-def load_transactions(file_path: str) -> pd.DataFrame:
+# Explicit schema for the transaction feed. Low-cardinality strings load as categoricals,
+# which are far smaller and faster to group and compare than Python-object strings.
+TRANSACTION_DTYPES = {
+    'AccountID': 'category',
+    'Amount': AMOUNT_DTYPE,
+    'Merchant': 'category',
+    'TransactionType': 'category',
+    'Location': 'category',
+    # Nullable, so a blank value in this optional field does not reject the whole file
+    'AccountHistoryDays': 'Int32',
+    'AvgDailySpend': AMOUNT_DTYPE,
+}
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.feather', '.arrow', '.ipc')
+
+
+def _apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Casts the columns present in `df` to the transaction schema and parses timestamps."""
+    dtypes = {col: dtype for col, dtype in TRANSACTION_DTYPES.items() if col in df.columns and df[col].dtype != dtype}
+    if dtypes:
+        df = df.astype(dtypes)
+    if 'Timestamp' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Timestamp']):
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'], format=TIMESTAMP_FORMAT)
+    return df
+
+
+def parquet_cache_path(file_path: str) -> str:
+    """Returns the path of the Parquet copy cached next to a CSV file."""
+    return os.path.splitext(file_path)[0] + '.parquet'
+
+
+def _read_source(source, extension: str, columns: list = None) -> pd.DataFrame:
+    """Reads a path or file-like object in the format given by `extension`, without schema conversion."""
+    if extension in PARQUET_EXTENSIONS:
+        return pd.read_parquet(source, columns=columns)
+    if extension in ARROW_EXTENSIONS:
+        return pd.read_feather(source, columns=columns)
+    return pd.read_csv(source, dtype=TRANSACTION_DTYPES, usecols=columns)
+
+
+def _read_file(file_path: str, columns: list = None) -> pd.DataFrame:
+    """Reads a transaction file in any supported format, without schema conversion."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+        # Prefer an up-to-date Parquet copy created by `convert_to_parquet`
+        cache_path = parquet_cache_path(file_path)
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            return pd.read_parquet(cache_path, columns=columns)
+    return _read_source(file_path, extension, columns)
+
+
+def load_transaction_records(records: list) -> pd.DataFrame:
     """
-    Loads transaction data from a CSV file into a pandas DataFrame.
-    
+    Builds a transaction DataFrame from record dictionaries, e.g. JSON messages from a queue.
+
     Args:
-        file_path (str): The path to the CSV file.
-        
+        records (list): One dictionary per transaction, keyed by column name.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the transaction schema applied.
+    """
+    df = _apply_schema(pd.DataFrame.from_records(records))
+    metrics.increment("rows_in", len(df))
+    return df
+
+
+def load_transactions(file_path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Loads transaction data from a CSV, Parquet, Feather or Arrow IPC file into a pandas DataFrame.
+
+    Args:
+        file_path (str): The path to the transaction file. The format is chosen by extension;
+                         anything else is read as CSV.
+        columns (list): Optional subset of columns to load. Other columns are never parsed.
+
     Returns:
         pd.DataFrame: A DataFrame with transaction data.
     """
     try:
-        df = pd.read_csv(file_path)
-        # Ensure timestamp is in datetime format for calculations
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        df = _apply_schema(_read_file(file_path, columns))
+        metrics.increment("rows_in", len(df))
         print(f"✅ Data loaded successfully from {file_path}. Shape: {df.shape}")
         return df
     except FileNotFoundError:
@@ -21,4 +93,130 @@ def load_transactions(file_path: str) -> pd.DataFrame:
         return None
     except Exception as e:
         print(f"❌ An error occurred while loading the data: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def load_transactions_from_bytes(data: bytes, file_name: str, columns: list = None) -> pd.DataFrame:
+    """
+    Loads transaction data from an in-memory file, e.g. an upload, without touching disk.
+
+    Args:
+        data (bytes): The file contents.
+        file_name (str): Original file name; its extension selects the format.
+        columns (list): Optional subset of columns to load.
+
+    Returns:
+        pd.DataFrame: A DataFrame with transaction data.
+    """
+    try:
+        extension = os.path.splitext(file_name)[1].lower()
+        df = _apply_schema(_read_source(io.BytesIO(data), extension, columns))
+        metrics.increment("rows_in", len(df))
+        print(f"✅ Data loaded successfully from {file_name}. Shape: {df.shape}")
+        return df
+    except Exception as e:
+        print(f"❌ An error occurred while loading the data: {e}")
+        return None
+
+
+def _rechunk(batches, chunksize: int):
+    """Regroups pyarrow record batches into tables of `chunksize` rows."""
+    import pyarrow as pa
+
+    pending, rows = [], 0
+    for batch in batches:
+        while len(batch):
+            take = min(len(batch), chunksize - rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows == chunksize:
+                yield pa.Table.from_batches(pending)
+                pending, rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending)
+
+
+def _iter_columnar_batches(file_path: str, extension: str, chunksize: int, columns: list = None):
+    """Yields the record batches of a Parquet or Arrow IPC file without reading it whole."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if extension in PARQUET_EXTENSIONS:
+        yield from pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=columns)
+        return
+    with pa.memory_map(file_path) as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            yield batch.select(columns) if columns else batch
+
+
+def load_transactions_in_chunks(file_path: str, chunksize: int, columns: list = None):
+    """
+    Streams transaction data from a file in fixed-size chunks.
+
+    CSV files are parsed chunk by chunk, unless an up-to-date Parquet copy created by
+    `convert_to_parquet` exists; Parquet files are read by row group and Arrow IPC files by
+    record batch, memory-mapped.
+
+    Args:
+        file_path (str): The path to the transaction file, in any format `load_transactions`
+                         accepts.
+        chunksize (int): Number of rows per chunk.
+        columns (list): Optional subset of columns to load.
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of transaction data.
+    """
+    if not os.path.exists(file_path):
+        print(f"❌ Error: The file at {file_path} was not found.")
+        return
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+        cache_path = parquet_cache_path(file_path)
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            file_path, extension = cache_path, '.parquet'
+
+    if extension in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+        for table in _rechunk(_iter_columnar_batches(file_path, extension, chunksize, columns), chunksize):
+            chunk = table.to_pandas()
+            metrics.increment("rows_in", len(chunk))
+            yield _apply_schema(chunk)
+        return
+
+    with pd.read_csv(file_path, chunksize=chunksize, dtype=TRANSACTION_DTYPES, usecols=columns) as reader:
+        for chunk in reader:
+            metrics.increment("rows_in", len(chunk))
+            yield _apply_schema(chunk)
+
+
+def convert_to_parquet(file_path: str) -> str:
+    """
+    Converts a CSV file to Parquet, saved next to the source, so later loads skip CSV parsing.
+
+    Args:
+        file_path (str): The path to the CSV file.
+
+    Returns:
+        str: The path of the Parquet file.
+    """
+    df = _apply_schema(pd.read_csv(file_path, dtype=TRANSACTION_DTYPES))
+    cache_path = parquet_cache_path(file_path)
+    df.to_parquet(cache_path, index=False)
+    print(f"📦 Converted {file_path} to {cache_path}. Shape: {df.shape}")
+    return cache_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Transaction data utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Cache a CSV file as Parquet next to the source.")
+    convert_parser.add_argument("file_path", help="Path to the CSV file.")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_to_parquet(args.file_path)
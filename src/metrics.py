@@ -0,0 +1,202 @@
+import json
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from src.config import MEMORY_SAMPLE_INTERVAL_SECONDS, PROFILE_ENV_VAR
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def current_rss_mb():
+    """Returns the current resident set size of this process in MB, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if platform.system() == "Darwin" else peak / 1024
+
+
+class MemorySampler:
+    """Samples RSS on a background thread and keeps the highest value seen while active."""
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class RunMetrics:
+    """
+    Collects stage timings, counters and peak memory for a pipeline run.
+
+    Thread-safe, so counters can be incremented from narration worker threads.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clears all recorded stages and counters and restarts the run clock."""
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1):
+        """Adds `value` to the counter `name`."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Times a block and samples its peak memory. Repeated stages accumulate.
+
+        Example:
+            with metrics.timer("detection"):
+                anomalies_df = detector.run_detection()
+        """
+        start = time.perf_counter()
+        with MemorySampler() as sampler:
+            try:
+                yield
+            finally:
+                seconds = time.perf_counter() - start
+        with self._lock:
+            stats = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "peak_rss_mb": None})
+            stats["seconds"] += seconds
+            stats["calls"] += 1
+            if sampler.peak_mb is not None:
+                stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0.0, sampler.peak_mb)
+
+    def timed(self, stage: str):
+        """Decorator form of `timer`."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self) -> dict:
+        """Returns the run summary as a JSON-serializable dictionary."""
+        with self._lock:
+            stages = {
+                name: {
+                    "seconds": round(stats["seconds"], 4),
+                    "calls": stats["calls"],
+                    "peak_rss_mb": None if stats["peak_rss_mb"] is None else round(stats["peak_rss_mb"], 1),
+                }
+                for name, stats in self.stages.items()
+            }
+            counters = dict(sorted(self.counters.items()))
+        peak = peak_rss_mb()
+        return {
+            "run_started": self.started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": None if peak is None else round(peak, 1),
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_summary(self, file_path: str, extra: dict = None) -> dict:
+        """Writes the run summary, merged with any `extra` sections, as JSON and returns it."""
+        summary = {**self.summary(), **(extra or {})}
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"📈 Run summary saved to: {file_path}")
+        return summary
+
+
+# Process-wide metrics shared by every pipeline stage
+metrics = RunMetrics()
+
+
+@contextmanager
+def profile_run(output_dir: str):
+    """
+    Profiles the enclosed block when the TAN_PROFILE environment variable is set.
+
+    TAN_PROFILE=cprofile writes `profile.prof` (open with snakeviz or pstats);
+    TAN_PROFILE=pyinstrument writes `profile.html` (requires the pyinstrument package).
+    """
+    mode = os.getenv(PROFILE_ENV_VAR, "").strip().lower()
+    if not mode:
+        yield
+        return
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            file_path = os.path.join(output_dir, "profile.prof")
+            profiler.dump_stats(file_path)
+            print(f"🔬 cProfile stats saved to: {file_path}")
+    elif mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠️ pyinstrument is not installed; running without profiling.")
+            yield
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            file_path = os.path.join(output_dir, "profile.html")
+            with open(file_path, "w") as f:
+                f.write(profiler.output_html())
+            print(f"🔬 pyinstrument profile saved to: {file_path}")
+    else:
+        print(f"⚠️ Unknown {PROFILE_ENV_VAR} value '{mode}'; expected 'cprofile' or 'pyinstrument'.")
+        yield
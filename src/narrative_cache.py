@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from src.config import (
+    NARRATIVE_CACHE_PATH,
+    NARRATIVE_CACHE_MAX_ENTRIES,
+    NARRATIVE_CACHE_MAX_AGE_DAYS
+)
+from src.metrics import metrics
+
+class NarrativeCache:
+    """
+    Disk-backed, content-addressed cache of LLM narratives stored in SQLite.
+
+    Entries are keyed on a SHA-256 fingerprint of the model name and the exact prompt, so any
+    change to the transaction data, the prompt template or the model produces a new key.
+    """
+
+    # Number of writes between two eviction sweeps.
+    EVICTION_INTERVAL = 500
+
+    def __init__(
+        self,
+        path: str = NARRATIVE_CACHE_PATH,
+        max_entries: int = NARRATIVE_CACHE_MAX_ENTRIES,
+        max_age_days: float = NARRATIVE_CACHE_MAX_AGE_DAYS
+    ):
+        """
+        Opens (or creates) the cache database.
+
+        Args:
+            path (str): Location of the SQLite file.
+            max_entries (int): Least-recently-used entries beyond this count are evicted.
+            max_age_days (float): Entries created longer ago than this are evicted.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS narratives (
+                key TEXT PRIMARY KEY,
+                narrative TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_narratives_accessed ON narratives (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        """Returns the content-addressed key for a prompt sent to a given model."""
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached narrative for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT narrative FROM narratives WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.increment("narrative_cache_misses")
+                return None
+            self.hits += 1
+            metrics.increment("narrative_cache_hits")
+            self._conn.execute("UPDATE narratives SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, narrative: str):
+        """Stores a narrative, replacing any previous value for the same key."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO narratives (key, narrative, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, narrative, now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            evict_now = self._writes % self.EVICTION_INTERVAL == 0
+        if evict_now:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes entries older than `max_age_days`, then the least recently used entries
+        beyond `max_entries`.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM narratives WHERE created_at < ?", (cutoff,)).rowcount
+            removed += self._conn.execute(
+                """
+                DELETE FROM narratives WHERE key IN (
+                    SELECT key FROM narratives ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM narratives").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current number of entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -1,19 +1,135 @@
-import google.generativeai as genai
-from src.config import GEMINI_API_KEY
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.config import (
+    GEMINI_API_KEY,
+    GEMINI_MODEL_NAME,
+    NARRATIVE_MAX_WORKERS,
+    NARRATIVE_REQUESTS_PER_MINUTE,
+    NARRATIVE_MAX_RETRIES,
+    NARRATIVE_BACKOFF_BASE_SECONDS,
+    NARRATIVE_BACKOFF_MAX_SECONDS,
+    NARRATIVE_BATCH_MAX_PROMPT_CHARS,
+    NARRATIVE_BATCH_MAX_SIZE,
+    NARRATIVE_TEMPLATE_MIN_GROUP,
+    NARRATIVE_BESPOKE_SIGNATURES
+)
+from src.metrics import metrics
+from src.narrative_templates import format_amount, group_by_signature, create_template_prompt, parse_template, fill_template
+
+FAILED_NARRATIVE = "Narrative generation failed."
+
+# Shared instructions of a batch prompt; one data block per transaction is appended to it.
+BATCH_PROMPT_PREAMBLE = """
+You are a financial fraud analyst assistant. Your task is to write a concise, 2-sentence summary for each transaction below, explaining why it is flagged as anomalous.
+
+**Instructions:**
+1.  Base each summary **exclusively** on the data of that transaction. Do not add any information not present.
+2.  Be factual and direct.
+3.  Mention the key details like amount, location, time, and the specific anomaly reason.
+4.  Respond with only a JSON object mapping each Transaction ID to its summary, e.g. {"TXN1001": "..."}.
+
+**Transactions:**
+"""
+
+# HTTP status codes that indicate a transient failure worth retrying (rate limit, server errors).
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that caps how many LLM requests are issued per minute.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: int = 1):
+        """
+        Args:
+            requests_per_minute (float): Sustained request rate allowed by the bucket.
+            capacity (int): Maximum burst size (tokens that can accumulate while idle).
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Returns True for rate-limit, server-side and connection errors."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'code', None)
+    if status is None:
+        status = getattr(error, 'status_code', None)
+    try:
+        if int(status) in RETRYABLE_STATUS_CODES:
+            return True
+    except (TypeError, ValueError):
+        pass
+    return "429" in str(error)
+
 
 class NarrativeGenerator:
     """
     Generates plain-English narratives for detected anomalies using an LLM.
     """
 
-    def __init__(self):
-        """Initializes the narrative generator and configures the LLM."""
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY is not set. Please check your .env file.")
-        
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        print("✨ Narrative Generator initialized with Gemini Pro.")
+    def __init__(
+        self,
+        model=None,
+        max_workers: int = NARRATIVE_MAX_WORKERS,
+        requests_per_minute: float = NARRATIVE_REQUESTS_PER_MINUTE,
+        max_retries: int = NARRATIVE_MAX_RETRIES,
+        cache=None,
+        template_min_group: int = NARRATIVE_TEMPLATE_MIN_GROUP,
+        bespoke_signatures: list = NARRATIVE_BESPOKE_SIGNATURES
+    ):
+        """
+        Initializes the narrative generator and configures the LLM.
+
+        Args:
+            model: Optional object exposing `generate_content(prompt)`. When omitted, a Gemini
+                   model is configured from GEMINI_API_KEY. Pass a local fake to test without network.
+            max_workers (int): Number of narratives generated concurrently by `generate_narratives`.
+            requests_per_minute (float): Rate limit shared by all workers. Use 0 to disable.
+            max_retries (int): Retries per narrative on rate-limit or transient errors.
+            cache (NarrativeCache): Optional persistent cache consulted before calling the model.
+            template_min_group (int): Smallest signature group narrated from a shared template.
+            bespoke_signatures (list): fnmatch patterns of signatures that are never templated.
+        """
+        if model is None:
+            if not GEMINI_API_KEY:
+                raise ValueError("GEMINI_API_KEY is not set. Please check your .env file.")
+
+            # Imported here, as the SDK takes most of a second to load and detection never needs it
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+            print("✨ Narrative Generator initialized with Gemini Pro.")
+
+        self.model = model
+        self.model_name = getattr(model, 'model_name', GEMINI_MODEL_NAME)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.cache = cache
+        self.template_min_group = template_min_group
+        self.bespoke_signatures = list(bespoke_signatures)
 
     def _create_prompt(self, transaction_details: dict) -> str:
         """Creates a structured, grounded prompt for the LLM."""
@@ -32,13 +148,183 @@ class NarrativeGenerator:
         - Amount: ${transaction_details.get('Amount'):,.2f}
         - Location: {transaction_details.get('Location')}
         - Time: {transaction_details.get('Timestamp').strftime('%H:%M:%S')} on {transaction_details.get('Timestamp').strftime('%Y-%m-%d')}
-        - Account's Average Daily Spend: ${transaction_details.get('AvgDailySpend'):,.2f}
+        - Account's Average Daily Spend: {format_amount(transaction_details.get('AvgDailySpend'))}
         - Detected Anomaly Reasons: {transaction_details.get('AnomalyType')}
         
         Please generate the summary now.
         """
         return prompt
 
+    def _generate_text(self, prompt: str) -> str:
+        """
+        Sends a prompt to the model, honouring the rate limit and retrying transient errors
+        with exponential backoff and full jitter.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            metrics.increment("llm_calls")
+            try:
+                response = self.model.generate_content(prompt)
+                return response.text
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    metrics.increment("llm_errors")
+                    raise
+                metrics.increment("llm_retries")
+                backoff = min(NARRATIVE_BACKOFF_MAX_SECONDS, NARRATIVE_BACKOFF_BASE_SECONDS * 2 ** attempt)
+                time.sleep(random.uniform(0, backoff))
+
+    def _create_batch_entry(self, transaction_details: dict) -> str:
+        """Creates the data block of one transaction inside a batch prompt."""
+        timestamp = transaction_details.get('Timestamp')
+        return (
+            f"- Transaction ID: {transaction_details.get('TransactionID')}\n"
+            f"  Account ID: {transaction_details.get('AccountID')}\n"
+            f"  Amount: ${transaction_details.get('Amount'):,.2f}\n"
+            f"  Location: {transaction_details.get('Location')}\n"
+            f"  Time: {timestamp.strftime('%H:%M:%S')} on {timestamp.strftime('%Y-%m-%d')}\n"
+            f"  Account's Average Daily Spend: {format_amount(transaction_details.get('AvgDailySpend'))}\n"
+            f"  Detected Anomaly Reasons: {transaction_details.get('AnomalyType')}\n"
+        )
+
+    def _plan_batches(self, entries: list) -> list:
+        """
+        Greedily packs (position, record, entry) tuples into batches that stay within
+        NARRATIVE_BATCH_MAX_PROMPT_CHARS and NARRATIVE_BATCH_MAX_SIZE.
+        """
+        batches = []
+        current, current_chars = [], len(BATCH_PROMPT_PREAMBLE)
+        for entry in entries:
+            entry_chars = len(entry[2])
+            if current and (current_chars + entry_chars > NARRATIVE_BATCH_MAX_PROMPT_CHARS or len(current) >= NARRATIVE_BATCH_MAX_SIZE):
+                batches.append(current)
+                current, current_chars = [], len(BATCH_PROMPT_PREAMBLE)
+            current.append(entry)
+            current_chars += entry_chars
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _parse_batch_response(text: str, transaction_ids: set) -> dict:
+        """
+        Extracts the {TransactionID: narrative} object from a batch response.
+
+        Unknown IDs and empty or non-string narratives are dropped, so the caller can fall
+        back to single-transaction prompts for whatever is missing.
+        """
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            return {}
+        try:
+            parsed = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(parsed, dict):
+            return {}
+        return {
+            str(txn_id): narrative.strip().replace("\n", " ")
+            for txn_id, narrative in parsed.items()
+            if str(txn_id) in transaction_ids and isinstance(narrative, str) and narrative.strip()
+        }
+
+    def _cache_key(self, prompt: str) -> str:
+        """Returns the cache key of a prompt sent to this generator's model."""
+        return self.cache.make_key(self.model_name, prompt)
+
+    def _narrate(self, transaction_details: dict, check_cache: bool = True) -> str:
+        """Narrates one transaction with its own prompt, storing the result in the cache."""
+        try:
+            prompt = self._create_prompt(transaction_details)
+            if self.cache is not None and check_cache:
+                cached = self.cache.get(self._cache_key(prompt))
+                if cached is not None:
+                    return cached
+            # Simple cleanup of the response text
+            narrative = self._generate_text(prompt).strip().replace("\n", " ")
+            if self.cache is not None:
+                self.cache.put(self._cache_key(prompt), narrative)
+            return narrative
+        except Exception as e:
+            print(f"❌ Could not generate narrative for Txn {transaction_details.get('TransactionID')}: {e}")
+            metrics.increment("narratives_failed")
+            return FAILED_NARRATIVE
+
+    def _narrate_single(self, position: int, record: dict) -> list:
+        """Narrates one transaction, returning the same (position, narrative) list as a batch."""
+        return [(position, self._narrate(record))]
+
+    def _narrate_batch(self, batch: list) -> list:
+        """
+        Narrates a batch of (position, record, entry) tuples with one prompt.
+
+        Transactions missing from (or malformed in) the response are narrated individually.
+
+        Returns:
+            list: (position, narrative) tuples.
+        """
+        transaction_ids = {str(record.get('TransactionID')) for _, record, _ in batch}
+        metrics.increment("llm_batch_prompts")
+        try:
+            prompt = BATCH_PROMPT_PREAMBLE + "\n".join(entry for _, _, entry in batch)
+            narratives = self._parse_batch_response(self._generate_text(prompt), transaction_ids)
+        except Exception as e:
+            print(f"❌ Batch narration of {len(batch)} transactions failed, falling back to single prompts: {e}")
+            narratives = {}
+
+        results = []
+        for position, record, _ in batch:
+            narrative = narratives.get(str(record.get('TransactionID')))
+            if narrative is None:
+                metrics.increment("llm_batch_fallbacks")
+                narrative = self._narrate(record, check_cache=False)
+            elif self.cache is not None:
+                # Cache under the single-transaction prompt so later runs hit in either mode
+                self.cache.put(self._cache_key(self._create_prompt(record)), narrative)
+            results.append((position, narrative))
+        return results
+
+    def _create_template(self, pattern_signature: str):
+        """Returns the (cached or newly generated) template of a signature, or None if none is usable."""
+        prompt = create_template_prompt(pattern_signature)
+        if self.cache is not None:
+            cached = self.cache.get(self._cache_key(prompt))
+            if cached is not None:
+                return cached
+        metrics.increment("narrative_templates_generated")
+        template = parse_template(self._generate_text(prompt))
+        if template is not None and self.cache is not None:
+            self.cache.put(self._cache_key(prompt), template)
+        return template
+
+    def _narrate_group(self, pattern_signature: str, members: list) -> list:
+        """
+        Narrates (position, record) pairs sharing a signature from one template.
+
+        Returns:
+            list: (position, narrative) tuples. If no usable template could be generated, every
+                  narrative is None, so the caller narrates the members individually; so is
+                  that of any member the template cannot be filled for.
+        """
+        try:
+            template = self._create_template(pattern_signature)
+        except Exception as e:
+            print(f"❌ Template generation for '{pattern_signature}' failed: {e}")
+            template = None
+        if template is None:
+            metrics.increment("narrative_template_fallbacks")
+            return [(position, None) for position, _ in members]
+        results = []
+        for position, record in members:
+            try:
+                results.append((position, fill_template(template, record)))
+            except Exception as e:
+                print(f"❌ Could not fill the template for Txn {record.get('TransactionID')}: {e}")
+                results.append((position, None))
+        metrics.increment("narratives_templated", sum(narrative is not None for _, narrative in results))
+        return results
+
     def generate_narrative(self, transaction_details: dict) -> str:
         """
         Generates a narrative for a single anomalous transaction.
@@ -49,12 +335,93 @@ class NarrativeGenerator:
         Returns:
             str: The generated plain-English narrative.
         """
+        return self._narrate(transaction_details)
+
+    def _submit_individual(self, executor: ThreadPoolExecutor, entries: list, batch_prompts: bool) -> tuple:
+        """
+        Submits (position, record) pairs for narration with their own or batched prompts.
+
+        Returns:
+            tuple: (cached (position, narrative) list, futures of (position, narrative) lists).
+        """
+        if not batch_prompts:
+            return [], [executor.submit(self._narrate_single, position, record) for position, record in entries]
+        cached_results, pending = [], []
+        for position, record in entries:
+            try:
+                cached = self.cache.get(self._cache_key(self._create_prompt(record))) if self.cache is not None else None
+                entry = None if cached is not None else self._create_batch_entry(record)
+            except Exception as e:
+                # A malformed record fails on its own, as with single prompts
+                print(f"❌ Could not generate narrative for Txn {record.get('TransactionID')}: {e}")
+                metrics.increment("narratives_failed")
+                cached_results.append((position, FAILED_NARRATIVE))
+                continue
+            if cached is not None:
+                cached_results.append((position, cached))
+            else:
+                pending.append((position, record, entry))
+        return cached_results, [executor.submit(self._narrate_batch, batch) for batch in self._plan_batches(pending)]
+
+    def iter_narratives(self, records: list, batch_prompts: bool = False, templates: bool = False):
+        """
+        Generates narratives concurrently and yields them as soon as each one completes.
+
+        Closing the generator early cancels every request that has not started yet.
+
+        Args:
+            records (list): Transaction dictionaries, e.g. from `DataFrame.to_dict('records')`.
+            batch_prompts (bool): Pack several transactions into each prompt (sized to stay
+                                  within NARRATIVE_BATCH_MAX_PROMPT_CHARS) instead of sending
+                                  one prompt per transaction.
+            templates (bool): Narrate groups of anomalies sharing a signature from one LLM
+                              template each, filled locally per transaction. Small groups and
+                              bespoke signatures are narrated individually.
+
+        Yields:
+            tuple: (position in `records`, narrative) in completion order.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
         try:
-            prompt = self._create_prompt(transaction_details)
-            response = self.model.generate_content(prompt)
-            # Simple cleanup of the response text
-            narrative = response.text.strip().replace("\n", " ")
-            return narrative
-        except Exception as e:
-            print(f"❌ Could not generate narrative for Txn {transaction_details.get('TransactionID')}: {e}")
-            return "Narrative generation failed."
\ No newline at end of file
+            futures = set()
+            remaining = list(enumerate(records))
+            if templates:
+                groups, remaining = group_by_signature(remaining, self.template_min_group, self.bespoke_signatures)
+                futures.update(executor.submit(self._narrate_group, key, members) for key, members in groups.items())
+            cached, submitted = self._submit_individual(executor, remaining, batch_prompts)
+            futures.update(submitted)
+            yield from cached
+
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fallback = []
+                    for position, narrative in future.result():
+                        if narrative is None:
+                            fallback.append((position, records[position]))
+                        else:
+                            yield position, narrative
+                    if fallback:
+                        # Groups without a usable template are narrated like any other record
+                        cached, submitted = self._submit_individual(executor, fallback, batch_prompts)
+                        futures.update(submitted)
+                        yield from cached
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def generate_narratives(self, records: list, batch_prompts: bool = False, templates: bool = False) -> list:
+        """
+        Generates narratives for many transactions concurrently.
+
+        Args:
+            records (list): Transaction dictionaries, e.g. from `DataFrame.to_dict('records')`.
+            batch_prompts (bool): Pack several transactions into each prompt. See `iter_narratives`.
+            templates (bool): Narrate repeated patterns from shared templates. See `iter_narratives`.
+
+        Returns:
+            list: One narrative per record, in the same order as `records`.
+        """
+        narratives = [FAILED_NARRATIVE] * len(records)
+        for position, narrative in self.iter_narratives(records, batch_prompts, templates):
+            narratives[position] = narrative
+        return narratives
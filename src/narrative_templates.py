@@ -0,0 +1,119 @@
+import fnmatch
+import re
+import pandas as pd
+from src.config import DOMESTIC_LOCATIONS, NARRATIVE_AMOUNT_BANDS
+
+ONLINE_LOCATION = "Internet"
+
+
+def format_amount(value) -> str:
+    """Formats a dollar amount for a narrative; feeds may omit optional amounts such as AvgDailySpend."""
+    return "n/a" if value is None or pd.isna(value) else f"${value:,.2f}"
+
+
+# Placeholders a template may use, and how each one is filled from a transaction record.
+PLACEHOLDERS = {
+    "transaction_id": lambda record: str(record.get('TransactionID')),
+    "account_id": lambda record: str(record.get('AccountID')),
+    "amount": lambda record: format_amount(record.get('Amount')),
+    "location": lambda record: str(record.get('Location')),
+    "time": lambda record: record['Timestamp'].strftime('%H:%M:%S'),
+    "date": lambda record: record['Timestamp'].strftime('%Y-%m-%d'),
+    "avg_daily_spend": lambda record: format_amount(record.get('AvgDailySpend')),
+    "anomaly_type": lambda record: str(record.get('AnomalyType')),
+}
+
+# Templates missing any of these are rejected, as the narrative would omit key details.
+REQUIRED_PLACEHOLDERS = ("amount", "location", "time")
+
+_PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+
+def location_class(location) -> str:
+    """Classifies a location as 'online', 'domestic' or 'foreign'."""
+    if location == ONLINE_LOCATION:
+        return "online"
+    return "domestic" if location in DOMESTIC_LOCATIONS else "foreign"
+
+
+def amount_band(amount, bands: list = NARRATIVE_AMOUNT_BANDS) -> str:
+    """Returns the band of `amount` between the ascending `bands` edges, e.g. '100-1000' or '10000+'."""
+    if amount is None or pd.isna(amount):
+        return "unknown"
+    lower = None
+    for edge in bands:
+        if amount < edge:
+            return f"<{edge}" if lower is None else f"{lower}-{edge}"
+        lower = edge
+    return f"{lower}+"
+
+
+def signature(record: dict) -> str:
+    """Returns the pattern signature of an anomaly: its anomaly types, location class and amount band."""
+    return f"{record.get('AnomalyType')} | {location_class(record.get('Location'))} | {amount_band(record.get('Amount'))}"
+
+
+def group_by_signature(entries: list, min_group: int, bespoke_signatures: list) -> tuple:
+    """
+    Splits (position, record) pairs into templated groups and records narrated individually.
+
+    Args:
+        entries (list): (position, record) pairs.
+        min_group (int): Smallest group worth a template; smaller groups are narrated individually.
+        bespoke_signatures (list): fnmatch patterns; matching signatures are always narrated individually.
+
+    Returns:
+        tuple: ({signature: [(position, record), ...]}, [(position, record), ...] of the rest).
+    """
+    groups = {}
+    for entry in entries:
+        groups.setdefault(signature(entry[1]), []).append(entry)
+
+    templated, bespoke = {}, []
+    for key, members in groups.items():
+        if len(members) < min_group or any(fnmatch.fnmatchcase(key, pattern) for pattern in bespoke_signatures):
+            bespoke.extend(members)
+        else:
+            templated[key] = members
+    bespoke.sort(key=lambda entry: entry[0])
+    return templated, bespoke
+
+
+def create_template_prompt(pattern_signature: str) -> str:
+    """Creates a prompt asking for a narrative template, with placeholders, for one signature."""
+    anomaly_types, location, band = pattern_signature.split(" | ")
+    placeholders = ", ".join("{" + name + "}" for name in PLACEHOLDERS)
+    required = ", ".join("{" + name + "}" for name in REQUIRED_PLACEHOLDERS)
+    return f"""
+    You are a financial fraud analyst assistant. Your task is to write a concise, 2-sentence summary template explaining why a transaction matching the pattern below is flagged as anomalous.
+
+    **Instructions:**
+    1.  Write placeholders in curly braces wherever a transaction-specific value belongs. Available placeholders: {placeholders}. Never write concrete amounts, places, times, dates or IDs.
+    2.  Always include {required}.
+    3.  Base the template **exclusively** on the pattern below. Be factual and direct.
+    4.  Reply with the template text only.
+
+    **Pattern:**
+    - Detected Anomaly Reasons: {anomaly_types}
+    - Location Class: {location}
+    - Amount Band (USD): {band}
+    """
+
+
+def parse_template(text: str):
+    """
+    Cleans an LLM template response.
+
+    Returns:
+        str: The template, or None if it uses unknown placeholders or lacks a required one.
+    """
+    template = text.strip().strip('"').replace("\n", " ")
+    names = set(_PLACEHOLDER_PATTERN.findall(template))
+    if not names <= PLACEHOLDERS.keys() or not set(REQUIRED_PLACEHOLDERS) <= names:
+        return None
+    return template
+
+
+def fill_template(template: str, record: dict) -> str:
+    """Fills a template's placeholders with the values of one transaction."""
+    return _PLACEHOLDER_PATTERN.sub(lambda match: PLACEHOLDERS[match.group(1)](record), template)
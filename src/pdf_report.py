@@ -0,0 +1,199 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from src.config import (
+    REPORTS_DIR,
+    PDF_MAX_WORKERS,
+    PDF_CHUNK_SIZE
+)
+from src.metrics import metrics
+
+# Cursor placement after a cell: continue on the same line, or move to the start of the next one.
+SAME_LINE = {"new_x": XPos.RIGHT, "new_y": YPos.TOP}
+NEXT_LINE = {"new_x": XPos.LMARGIN, "new_y": YPos.NEXT}
+
+REPORT_TITLE = "Transaction Anomaly Incident Report"
+REPORT_FOOTER = "This is an auto-generated report by the Transaction Anomaly Narrator (TAN)."
+
+# Table of contents lines per page in consolidated reports; fixed so the TOC page count is known upfront.
+TOC_LINES_PER_PAGE = 30
+
+# Static layout of the "Transaction Details" table: row label and value formatter.
+DETAIL_FIELDS = (
+    ("Timestamp", lambda data: data['Timestamp'].strftime('%Y-%m-%d %H:%M:%S Z')),
+    ("Amount", lambda data: f"${data['Amount']:,.2f}"),
+    # Feeds may omit descriptive fields; the service does not require them
+    ("Merchant", lambda data: "n/a" if pd.isna(data.get('Merchant')) else str(data['Merchant'])),
+    ("Location", lambda data: "n/a" if pd.isna(data.get('Location')) else str(data['Location'])),
+    ("Account Avg. Daily Spend", lambda data: "n/a" if pd.isna(data.get('AvgDailySpend')) else f"${data['AvgDailySpend']:,.2f}"),
+)
+
+
+class IncidentPDF(FPDF):
+    """FPDF document that draws the static TAN header and footer on every page."""
+
+    def __init__(self):
+        super().__init__()
+        # Keep body text clear of the footer drawn 25mm from the bottom edge
+        self.set_auto_page_break(True, margin=25)
+
+    def header(self):
+        self.set_font("helvetica", 'B', 16)
+        self.cell(0, 10, REPORT_TITLE, align='C', **NEXT_LINE)
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-25)
+        self.set_font("helvetica", 'I', 8)
+        self.cell(0, 10, REPORT_FOOTER, align='C')
+
+    def field(self, label: str, value: str, label_width: float):
+        """Writes one bold label followed by its value on a single line."""
+        self.set_font("helvetica", 'B', 10)
+        self.cell(label_width, 8, label, **SAME_LINE)
+        self.set_font("helvetica", '', 10)
+        self.cell(0, 8, value, **NEXT_LINE)
+
+
+def _render_incident(pdf: IncidentPDF, anomaly_data: dict, generated_at: str):
+    """Writes one incident to `pdf`, starting at the top of the current page."""
+    # --- Metadata ---
+    pdf.field("Report Generated:", generated_at, 50)
+    pdf.field("Transaction ID:", str(anomaly_data['TransactionID']), 50)
+    pdf.field("Account ID:", str(anomaly_data['AccountID']), 50)
+    pdf.ln(5)
+
+    # --- Details Table ---
+    pdf.set_font("helvetica", 'B', 12)
+    pdf.cell(0, 10, "Transaction Details", **NEXT_LINE)
+    for label, formatter in DETAIL_FIELDS:
+        pdf.field(f"{label}:", formatter(anomaly_data), 60)
+    pdf.ln(5)
+
+    # --- Anomaly Analysis ---
+    pdf.set_font("helvetica", 'B', 12)
+    pdf.cell(0, 10, "Anomaly Analysis", **NEXT_LINE)
+
+    pdf.set_font("helvetica", 'B', 10)
+    pdf.cell(60, 8, "Detected Anomaly Types:", **SAME_LINE)
+    pdf.set_font("helvetica", '', 10)
+    pdf.set_text_color(220, 50, 50) # Red color for emphasis
+    pdf.cell(0, 8, str(anomaly_data['AnomalyType']), **NEXT_LINE)
+    pdf.set_text_color(0, 0, 0) # Reset color
+    pdf.ln(5)
+
+    pdf.set_font("helvetica", 'B', 10)
+    pdf.cell(0, 8, "Generated Narrative:", **NEXT_LINE)
+    pdf.set_font("helvetica", '', 10)
+    pdf.multi_cell(0, 6, str(anomaly_data['Narrative']), **NEXT_LINE)
+    pdf.ln(10)
+
+
+def _render_toc(pdf: IncidentPDF, outline: list):
+    """Renders the table of contents of a consolidated report, one linked line per incident."""
+    pdf.set_x(pdf.l_margin)
+    toc_top = pdf.get_y()
+    pdf.set_font("helvetica", 'B', 12)
+    pdf.cell(0, 10, "Table of Contents", **NEXT_LINE)
+    pdf.set_font("helvetica", '', 10)
+    for i, section in enumerate(outline):
+        if i and i % TOC_LINES_PER_PAGE == 0:
+            # Reserved TOC pages already carry the header; continue below it
+            pdf.add_page()
+            pdf.set_y(toc_top)
+        link = pdf.add_link(page=section.page_number)
+        pdf.cell(160, 7, section.name, link=link, **SAME_LINE)
+        pdf.cell(0, 7, str(section.page_number), align='R', link=link, **NEXT_LINE)
+
+
+def _render_report_chunk(records: list) -> list:
+    """Process-pool worker: writes one PDF per record and returns the file paths."""
+    generator = PDFReportGenerator()
+    return [generator._write_report(record) for record in records]
+
+
+class PDFReportGenerator:
+    """Generates detailed PDF reports for anomalies, one file per incident or consolidated."""
+
+    def _write_report(self, anomaly_data: dict) -> str:
+        """Renders one incident to its own PDF file and returns the file path."""
+        pdf = IncidentPDF()
+        pdf.add_page()
+        _render_incident(pdf, anomaly_data, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+        file_path = os.path.join(REPORTS_DIR, f"INCIDENT_{anomaly_data['TransactionID']}.pdf")
+        pdf.output(file_path)
+        return file_path
+
+    def generate_report(self, anomaly_data: dict):
+        """Creates and saves a PDF report for one transaction."""
+        if not os.path.exists(REPORTS_DIR):
+            os.makedirs(REPORTS_DIR)
+
+        self._write_report(anomaly_data)
+        metrics.increment("pdf_reports_written")
+        print(f"📝 PDF report generated for {anomaly_data['TransactionID']}")
+
+    def generate_reports(self, records: list, max_workers: int = PDF_MAX_WORKERS, chunk_size: int = PDF_CHUNK_SIZE) -> list:
+        """
+        Creates one PDF report per transaction, rendering chunks of records in parallel.
+
+        Args:
+            records (list): Anomaly dictionaries, e.g. from `DataFrame.to_dict('records')`.
+            max_workers (int): Number of worker processes. None uses every core; 1 renders inline.
+            chunk_size (int): Records sent to a worker per task.
+
+        Returns:
+            list: Paths of the generated PDF files, in the same order as `records`.
+        """
+        if not os.path.exists(REPORTS_DIR):
+            os.makedirs(REPORTS_DIR)
+
+        chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+        if max_workers == 1 or len(chunks) <= 1:
+            chunk_paths = map(_render_report_chunk, chunks)
+            file_paths = [path for paths in chunk_paths for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                chunk_paths = executor.map(_render_report_chunk, chunks)
+                file_paths = [path for paths in chunk_paths for path in paths]
+
+        metrics.increment("pdf_reports_written", len(file_paths))
+        print(f"📝 {len(file_paths)} PDF reports generated in {REPORTS_DIR}")
+        return file_paths
+
+    def generate_consolidated_report(self, records: list, filename: str) -> str:
+        """
+        Creates a single multi-incident PDF with a linked table of contents.
+
+        Args:
+            records (list): Anomaly dictionaries, e.g. from `DataFrame.to_dict('records')`.
+            filename (str): Name of the PDF file to create in the reports directory.
+
+        Returns:
+            str: Path of the generated PDF file.
+        """
+        if not os.path.exists(REPORTS_DIR):
+            os.makedirs(REPORTS_DIR)
+
+        generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        pdf = IncidentPDF()
+        pdf.add_page()
+        toc_pages = max(1, math.ceil(len(records) / TOC_LINES_PER_PAGE))
+        # The placeholder leaves the cursor at the top of a fresh page for the first incident
+        pdf.insert_toc_placeholder(_render_toc, pages=toc_pages, reset_page_indices=False)
+        for i, anomaly_data in enumerate(records):
+            if i:
+                pdf.add_page()
+            pdf.start_section(f"{anomaly_data['TransactionID']} - {anomaly_data['AnomalyType']}")
+            _render_incident(pdf, anomaly_data, generated_at)
+
+        file_path = os.path.join(REPORTS_DIR, filename)
+        pdf.output(file_path)
+        metrics.increment("pdf_reports_written")
+        print(f"📝 Consolidated PDF report with {len(records)} incidents saved to: {file_path}")
+        return file_path
@@ -1,95 +1,267 @@
+import gzip
+import io
+import json
 import os
+import time
+from collections import deque
 import pandas as pd
-from fpdf import FPDF
-from datetime import datetime
-from src.config import REPORTS_DIR
+from src.config import (
+    REPORTS_DIR,
+    REPORT_FLUSH_ROWS,
+    REPORT_FLUSH_SECONDS,
+    REPORT_COMPRESSION
+)
+from src.metrics import metrics
 
-def create_csv_report(anomalies_df: pd.DataFrame, filename: str):
-    """Saves the final DataFrame of anomalies to a CSV file."""
+# Columns of the summary report, in order.
+REPORT_COLUMNS = ['TransactionID', 'AccountID', 'Timestamp', 'Amount', 'Location', 'AnomalyType', 'Narrative']
+
+# File name suffix added for each report compression.
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+def create_csv_report(anomalies_df: pd.DataFrame, filename: str, append: bool = False):
+    """
+    Saves a DataFrame of anomalies to a CSV file.
+
+    Args:
+        anomalies_df (pd.DataFrame): The rows to write.
+        filename (str): File name inside REPORTS_DIR.
+        append (bool): Add the rows to an existing report instead of replacing it; the header
+                       is only written when the file is new.
+    """
     if not os.path.exists(REPORTS_DIR):
         os.makedirs(REPORTS_DIR)
         
     file_path = os.path.join(REPORTS_DIR, filename)
-    anomalies_df.to_csv(file_path, index=False)
-    print(f"📄 CSV report saved to: {file_path}")
-
-class PDFReportGenerator:
-    """Generates a detailed PDF report for a single anomaly."""
-    
-    def generate_report(self, anomaly_data: dict):
-        """Creates and saves a PDF report for one transaction."""
-        
+    exists = append and os.path.exists(file_path)
+    anomalies_df.to_csv(file_path, index=False, mode='a' if exists else 'w', header=not exists)
+    metrics.increment("csv_rows_written", len(anomalies_df))
+    print(f"📄 CSV report {'updated' if exists else 'saved'}: {file_path}")
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    """Compresses one flush as a self-contained gzip member or zstd frame; concatenations stay readable."""
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zstd":
+        import pyarrow as pa
+        sink = pa.BufferOutputStream()
+        with pa.CompressedOutputStream(sink, "zstd") as stream:
+            stream.write(data)
+        return sink.getvalue().to_pybytes()
+    return data
+
+
+def read_csv_report(file_path: str, compression: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Reads a CSV report written by `ReportSink`, in any of its compressions.
+
+    Args:
+        file_path (str): Path to the report.
+        compression (str): None, "gzip" or "zstd".
+        columns (list): Optional subset of columns to parse.
+
+    Returns:
+        pd.DataFrame: The report rows.
+    """
+    if compression == "zstd":
+        # pandas needs the optional zstandard package for zstd; pyarrow (already required) does not
+        import pyarrow as pa
+        with pa.CompressedInputStream(pa.OSFile(file_path), "zstd") as stream:
+            return pd.read_csv(io.BytesIO(stream.read()), usecols=columns)
+    return pd.read_csv(file_path, compression=compression, usecols=columns)
+
+
+class ReportSink:
+    """
+    Writes the summary report incrementally as narratives complete.
+
+    Rows are buffered and appended to a CSV file, or written as Parquet parts (one row group
+    each) into a directory, whenever `flush_rows` rows are buffered or `flush_seconds` have
+    passed since the last flush (checked on each `write`). CSV flushes are appended as
+    self-contained gzip members or zstd frames when compressed, so the file stays valid.
+
+    While a report is being written, a progress file next to it records how much of the
+    output is complete. If a run crashes, the next sink for the same report resumes: it drops
+    any partly written tail, and silently skips TransactionIDs that are already in the
+    report. A sink that finds no progress file starts a fresh report. Long-lived sinks can
+    bound that check with `dedup_window`, so the set of reported IDs stops growing.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        compression: str = REPORT_COMPRESSION,
+        flush_rows: int = REPORT_FLUSH_ROWS,
+        flush_seconds: float = REPORT_FLUSH_SECONDS,
+        columns: list = REPORT_COLUMNS,
+        resume: bool = True,
+        dedup_window: int = None
+    ):
+        """
+        Opens (or resumes) a report.
+
+        Args:
+            filename (str): File name inside REPORTS_DIR. Names ending in '.parquet' produce a
+                            directory of Parquet parts, anything else CSV. A compression suffix
+                            ('.gz', '.zst') is added to CSV names.
+            compression (str): None, "gzip" or "zstd".
+            flush_rows (int): Buffered rows that trigger a flush.
+            flush_seconds (float): Seconds after which buffered rows are flushed.
+            columns (list): Report columns, in order.
+            resume (bool): Continue an unfinished report instead of starting over.
+            dedup_window (int): Only skip TransactionIDs seen in the last `dedup_window` calls
+                                to `write` (the IDs found on resume count as one call); None
+                                remembers every ID.
+
+        Raises:
+            ValueError: On an unsupported compression.
+        """
+        if compression not in (None, *COMPRESSION_SUFFIXES):
+            raise ValueError(f"Unsupported report compression '{compression}'. Use None, 'gzip' or 'zstd'.")
+        self.compression = compression
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.columns = list(columns)
+        self.parquet = filename.endswith('.parquet')
+        if not self.parquet and compression:
+            filename += COMPRESSION_SUFFIXES[compression]
+        self.path = os.path.join(REPORTS_DIR, filename)
+        self.progress_path = os.path.join(REPORTS_DIR, f".{filename}.progress")
+
+        self.dedup_window = dedup_window
+        self.written_ids = set()
+        self.rows_written = 0
+        self._resumed_rows = 0
+        self._recent_ids = deque()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._parts = 0
+        self._committed_bytes = 0
+
         if not os.path.exists(REPORTS_DIR):
             os.makedirs(REPORTS_DIR)
+        if resume and os.path.exists(self.progress_path):
+            self._resume()
+        else:
+            self._start()
 
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # --- Header ---
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, "Transaction Anomaly Incident Report", 0, 1, 'C')
-        pdf.ln(10)
-        
-        # --- Metadata ---
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(50, 8, "Report Generated:", 0, 0)
-        pdf.set_font("Arial", '', 10)
-        pdf.cell(0, 8, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0, 1)
-
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(50, 8, "Transaction ID:", 0, 0)
-        pdf.set_font("Arial", '', 10)
-        pdf.cell(0, 8, str(anomaly_data['TransactionID']), 0, 1)
-
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(50, 8, "Account ID:", 0, 0)
-        pdf.set_font("Arial", '', 10)
-        pdf.cell(0, 8, str(anomaly_data['AccountID']), 0, 1)
-        pdf.ln(5)
-
-        # --- Details Table ---
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, "Transaction Details", 0, 1)
-        
-        details = {
-            "Timestamp": anomaly_data['Timestamp'].strftime('%Y-%m-%d %H:%M:%S Z'),
-            "Amount": f"${anomaly_data['Amount']:,.2f}",
-            "Merchant": str(anomaly_data['Merchant']),
-            "Location": str(anomaly_data['Location']),
-            "Account Avg. Daily Spend": f"${anomaly_data['AvgDailySpend']:,.2f}",
-        }
-        
-        for key, value in details.items():
-            pdf.set_font("Arial", 'B', 10)
-            pdf.cell(60, 8, f"{key}:", 0, 0)
-            pdf.set_font("Arial", '', 10)
-            pdf.cell(0, 8, value, 0, 1)
-        pdf.ln(5)
-
-        # --- Anomaly Analysis ---
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, "Anomaly Analysis", 0, 1)
-        
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(60, 8, "Detected Anomaly Types:", 0, 0)
-        pdf.set_font("Arial", '', 10)
-        pdf.set_text_color(220, 50, 50) # Red color for emphasis
-        pdf.cell(0, 8, str(anomaly_data['AnomalyType']), 0, 1)
-        pdf.set_text_color(0, 0, 0) # Reset color
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(0, 8, "Generated Narrative:", 0, 1)
-        pdf.set_font("Arial", '', 10)
-        pdf.multi_cell(0, 6, anomaly_data['Narrative'])
-        pdf.ln(10)
-
-        # --- Footer ---
-        pdf.set_y(-25)
-        pdf.set_font("Arial", 'I', 8)
-        pdf.cell(0, 10, "This is an auto-generated report by the Transaction Anomaly Narrator (TAN).", 0, 0, 'C')
-
-        # --- Save File ---
-        file_path = os.path.join(REPORTS_DIR, f"INCIDENT_{anomaly_data['TransactionID']}.pdf")
-        pdf.output(file_path)
-        print(f"📝 PDF report generated for {anomaly_data['TransactionID']}")
\ No newline at end of file
+    def _start(self):
+        """Removes any previous report and marks a new one as in progress."""
+        if self.parquet:
+            os.makedirs(self.path, exist_ok=True)
+            for name in os.listdir(self.path):
+                if name.startswith("part-"):
+                    os.remove(os.path.join(self.path, name))
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self._save_progress()
+
+    def _resume(self):
+        """Drops the partly written tail of a crashed run and loads the IDs already reported."""
+        with open(self.progress_path) as f:
+            progress = json.load(f)
+
+        if self.parquet:
+            # Parts are renamed into place only once complete, so every part is intact; a part
+            # still named '.tmp' was cut off by the crash and is dropped
+            for name in os.listdir(self.path):
+                if name.startswith("part-") and name.endswith(".tmp"):
+                    os.remove(os.path.join(self.path, name))
+            parts = sorted(name for name in os.listdir(self.path) if name.startswith("part-") and name.endswith(".parquet"))
+            self._parts = len(parts)
+            if parts:
+                ids = pd.concat(
+                    pd.read_parquet(os.path.join(self.path, name), columns=['TransactionID'])['TransactionID'] for name in parts
+                )
+                self.written_ids = set(ids.astype(str))
+        else:
+            self._committed_bytes = progress.get("committed_bytes", 0)
+            with open(self.path, 'ab') as f:
+                f.truncate(self._committed_bytes)
+            if self._committed_bytes:
+                ids = read_csv_report(self.path, self.compression, columns=['TransactionID'])['TransactionID']
+                self.written_ids = set(ids.astype(str))
+        self._resumed_rows = len(self.written_ids)
+        self._remember(set(self.written_ids))
+        print(f"↩️ Resuming report {self.path}: {self._resumed_rows} rows already written.")
+
+    def _remember(self, ids: set):
+        """Records the IDs of one write, forgetting those older than the dedup window."""
+        if self.dedup_window is None:
+            return
+        self._recent_ids.append(ids)
+        while len(self._recent_ids) > self.dedup_window:
+            self.written_ids -= self._recent_ids.popleft()
+
+    def _save_progress(self):
+        """Atomically records how much of the report is complete."""
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"committed_bytes": self._committed_bytes, "parts": self._parts}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def write(self, rows):
+        """
+        Buffers report rows, skipping TransactionIDs already written, and flushes when due.
+
+        Args:
+            rows: A DataFrame or a list of record dicts with at least the report columns.
+        """
+        records = rows.to_dict('records') if isinstance(rows, pd.DataFrame) else rows
+        new_ids = set()
+        for record in records:
+            transaction_id = str(record['TransactionID'])
+            if transaction_id in self.written_ids:
+                continue
+            self.written_ids.add(transaction_id)
+            new_ids.add(transaction_id)
+            self._buffer.append({column: record.get(column) for column in self.columns})
+        self._remember(new_ids)
+
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows to the report."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        chunk = pd.DataFrame(self._buffer, columns=self.columns)
+
+        if self.parquet:
+            # Plain strings keep every part's schema identical
+            chunk = chunk.astype({col: str for col, dtype in chunk.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)})
+            part_path = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+            chunk.to_parquet(part_path + ".tmp", index=False, compression=self.compression or "snappy")
+            os.replace(part_path + ".tmp", part_path)
+            self._parts += 1
+        else:
+            data = _compress(chunk.to_csv(index=False, header=self._committed_bytes == 0).encode(), self.compression)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._committed_bytes += len(data)
+
+        self._save_progress()
+        self.rows_written += len(chunk)
+        metrics.increment("report_rows_written", len(chunk))
+        self._buffer = []
+
+    def close(self):
+        """Flushes the remaining rows and marks the report as complete."""
+        self.flush()
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        print(f"📄 Report saved to: {self.path} ({self._resumed_rows + self.rows_written} rows)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Only a clean exit completes the report; after an error the next run resumes it
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
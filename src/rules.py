@@ -0,0 +1,579 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from src.config import (
+    HIGH_VALUE_MULTIPLIER,
+    ODD_HOURS_START,
+    ODD_HOURS_END,
+    VELOCITY_THRESHOLD_COUNT,
+    VELOCITY_WINDOW_MINUTES,
+    DOMESTIC_LOCATIONS,
+    RULES_CONFIG_PATH
+)
+from src.baselines import AccountBaselines, MAD_TO_STD
+
+# Rule classes by the "type" used in rule configuration files
+RULE_REGISTRY = {}
+
+# Rule set used when no rules file exists; every threshold comes from the rule class defaults.
+DEFAULT_RULE_CONFIG = {
+    "rules": [
+        {"type": "high_value"},
+        {"type": "odd_hours"},
+        {"type": "foreign_location"},
+        {"type": "velocity"},
+    ]
+}
+
+
+def register_rule(rule_class):
+    """Class decorator that makes a rule available to configuration files under its `type`."""
+    RULE_REGISTRY[rule_class.type] = rule_class
+    return rule_class
+
+
+class WindowIndex:
+    """
+    A stable sort of rows by (group, time), built once and shared by every windowed rule that
+    partitions by the same column.
+
+    Leading `skip` rows are history: they count towards windows, but `counts` and `valid` only
+    cover the rows after them.
+    """
+
+    def __init__(self, group_codes: np.ndarray, timestamps: np.ndarray, skip: int = 0):
+        """
+        Args:
+            group_codes (np.ndarray): Integer group code per row (e.g. from `pd.factorize`);
+                                      negative codes mark rows without a group.
+            timestamps (np.ndarray): int64 timestamps per row, in any order; NaT (the minimum
+                                     int64) marks rows without a time, which are treated like
+                                     rows without a group.
+            skip (int): Number of leading history rows.
+        """
+        self.size = len(timestamps)
+        self.skip = skip
+        missing_time = timestamps == np.iinfo(np.int64).min
+        if missing_time.any():
+            group_codes = np.where(missing_time, -1, group_codes)
+        self.valid = group_codes[skip:] >= 0
+
+        # Stable sort by (group, time); np.lexsort sorts by its last key first
+        self.order = np.lexsort((timestamps, group_codes))
+        sorted_groups = group_codes[self.order]
+        self.diffs = np.diff(timestamps[self.order])
+        self.new_group = np.empty(self.size, dtype=bool)
+        if self.size:
+            self.new_group[0] = True
+            np.not_equal(sorted_groups[1:], sorted_groups[:-1], out=self.new_group[1:])
+        self.group_starts = np.flatnonzero(self.new_group)
+
+    def counts(self, window) -> np.ndarray:
+        """
+        Counts, for every row, the rows of the same group inside its trailing time window.
+
+        The window of a row at time t is (t - window, t] and, for rows sharing a timestamp, only
+        includes those that come first in the input order. This matches
+        `groupby(group).rolling(window, on=time).count()` on data stably sorted by (group, time).
+
+        Args:
+            window: Window length in the unit of the timestamps; a scalar, or one value per
+                    non-history row (e.g. per-segment thresholds).
+
+        Returns:
+            np.ndarray: int64 in-window counts of the non-history rows, in input order.
+        """
+        n = self.size
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        window = np.asarray(window, dtype=np.int64)
+        cap = int(window.max())
+        if window.ndim:
+            # History rows are never reported, so any window works for them
+            window = np.concatenate([np.full(self.skip, cap, dtype=np.int64), window])[self.order]
+
+        # Map each row to a position on a single increasing axis. Gaps of at least `cap` already
+        # break any window, so capping them at cap + 1 keeps every in-window test intact while
+        # keeping positions small; group boundaries get the same gap so no window spans two groups.
+        gaps = np.empty(n, dtype=np.int64)
+        gaps[0] = 0
+        # Differences involving NaT overflow; they only occur among invalid rows, so clip them
+        # to keep positions increasing
+        np.clip(self.diffs, 0, cap + 1, out=gaps[1:])
+        gaps[self.new_group] = cap + 1
+
+        # Positions are bounded by rows * (cap + 1); process in blocks cut at group boundaries
+        # so the cumulative sum cannot overflow int64 on very large inputs.
+        block_rows = max(1, np.iinfo(np.int64).max // (cap + 1) - 1)
+        window_starts = np.empty(n, dtype=np.int64)
+        start = 0
+        while start < n:
+            stop = min(n, start + block_rows)
+            if stop < n:
+                boundary = self.group_starts[np.searchsorted(self.group_starts, stop, side='right') - 1]
+                stop = boundary if boundary > start else stop
+            block_gaps = gaps[start:stop].copy()
+            block_gaps[0] = 0
+            positions = np.cumsum(block_gaps)
+            block_window = window[start:stop] if window.ndim else window
+            # First row strictly after t - window, i.e. the two-pointer window start
+            window_starts[start:stop] = start + np.searchsorted(positions, positions - block_window, side='right')
+            start = stop
+
+        counts = np.empty(n, dtype=np.int64)
+        counts[self.order] = np.arange(n) - window_starts + 1
+        return counts[self.skip:]
+
+
+def window_counts(group_codes: np.ndarray, timestamps: np.ndarray, window: int) -> np.ndarray:
+    """
+    Counts, for every row, the rows of the same group inside its trailing time window.
+
+    See `WindowIndex.counts`.
+
+    Returns:
+        np.ndarray: int64 in-window counts, aligned with the input row order.
+    """
+    return WindowIndex(group_codes, timestamps).counts(window)
+
+
+class RuleContext:
+    """
+    Column arrays shared by all rules during one evaluation.
+
+    Every input column, derived feature and window sort is computed at most once, however
+    many rules use it, so the row-local rules together make a single pass over the data.
+    """
+
+    def __init__(self, df: pd.DataFrame, history: pd.DataFrame = None, baselines: AccountBaselines = None):
+        self.df = df
+        self.history = history if history is not None and not history.empty else None
+        self.baselines = baselines
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def values(self, column: str) -> np.ndarray:
+        """Returns a column as a NumPy array."""
+        return self._cached(("values", column), lambda: self.df[column].to_numpy())
+
+    def hours(self, column: str = 'Timestamp') -> np.ndarray:
+        """Returns the hour of day of a timestamp column (NaN for missing timestamps)."""
+        return self._cached(("hours", column), lambda: self.df[column].dt.hour.to_numpy(dtype=float, na_value=np.nan))
+
+    def isin(self, column: str, values) -> np.ndarray:
+        """Tests membership per row; categorical columns are tested once per category."""
+        series = self.df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # One lookup per category, then a gather by code; code -1 (missing) maps to False
+            lookup = np.append(series.cat.categories.isin(values), False)
+            return lookup[series.cat.codes.to_numpy()]
+        return series.isin(values).to_numpy()
+
+    def segment_rows(self, column: str, segment) -> np.ndarray:
+        """Returns a boolean array marking the rows whose `column` equals `segment`."""
+        return self._cached(("segment", column, segment), lambda: (self.df[column] == segment).to_numpy(dtype=bool, na_value=False))
+
+    def param(self, rule, name: str):
+        """
+        Resolves a numeric rule parameter for every row.
+
+        Returns:
+            The default value when no segment overrides it, otherwise an array with each row's
+            segment value.
+        """
+        default = rule.values[name]
+        overrides = rule.overrides(name)
+        if not overrides:
+            return default
+        segment = self.df[rule.segment_column]
+        if isinstance(segment.dtype, pd.CategoricalDtype):
+            table = np.array([overrides.get(category, default) for category in segment.cat.categories] + [default], dtype=float)
+            return table[segment.cat.codes.to_numpy()]
+        return segment.map(overrides).fillna(default).to_numpy(dtype=float)
+
+    def _baseline_positions(self) -> np.ndarray:
+        return self._cached(("baseline_positions",), lambda: self.baselines.positions(self.df['AccountID']))
+
+    def baseline(self, name: str) -> np.ndarray:
+        """Returns the per-account baseline `name` for every row (NaN for accounts without one)."""
+        return self._cached(("baseline", name), lambda: self.baselines.lookup(name, self._baseline_positions()))
+
+    def baseline_hour_shares(self) -> np.ndarray:
+        """Returns each account's usual share of transactions in the row's hour of day."""
+        return self.baselines.hour_shares(self._baseline_positions(), self.hours('Timestamp'))
+
+    def baseline_location_shares(self) -> np.ndarray:
+        """Returns each account's usual share of transactions at the row's location."""
+        return self.baselines.location_shares(self._baseline_positions(), self.df['Location'])
+
+    def window_index(self, partition_by: str, time_column: str = 'Timestamp') -> WindowIndex:
+        """Returns the shared (partition, time) sort, with any history rows placed first."""
+        def build():
+            groups = self.df[partition_by]
+            timestamps = pd.DatetimeIndex(self.df[time_column]).as_unit('ns').asi8
+            skip = 0
+            if self.history is not None:
+                # Earlier transactions go first so they precede this frame's rows in every window
+                skip = len(self.history)
+                groups = pd.concat([self.history[partition_by], groups], ignore_index=True)
+                history_timestamps = pd.DatetimeIndex(self.history[time_column]).as_unit('ns').asi8
+                timestamps = np.concatenate([history_timestamps, timestamps])
+            group_codes, _ = pd.factorize(groups)
+            return WindowIndex(group_codes, timestamps, skip)
+        return self._cached(("window", partition_by, time_column), build)
+
+
+class Rule:
+    """
+    Base class for detection rules.
+
+    Subclasses set `type` (the name used in rule files), `label` (the default 'AnomalyType'
+    text), `columns` (the input columns they read) and `params` (default thresholds), and
+    implement `evaluate`. Row-local rules only look at their own row. Windowed rules set
+    `partition_by` and look at earlier rows of the same partition within `window()`. Rules
+    that set `uses_baselines` compare rows with the learned per-account baselines and flag
+    nothing when none are available.
+    """
+
+    type = None
+    label = None
+    columns = ()
+    params = {}
+    partition_by = None
+    uses_baselines = False
+
+    def __init__(self, label: str = None, segment_column: str = None, segments: dict = None, **params):
+        """
+        Args:
+            label (str): 'AnomalyType' text for this rule; defaults to the class label.
+            segment_column (str): Column whose values select per-segment parameters.
+            segments (dict): Parameter overrides per exact `segment_column` value,
+                             e.g. {"ATM": {"multiplier": 5.0}}.
+            **params: Overrides of the default parameters.
+
+        Raises:
+            ValueError: On unknown parameters, or segments without a segment column.
+        """
+        self.label = label or self.label
+        self.segment_column = segment_column
+        self.segments = segments or {}
+        if self.segments and not segment_column:
+            raise ValueError(f"Rule '{self.type}' defines segments but no segment_column.")
+        for overrides in [params, *self.segments.values()]:
+            unknown = set(overrides) - set(self.params)
+            if unknown:
+                raise ValueError(f"Unknown parameters for rule '{self.type}': {sorted(unknown)}")
+        self.values = {**self.params, **params}
+
+    @property
+    def windowed(self) -> bool:
+        return self.partition_by is not None
+
+    @property
+    def input_columns(self) -> list:
+        """Columns read by this rule, including its segment column."""
+        return list(self.columns) + ([self.segment_column] if self.segment_column else [])
+
+    def overrides(self, name: str) -> dict:
+        """Returns {segment: value} for the segments that override parameter `name`."""
+        return {segment: values[name] for segment, values in self.segments.items() if name in values}
+
+    def window(self) -> pd.Timedelta:
+        """Longest look-back of a windowed rule across all segments."""
+        return pd.Timedelta(0)
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        """Returns a boolean array flagging the rows that break the rule."""
+        raise NotImplementedError
+
+
+@register_rule
+class HighValueRule(Rule):
+    """
+    Flags transactions with an amount above a multiple of the account's average daily spend.
+
+    Feeds without an 'AvgDailySpend' column are compared with the account's learned EWMA
+    transaction amount instead.
+    """
+
+    type = "high_value"
+    label = "High Value"
+    columns = ('Amount', 'AvgDailySpend', 'AccountID')
+    params = {"multiplier": HIGH_VALUE_MULTIPLIER}
+    uses_baselines = True
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        if 'AvgDailySpend' in ctx.df.columns:
+            reference = ctx.values('AvgDailySpend')
+        elif ctx.baselines is not None:
+            reference = ctx.baseline('ewma_mean')
+        else:
+            raise ValueError("The high value rule needs an 'AvgDailySpend' column or account baselines.")
+        return ctx.values('Amount') > reference * ctx.param(self, "multiplier")
+
+
+@register_rule
+class OddHoursRule(Rule):
+    """Flags transactions made in [start, end) hours of the day."""
+
+    type = "odd_hours"
+    label = "Odd Hour"
+    columns = ('Timestamp',)
+    params = {"start": ODD_HOURS_START, "end": ODD_HOURS_END}
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        hours = ctx.hours('Timestamp')
+        return (hours >= ctx.param(self, "start")) & (hours < ctx.param(self, "end"))
+
+
+@register_rule
+class ForeignLocationRule(Rule):
+    """Flags transactions made outside the list of domestic locations."""
+
+    type = "foreign_location"
+    label = "Foreign Location"
+    columns = ('Location',)
+    params = {"domestic_locations": DOMESTIC_LOCATIONS}
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        flags = ~ctx.isin('Location', self.values["domestic_locations"])
+        for segment, locations in self.overrides("domestic_locations").items():
+            rows = ctx.segment_rows(self.segment_column, segment)
+            flags[rows] = ~ctx.isin('Location', locations)[rows]
+        return flags
+
+
+@register_rule
+class VelocityRule(Rule):
+    """Flags transactions when an account makes more than `max_count` transactions within the window."""
+
+    type = "velocity"
+    label = "High Velocity"
+    columns = ('AccountID', 'Timestamp')
+    params = {"max_count": VELOCITY_THRESHOLD_COUNT, "window_minutes": VELOCITY_WINDOW_MINUTES}
+    partition_by = 'AccountID'
+
+    def window(self) -> pd.Timedelta:
+        minutes = [self.values["window_minutes"], *self.overrides("window_minutes").values()]
+        return pd.Timedelta(minutes=max(minutes))
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        index = ctx.window_index(self.partition_by, 'Timestamp')
+        window = np.asarray(ctx.param(self, "window_minutes")) * pd.Timedelta(minutes=1).value
+        # Transactions without an account or a timestamp never form a window
+        return (index.counts(window) > ctx.param(self, "max_count")) & index.valid
+
+
+@register_rule
+class AmountZScoreRule(Rule):
+    """
+    Flags amounts far above the account's baseline, in standard deviations.
+
+    The "robust" method uses the median and MAD, which one-off spikes barely move; "ewma"
+    uses the exponentially weighted mean and variance, which follow recent drift.
+    """
+
+    type = "amount_zscore"
+    label = "Unusual Amount"
+    columns = ('AccountID', 'Amount')
+    params = {"threshold": 4.0, "method": "robust", "min_history": 10}
+    uses_baselines = True
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        if ctx.baselines is None:
+            return np.zeros(len(ctx.df), dtype=bool)
+        if self.values["method"] == "robust":
+            centre, spread = ctx.baseline('median'), MAD_TO_STD * ctx.baseline('mad')
+        else:
+            centre, spread = ctx.baseline('ewma_mean'), np.sqrt(ctx.baseline('ewma_var'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (ctx.values('Amount') - centre) / spread
+        return (z > ctx.param(self, "threshold")) & (ctx.baseline('count') >= ctx.param(self, "min_history"))
+
+
+@register_rule
+class UnusualHourRule(Rule):
+    """Flags transactions in an hour of day the account rarely uses."""
+
+    type = "unusual_hour"
+    label = "Unusual Hour"
+    columns = ('AccountID', 'Timestamp')
+    params = {"min_share": 0.02, "min_history": 10}
+    uses_baselines = True
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        if ctx.baselines is None:
+            return np.zeros(len(ctx.df), dtype=bool)
+        return (ctx.baseline_hour_shares() < ctx.param(self, "min_share")) & (ctx.baseline('count') >= ctx.param(self, "min_history"))
+
+
+@register_rule
+class UnusualLocationRule(Rule):
+    """Flags transactions at a location the account rarely uses."""
+
+    type = "unusual_location"
+    label = "Unusual Location"
+    columns = ('AccountID', 'Location')
+    params = {"min_share": 0.02, "min_history": 10}
+    uses_baselines = True
+
+    def evaluate(self, ctx: RuleContext) -> np.ndarray:
+        if ctx.baselines is None:
+            return np.zeros(len(ctx.df), dtype=bool)
+        return (ctx.baseline_location_shares() < ctx.param(self, "min_share")) & (ctx.baseline('count') >= ctx.param(self, "min_history"))
+
+
+def _build_label_table(labels) -> np.ndarray:
+    """Precomputes the 'AnomalyType' label for every combination of rule bits."""
+    table = np.empty(2 ** len(labels), dtype=object)
+    for mask in range(len(table)):
+        reasons = [label for bit, label in enumerate(labels) if mask & (1 << bit)]
+        table[mask] = ", ".join(reasons) if reasons else 'None'
+    return table
+
+
+class RuleEngine:
+    """
+    Evaluates a list of rules and packs their results into a bitmask, one bit per rule in
+    list order.
+
+    Row-local rules share extracted columns and derived features through one RuleContext,
+    and windowed rules that partition by the same column share one sort.
+    """
+
+    # Largest rule set whose label combinations are precomputed
+    MAX_LABEL_TABLE_RULES = 12
+
+    def __init__(self, rules: list):
+        """
+        Args:
+            rules (list): Rule instances, in bit order.
+
+        Raises:
+            ValueError: If there are no rules, more than 64, or duplicate labels.
+        """
+        labels = [rule.label for rule in rules]
+        if not rules or len(rules) > 64:
+            raise ValueError(f"A rule engine needs between 1 and 64 rules, got {len(rules)}.")
+        if len(set(labels)) != len(labels):
+            raise ValueError(f"Rule labels must be unique: {labels}")
+
+        self.rules = list(rules)
+        self.labels = tuple(labels)
+        self.bits = {label: 1 << bit for bit, label in enumerate(labels)}
+        self.mask_dtype = next(np.dtype(t) for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.dtype(t).itemsize * 8 >= len(rules))
+        self._label_table = _build_label_table(labels) if len(labels) <= self.MAX_LABEL_TABLE_RULES else None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RuleEngine":
+        """
+        Builds an engine from a parsed rules file: {"rules": [{"type": ..., **options}, ...]}.
+
+        Raises:
+            ValueError: On an unknown rule type.
+        """
+        rules = []
+        for spec in config["rules"]:
+            spec = dict(spec)
+            rule_type = spec.pop("type")
+            if rule_type not in RULE_REGISTRY:
+                raise ValueError(f"Unknown rule type '{rule_type}'. Available: {sorted(RULE_REGISTRY)}")
+            rules.append(RULE_REGISTRY[rule_type](**spec))
+        return cls(rules)
+
+    @property
+    def columns(self) -> list:
+        """Input columns read by any rule, in first-use order."""
+        return list(dict.fromkeys(column for rule in self.rules for column in rule.input_columns))
+
+    @property
+    def state_columns(self) -> list:
+        """Columns of earlier transactions that windowed rules need as history."""
+        return list(dict.fromkeys(['Timestamp'] + [column for rule in self.rules if rule.windowed for column in rule.columns]))
+
+    @property
+    def partition_columns(self) -> set:
+        """Columns that windowed rules partition by."""
+        return {rule.partition_by for rule in self.rules if rule.windowed}
+
+    @property
+    def max_window(self) -> pd.Timedelta:
+        """Longest look-back of any windowed rule."""
+        return max((rule.window() for rule in self.rules), default=pd.Timedelta(0))
+
+    @property
+    def uses_baselines(self) -> bool:
+        """Whether any rule reads the learned account baselines."""
+        return any(rule.uses_baselines for rule in self.rules)
+
+    def compute_mask(self, df: pd.DataFrame, history: pd.DataFrame = None, baselines: AccountBaselines = None) -> np.ndarray:
+        """
+        Evaluates every rule on `df`.
+
+        Args:
+            df (pd.DataFrame): Transactions with at least `columns`.
+            history (pd.DataFrame): Optional earlier transactions with `state_columns`, all
+                                    preceding `df`. They count towards windows but are never
+                                    flagged themselves.
+            baselines (AccountBaselines): Optional learned per-account baselines.
+
+        Returns:
+            np.ndarray: One bitmask per row, bit i set when rule i fires.
+        """
+        ctx = RuleContext(df, history, baselines)
+        mask = np.zeros(len(df), dtype=self.mask_dtype)
+        # Row-local rules first, then windowed rules grouped by partition so each sort is reused
+        ordered = sorted(enumerate(self.rules), key=lambda item: (item[1].windowed, item[1].partition_by or ''))
+        for bit, rule in ordered:
+            flags = np.asarray(rule.evaluate(ctx), dtype=bool)
+            mask |= flags.astype(self.mask_dtype) << self.mask_dtype.type(bit)
+        return mask
+
+    def decode(self, mask: np.ndarray) -> np.ndarray:
+        """Returns the comma-separated 'AnomalyType' label of every mask ('None' for 0)."""
+        if self._label_table is not None:
+            return self._label_table[mask]
+        unique_masks, inverse = np.unique(mask, return_inverse=True)
+        labels = np.array([
+            ", ".join(label for label, bit in self.bits.items() if int(m) & bit) or 'None'
+            for m in unique_masks
+        ], dtype=object)
+        return labels[inverse]
+
+
+def load_rule_config(file_path: str) -> dict:
+    """
+    Reads a JSON or YAML rules file.
+
+    Raises:
+        ImportError: For a YAML file when PyYAML is not installed.
+    """
+    with open(file_path) as f:
+        if os.path.splitext(file_path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML rule files requires PyYAML (pip install pyyaml); use JSON otherwise.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_rule_engine(file_path: str = RULES_CONFIG_PATH) -> RuleEngine:
+    """
+    Builds the rule engine from a rules file, or from the built-in rules if it does not exist.
+
+    Args:
+        file_path (str): Path to a JSON or YAML rules file.
+
+    Returns:
+        RuleEngine: The configured engine.
+    """
+    if file_path and os.path.exists(file_path):
+        return RuleEngine.from_config(load_rule_config(file_path))
+    return RuleEngine.from_config(DEFAULT_RULE_CONFIG)
@@ -0,0 +1,523 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import signal
+import socketserver
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from src.data_loader import load_transactions, load_transaction_records, PARQUET_EXTENSIONS, ARROW_EXTENSIONS
+from src.anomaly_detector import AnomalyDetector, IncrementalAnomalyDetector
+from src.baselines import AccountBaselines
+from src.rules import load_rule_engine
+from src.narrative_generator import NarrativeGenerator
+from src.narrative_cache import NarrativeCache
+from src.report_generator import ReportSink
+from src.anomaly_store import AnomalyStore
+from src.metrics import metrics
+from src.config import (
+    GEMINI_API_KEY,
+    REPORTS_DIR,
+    NARRATION_SKIPPED,
+    ANOMALY_STORE_ENABLED,
+    NARRATIVE_BATCH_PROMPTS,
+    NARRATIVE_TEMPLATES,
+    BASELINES_ENABLED,
+    BASELINE_STATE_PATH,
+    SERVICE_INPUT_DIR,
+    SERVICE_POLL_SECONDS,
+    SERVICE_QUEUE_SIZE,
+    SERVICE_BATCH_MAX_ROWS,
+    SERVICE_BATCH_MAX_WAIT_SECONDS,
+    SERVICE_REPORT_FILENAME,
+    SERVICE_REPORT_DEDUP_BATCHES,
+    SERVICE_SUMMARY_FILENAME,
+    SERVICE_WRITE_PDFS,
+    SERVICE_LATENCY_WINDOW,
+    SERVICE_STATS_INTERVAL_SECONDS,
+    SERVICE_STATE_SAVE_SECONDS
+)
+
+SUPPORTED_EXTENSIONS = ('.csv',) + PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+# Columns every arrival needs besides those read by the rules: the report and store key on the ID.
+BASE_REQUIRED_COLUMNS = ['TransactionID', 'AccountID', 'Timestamp']
+
+# Rule inputs a feed may omit: without 'AvgDailySpend' the high value rule uses the account baselines.
+OPTIONAL_COLUMNS = ('AvgDailySpend',) if BASELINES_ENABLED else ()
+
+# Seconds a blocked queue operation waits before re-checking for shutdown.
+_WAKE_SECONDS = 0.2
+
+
+def required_columns(engine=None) -> list:
+    """Returns the columns an arrival must have for the rules of `engine` (default: `load_rule_engine()`)."""
+    engine = engine or load_rule_engine()
+    return [column for column in dict.fromkeys(BASE_REQUIRED_COLUMNS + engine.columns) if column not in OPTIONAL_COLUMNS]
+
+
+def missing_columns(present, columns: list) -> list:
+    """Returns the entries of `columns` not in `present` (a DataFrame's columns or a record's keys)."""
+    return [column for column in columns if column not in present]
+
+
+class DirectorySource:
+    """
+    Picks up transaction files dropped into an input directory.
+
+    Files are read oldest first. A file is moved to `processed/` only once its batch has been
+    reported, or to `failed/` if it cannot be read, lacks a required column or its batch
+    fails, so files that were queued when the service stopped are read again on the next start
+    and a bad file never blocks a restart. Names starting with '.' or ending in '.tmp' are
+    ignored, so writers can drop a file atomically by renaming it into place.
+    """
+
+    def __init__(self, input_dir: str = SERVICE_INPUT_DIR, poll_seconds: float = SERVICE_POLL_SECONDS, columns: list = None):
+        """
+        Args:
+            input_dir (str): Directory to watch; created if missing.
+            poll_seconds (float): Seconds between directory scans.
+            columns (list): Columns a file must have; defaults to `required_columns()`.
+        """
+        self.input_dir = input_dir
+        self.poll_seconds = poll_seconds
+        self.columns = columns or required_columns()
+        self.processed_dir = os.path.join(input_dir, "processed")
+        self.failed_dir = os.path.join(input_dir, "failed")
+        for directory in (self.input_dir, self.processed_dir, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _new_files(self) -> list:
+        """Returns the paths of unread files in the input directory, oldest first."""
+        with self._lock:
+            pending = set(self._pending)
+        paths = []
+        for name in os.listdir(self.input_dir):
+            path = os.path.join(self.input_dir, name)
+            if (
+                name.startswith('.') or name.endswith('.tmp') or path in pending
+                or not os.path.isfile(path) or not name.lower().endswith(SUPPORTED_EXTENSIONS)
+            ):
+                continue
+            paths.append(path)
+        return sorted(paths, key=os.path.getmtime)
+
+    def _move(self, path: str, directory: str):
+        """Moves a file out of the input directory."""
+        with self._lock:
+            self._pending.discard(path)
+        shutil.move(path, os.path.join(directory, os.path.basename(path)))
+
+    def _ack(self, path: str, succeeded: bool):
+        """Moves a queued file to `processed/` once its batch is reported, or to `failed/`."""
+        if not succeeded:
+            metrics.increment("service_files_failed")
+        self._move(path, self.processed_dir if succeeded else self.failed_dir)
+
+    def run(self, emit, stop_event: threading.Event):
+        """
+        Scans the directory until `stop_event` is set, emitting one item per file.
+
+        Args:
+            emit: Callable taking `(df, arrived_at, ack)`; blocks while the service is busy and
+                  returns False once it is shutting down. `ack(succeeded)` is called once the
+                  file's batch is reported or has failed.
+            stop_event (threading.Event): Set when the service stops.
+        """
+        while not stop_event.is_set():
+            for path in self._new_files():
+                arrived_at = min(os.path.getmtime(path), time.time())
+                df = load_transactions(path)
+                missing = [] if df is None else missing_columns(df.columns, self.columns)
+                if missing:
+                    print(f"❌ {path} is missing required columns: {', '.join(missing)}")
+                    df = None
+                if df is None or df.empty:
+                    # An empty file has nothing to report
+                    self._ack(path, succeeded=df is not None)
+                    continue
+                with self._lock:
+                    self._pending.add(path)
+                if not emit((df, arrived_at, lambda succeeded, path=path: self._ack(path, succeeded))):
+                    return
+            stop_event.wait(self.poll_seconds)
+
+
+class QueueSource:
+    """
+    Local stand-in for a message queue.
+
+    Producers in the same process call `put`; other processes can send newline-delimited JSON
+    transactions to a TCP socket on localhost. `put` blocks while the queue is full, and a
+    blocked socket connection stops reading, so backpressure reaches the sender. Queued items
+    live in memory only and are lost if the service is killed. Messages missing a required
+    column are rejected, so they never fail a batch of valid ones.
+    """
+
+    # Socket lines grouped into one queued item
+    SOCKET_LINES_PER_ITEM = 1000
+
+    def __init__(self, maxsize: int = SERVICE_QUEUE_SIZE, port: int = None, columns: list = None):
+        """
+        Args:
+            maxsize (int): Queued items before `put` blocks.
+            port (int): Optional localhost TCP port to accept JSON lines on.
+            columns (list): Columns every transaction must have; defaults to `required_columns()`.
+        """
+        self.port = port
+        self.columns = columns or required_columns()
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, transactions, timeout: float = None):
+        """
+        Queues transactions for processing.
+
+        Args:
+            transactions: A DataFrame, or a list of transaction dictionaries.
+            timeout (float): Seconds to wait while the queue is full; None waits indefinitely.
+
+        Raises:
+            ValueError: If the transactions lack a required column.
+            queue.Full: If the queue is still full after `timeout` seconds.
+        """
+        arrived_at = time.time()
+        df = transactions if isinstance(transactions, pd.DataFrame) else load_transaction_records(transactions)
+        missing = missing_columns(df.columns, self.columns)
+        if missing:
+            raise ValueError(f"Transactions are missing required columns: {', '.join(missing)}")
+        self._queue.put((df, arrived_at, None), timeout=timeout)
+
+    def _make_server(self):
+        """Creates the TCP server that feeds socket lines into the queue."""
+        source = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                records = []
+                for line in self.rfile:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        metrics.increment("service_bad_messages")
+                        continue
+                    if not isinstance(record, dict) or missing_columns(record, source.columns):
+                        metrics.increment("service_bad_messages")
+                        continue
+                    records.append(record)
+                    if len(records) >= source.SOCKET_LINES_PER_ITEM:
+                        source.put(records)
+                        records = []
+                if records:
+                    source.put(records)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", self.port), Handler)
+        server.daemon_threads = True
+        return server
+
+    def run(self, emit, stop_event: threading.Event):
+        """
+        Forwards queued items to the service until `stop_event` is set.
+
+        Args:
+            emit: Callable taking `(df, arrived_at, ack)`; returns False once the service is
+                  shutting down.
+            stop_event (threading.Event): Set when the service stops.
+        """
+        server = None
+        if self.port is not None:
+            server = self._make_server()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print(f"🔌 Listening for JSON transactions on 127.0.0.1:{self.port}")
+        try:
+            while not stop_event.is_set():
+                try:
+                    item = self._queue.get(timeout=_WAKE_SECONDS)
+                except queue.Empty:
+                    continue
+                if not emit(item):
+                    return
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+
+class IngestionService:
+    """
+    Long-running service that micro-batches arriving transactions through the pipeline.
+
+    The rule engine, account baselines, detector window state, narrative generator and cache,
+    the report sink and the anomaly store are created once and kept warm across batches. A
+    reader thread moves items from the source into a bounded queue; when the queue is full the
+    source blocks (backpressure). The main loop closes a batch at `batch_max_rows` rows or
+    `batch_max_wait_seconds` after its first arrival, runs detection, narration and reporting,
+    and records the end-to-end latency of every transaction, from arrival to being reported.
+    A batch that raises is logged and counted, and its arrivals are acked as failed, so one bad
+    input never stops the service.
+
+    Rows older than the detector's watermark (e.g. a file delivered late) are still scored,
+    against the carried-over window state, but their windowed counts only see that state.
+    """
+
+    def __init__(
+        self,
+        source,
+        batch_max_rows: int = SERVICE_BATCH_MAX_ROWS,
+        batch_max_wait_seconds: float = SERVICE_BATCH_MAX_WAIT_SECONDS,
+        queue_size: int = SERVICE_QUEUE_SIZE,
+        narrator: NarrativeGenerator = None,
+        write_pdfs: bool = SERVICE_WRITE_PDFS
+    ):
+        """
+        Loads the warm state.
+
+        Args:
+            source: A `DirectorySource`, `QueueSource` or any object with `run(emit, stop_event)`.
+            batch_max_rows (int): Rows that close a batch.
+            batch_max_wait_seconds (float): Seconds after the first arrival that close a batch.
+            queue_size (int): Arrivals waiting to be batched before the source blocks.
+            narrator (NarrativeGenerator): Defaults to a Gemini generator with the persistent
+                                           cache; without GEMINI_API_KEY, narration is skipped.
+            write_pdfs (bool): Render a PDF report per anomaly.
+        """
+        self.source = source
+        self.batch_max_rows = batch_max_rows
+        self.batch_max_wait_seconds = batch_max_wait_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+        self.engine = load_rule_engine()
+        self.baselines = AccountBaselines.load(BASELINE_STATE_PATH) if BASELINES_ENABLED else None
+        self.detector = IncrementalAnomalyDetector(engine=self.engine, baselines=self.baselines)
+        if narrator is None and GEMINI_API_KEY:
+            narrator = NarrativeGenerator(cache=NarrativeCache())
+        elif narrator is None:
+            print("⚠️ GEMINI_API_KEY is not set; anomalies will be reported without narratives.")
+        self.narrator = narrator
+        self.report = ReportSink(SERVICE_REPORT_FILENAME, dedup_window=SERVICE_REPORT_DEDUP_BATCHES)
+        self.store = AnomalyStore() if ANOMALY_STORE_ENABLED else None
+        self.pdf_reporter = None
+        if write_pdfs:
+            from src.pdf_report import PDFReportGenerator
+            self.pdf_reporter = PDFReportGenerator()
+
+        self.latencies = deque(maxlen=SERVICE_LATENCY_WINDOW)
+        self.batches = 0
+        self.batches_failed = 0
+        self.rows = 0
+        self.anomalies = 0
+        self.late_rows = 0
+
+    def _emit(self, item) -> bool:
+        """Queues an arrival, blocking while the queue is full. Returns False once stopping."""
+        waited = False
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=_WAKE_SECONDS)
+                return True
+            except queue.Full:
+                if not waited:
+                    metrics.increment("service_backpressure_waits")
+                    waited = True
+        return False
+
+    def _next_batch(self) -> list:
+        """Collects arrivals until the batch is full or its wait time has passed."""
+        try:
+            items = [self.queue.get(timeout=_WAKE_SECONDS)]
+        except queue.Empty:
+            return []
+        rows = len(items[0][0])
+        deadline = items[0][1] + self.batch_max_wait_seconds
+        while rows < self.batch_max_rows:
+            remaining = deadline - time.time()
+            try:
+                # Once the deadline has passed, only take what is already queued
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    def _detect(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """Runs detection on a time-sorted batch, scoring late rows against the carried-over state."""
+        watermark = self.detector.watermark
+        late = np.zeros(len(batch), dtype=bool) if watermark is None else (batch['Timestamp'] < watermark).to_numpy()
+        found = []
+        if late.any():
+            self.late_rows += int(late.sum())
+            metrics.increment("service_late_rows", int(late.sum()))
+            detector = AnomalyDetector(batch[late], history=self.detector.history, engine=self.engine, baselines=self.baselines)
+            flagged = detector.flag_anomalies()
+            found.append(flagged[flagged['AnomalyMask'] != 0])
+        found.append(self.detector.process_chunk(batch[~late]))
+        return pd.concat(found).sort_index()
+
+    def process(self, items: list):
+        """
+        Runs one micro-batch through detection, narration and reporting.
+
+        Args:
+            items (list): `(df, arrived_at, ack)` arrivals; each `ack` (if any) is called with
+                          True once the batch is reported.
+        """
+        frames = [df for df, _, _ in items]
+        arrivals = np.repeat([arrived_at for _, arrived_at, _ in items], [len(df) for df in frames])
+        batch = pd.concat(frames, ignore_index=True)
+        # Frames with different category sets concatenate as objects; restore the categoricals
+        categorical = {col: 'category' for col, dtype in frames[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)}
+        batch = batch.astype(categorical)
+        order = np.argsort(batch['Timestamp'].to_numpy(), kind='stable')
+        batch = batch.take(order).reset_index(drop=True)
+        arrivals = arrivals[order]
+
+        with metrics.timer("service_detection"):
+            anomalies_df = self._detect(batch)
+
+        records = anomalies_df.to_dict('records')
+        if records and self.narrator is not None:
+            with metrics.timer("service_narration"):
+                for position, narrative in self.narrator.iter_narratives(records, batch_prompts=NARRATIVE_BATCH_PROMPTS, templates=NARRATIVE_TEMPLATES):
+                    records[position]['Narrative'] = narrative
+        else:
+            for record in records:
+                record['Narrative'] = NARRATION_SKIPPED
+        with metrics.timer("service_report"):
+            self.report.write(records)
+            self.report.flush()
+            if records and self.store is not None:
+                self.store.add(pd.DataFrame.from_records(records))
+            if records and self.pdf_reporter is not None:
+                self.pdf_reporter.generate_reports(records)
+
+        for _, _, ack in items:
+            if ack is not None:
+                ack(True)
+        self.latencies.extend(time.time() - arrivals)
+        self.batches += 1
+        self.rows += len(batch)
+        self.anomalies += len(records)
+        metrics.increment("service_batches")
+        metrics.increment("service_rows", len(batch))
+
+    def _fail(self, items: list, error: Exception):
+        """Records a batch that raised, and acks its arrivals as failed so the service carries on."""
+        print(f"❌ Batch of {sum(len(df) for df, _, _ in items)} rows failed: {error!r}")
+        self.batches_failed += 1
+        metrics.increment("service_batches_failed")
+        for _, _, ack in items:
+            if ack is not None:
+                ack(False)
+
+    def stats(self) -> dict:
+        """
+        Returns throughput counters, the queue backlog and end-to-end latency percentiles.
+
+        Returns:
+            dict: Counts, plus `latency_seconds` with p50/p90/p99/max over the most recent
+                  transactions (None before the first batch).
+        """
+        latencies = np.fromiter(self.latencies, dtype=float)
+        latency = None
+        if len(latencies):
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            latency = {name: round(float(value), 4) for name, value in zip(("p50", "p90", "p99", "max"), (p50, p90, p99, latencies.max()))}
+        return {
+            "batches": self.batches,
+            "batches_failed": self.batches_failed,
+            "rows": self.rows,
+            "anomalies": self.anomalies,
+            "late_rows": self.late_rows,
+            "backlog": self.queue.qsize(),
+            "latency_seconds": latency,
+        }
+
+    def log_stats(self):
+        """Prints a one-line status summary."""
+        stats = self.stats()
+        line = f"⏱️ {stats['rows']} rows in {stats['batches']} batches, {stats['anomalies']} anomalies, backlog {stats['backlog']}"
+        if stats['batches_failed']:
+            line += f", {stats['batches_failed']} batches failed"
+        if stats['latency_seconds']:
+            latency = stats['latency_seconds']
+            line += f"; latency p50 {latency['p50']:.2f}s, p90 {latency['p90']:.2f}s, p99 {latency['p99']:.2f}s"
+        print(line)
+
+    def save_state(self):
+        """Persists the detector window state and the account baselines."""
+        self.detector.save_state()
+        if self.baselines is not None:
+            self.baselines.save(BASELINE_STATE_PATH)
+
+    def stop(self):
+        """Asks the service to finish the queued arrivals and exit."""
+        self._stop.set()
+
+    def run(self):
+        """Processes arrivals until `stop` is called, then drains the queue and saves state."""
+        reader = threading.Thread(target=self.source.run, args=(self._emit, self._stop), daemon=True)
+        reader.start()
+        print("🛰️ Ingestion service started. Press Ctrl+C to stop.")
+        last_stats = last_save = time.monotonic()
+        try:
+            while not (self._stop.is_set() and self.queue.empty()):
+                items = self._next_batch()
+                if items:
+                    try:
+                        self.process(items)
+                    except Exception as e:
+                        self._fail(items, e)
+                now = time.monotonic()
+                if now - last_stats >= SERVICE_STATS_INTERVAL_SECONDS:
+                    self.log_stats()
+                    last_stats = now
+                if now - last_save >= SERVICE_STATE_SAVE_SECONDS:
+                    self.save_state()
+                    last_save = now
+        finally:
+            self._stop.set()
+            reader.join(timeout=5)
+            self.save_state()
+            self.report.flush()
+            if self.store is not None:
+                self.store.close()
+            self.log_stats()
+            metrics.write_summary(os.path.join(REPORTS_DIR, SERVICE_SUMMARY_FILENAME), {"service": self.stats()})
+            print("👋 Ingestion service stopped.")
+
+
+def serve(input_dir: str = SERVICE_INPUT_DIR, socket_port: int = None, write_pdfs: bool = SERVICE_WRITE_PDFS):
+    """
+    Runs the ingestion service until SIGINT or SIGTERM.
+
+    Args:
+        input_dir (str): Directory to watch for transaction files.
+        socket_port (int): Read JSON lines from this localhost port instead of a directory.
+        write_pdfs (bool): Render a PDF report per anomaly.
+    """
+    source = QueueSource(port=socket_port) if socket_port else DirectorySource(input_dir)
+    metrics.reset()
+    service = IngestionService(source, write_pdfs=write_pdfs)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: service.stop())
+    service.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transaction Anomaly Narrator ingestion service.")
+    parser.add_argument("--input-dir", default=SERVICE_INPUT_DIR, help="Directory to watch for transaction files.")
+    parser.add_argument("--socket-port", type=int, help="Read newline-delimited JSON transactions from this localhost port instead.")
+    parser.add_argument("--no-pdf", action="store_true", help="Skip the per-anomaly PDF reports.")
+    args = parser.parse_args()
+    serve(args.input_dir, args.socket_port, write_pdfs=not args.no_pdf)
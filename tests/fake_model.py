@@ -0,0 +1,81 @@
+import random
+import re
+import threading
+import time
+import pandas as pd
+
+_TRANSACTION_ID = re.compile(r"Transaction ID: (\S+)")
+
+
+class RateLimitError(Exception):
+    """Raised by `FakeModel` the way the Gemini SDK reports HTTP 429."""
+
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def single_reply(prompt: str) -> str:
+    """Answers a single-transaction prompt with a narrative naming its transaction."""
+    return f"Narrative for {_TRANSACTION_ID.search(prompt).group(1)}."
+
+
+def prompt_transaction_ids(prompt: str) -> list:
+    """Returns the transaction IDs listed in a prompt, in order."""
+    return _TRANSACTION_ID.findall(prompt)
+
+
+class FakeModel:
+    """
+    Local stand-in for a Gemini model: answers after a random latency and fails a share of
+    calls with a 429 error. Every prompt is recorded in `prompts`.
+    """
+
+    model_name = "fake-model"
+
+    def __init__(self, reply=single_reply, latency: tuple = (0.0, 0.0), failure_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            reply: Callable mapping a prompt to the response text.
+            latency (tuple): Bounds of the uniform random delay of each call, in seconds.
+            failure_rate (float): Share of calls that raise `RateLimitError`.
+            seed (int): Seed of the latency and failure draws.
+        """
+        self.reply = reply
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.prompts = []
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        with self._lock:
+            self.prompts.append(prompt)
+            delay = self._random.uniform(*self.latency)
+            fail = self._random.random() < self.failure_rate
+            self.failures += fail
+        time.sleep(delay)
+        if fail:
+            raise RateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        return FakeResponse(self.reply(prompt))
+
+
+def make_records(count: int) -> list:
+    """Returns `count` anomalous transaction records with distinct IDs."""
+    start = pd.Timestamp("2024-01-01 02:00:00")
+    return [
+        {
+            'TransactionID': f"TXN{index:05d}",
+            'AccountID': f"ACC{index % 7}",
+            'Timestamp': start + pd.Timedelta(minutes=index),
+            'Amount': 100.0 + index,
+            'Location': "Lagos",
+            'AvgDailySpend': 50.0,
+            'AnomalyType': "Foreign Location",
+        }
+        for index in range(count)
+    ]
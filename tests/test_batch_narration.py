@@ -0,0 +1,80 @@
+import json
+from src.narrative_generator import BATCH_PROMPT_PREAMBLE, FAILED_NARRATIVE, NarrativeGenerator
+from fake_model import FakeModel, make_records, prompt_transaction_ids, single_reply
+
+
+def batch_reply(skip: set = frozenset()):
+    """Stub reply: a JSON object for batch prompts (leaving out `skip`), a plain narrative otherwise."""
+    def reply(prompt):
+        if not prompt.startswith(BATCH_PROMPT_PREAMBLE):
+            return single_reply(prompt)
+        return json.dumps({txn_id: f"Batch narrative for {txn_id}." for txn_id in prompt_transaction_ids(prompt) if txn_id not in skip})
+    return reply
+
+
+def narrate(model, records):
+    generator = NarrativeGenerator(model=model, max_workers=1, requests_per_minute=0)
+    return generator.generate_narratives(records, batch_prompts=True)
+
+
+def batch_prompts(model) -> list:
+    return [prompt for prompt in model.prompts if prompt.startswith(BATCH_PROMPT_PREAMBLE)]
+
+
+def test_well_formed_batch_is_narrated_with_one_prompt():
+    records = make_records(5)
+    model = FakeModel(reply=batch_reply())
+
+    narratives = narrate(model, records)
+
+    assert len(model.prompts) == 1
+    assert narratives == [f"Batch narrative for {record['TransactionID']}." for record in records]
+
+
+def test_missing_ids_fall_back_to_single_prompts():
+    records = make_records(5)
+    missing = {"TXN00001", "TXN00003"}
+    model = FakeModel(reply=batch_reply(skip=missing))
+
+    narratives = narrate(model, records)
+
+    assert len(batch_prompts(model)) == 1
+    single_prompts = [prompt for prompt in model.prompts if not prompt.startswith(BATCH_PROMPT_PREAMBLE)]
+    assert sorted(prompt_transaction_ids(" ".join(single_prompts))) == sorted(missing)
+    assert narratives == [
+        f"{'Narrative' if record['TransactionID'] in missing else 'Batch narrative'} for {record['TransactionID']}."
+        for record in records
+    ]
+
+
+def test_non_json_reply_falls_back_for_the_whole_batch():
+    records = make_records(5)
+
+    def reply(prompt):
+        return "Sorry, I can't help with that." if prompt.startswith(BATCH_PROMPT_PREAMBLE) else single_reply(prompt)
+
+    model = FakeModel(reply=reply)
+
+    narratives = narrate(model, records)
+
+    assert len(batch_prompts(model)) == 1
+    assert len(model.prompts) == 1 + len(records)
+    assert narratives == [f"Narrative for {record['TransactionID']}." for record in records]
+
+
+def test_parse_batch_response_drops_unknown_ids_and_empty_narratives():
+    text = 'Here you go: {"TXN1": " First\\nline ", "TXN2": "", "TXN9": "Unknown", "TXN3": 7}'
+    parsed = NarrativeGenerator._parse_batch_response(text, {"TXN1", "TXN2", "TXN3"})
+    assert parsed == {"TXN1": "First line"}
+
+
+def test_malformed_record_fails_alone():
+    records = make_records(5)
+    records[2]['Timestamp'] = None
+    model = FakeModel(reply=batch_reply())
+
+    narratives = narrate(model, records)
+
+    assert len(model.prompts) == 1
+    assert narratives[2] == FAILED_NARRATIVE
+    assert narratives[:2] + narratives[3:] == [f"Batch narrative for {record['TransactionID']}." for record in records[:2] + records[3:]]
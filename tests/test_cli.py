@@ -0,0 +1,43 @@
+import pytest
+from main import INPUT_FILE, build_parser, detect_command, run_command, serve_command
+
+
+@pytest.mark.parametrize("argv", [
+    ["--input", "x.csv", "run"],
+    ["run", "--input", "x.csv"],
+    ["--input", "x.csv", "detect"],
+    ["detect", "--input", "x.csv"],
+])
+def test_input_is_kept_before_or_after_the_command(argv):
+    assert build_parser().parse_args(argv).input == "x.csv"
+
+
+@pytest.mark.parametrize("argv", [
+    ["--no-pdf", "--no-narrate", "run"],
+    ["run", "--no-pdf", "--no-narrate"],
+    ["--no-pdf", "run", "--no-narrate"],
+])
+def test_run_flags_are_kept_before_or_after_the_command(argv):
+    args = build_parser().parse_args(argv)
+    assert args.no_pdf and args.no_narrate
+
+
+@pytest.mark.parametrize("argv", [["--no-pdf", "serve"], ["serve", "--no-pdf"]])
+def test_serve_no_pdf_before_or_after_the_command(argv):
+    args = build_parser().parse_args(argv)
+    assert args.no_pdf
+    assert args.handler is serve_command
+
+
+def test_defaults_without_options():
+    for argv, handler in (([], run_command), (["run"], run_command), (["detect"], detect_command)):
+        args = build_parser().parse_args(argv)
+        assert args.handler is handler
+        assert args.input == INPUT_FILE
+        assert not args.no_pdf and not args.no_narrate
+
+
+@pytest.mark.parametrize("argv", [["--stream", "detect"], ["detect", "--stream"], ["--stream", "run"], ["run", "--stream"], ["--stream"]])
+def test_stream_is_opt_in_before_or_after_the_command(argv):
+    assert build_parser().parse_args(argv).stream
+    assert not build_parser().parse_args([arg for arg in argv if arg != "--stream"]).stream
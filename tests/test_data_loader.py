@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+import pytest
+from src.data_loader import load_transactions, load_transactions_in_chunks
+
+CSV = """TransactionID,AccountID,Timestamp,Amount,Merchant,TransactionType,Location,AccountHistoryDays,AvgDailySpend
+T1,A1,2024-01-01 10:00:00,12.50,Shop,POS,London,,40.00
+T2,A1,2024-01-01 11:00:00,13.50,Shop,POS,London,120,
+"""
+
+
+def test_blank_optional_fields_load(tmp_path):
+    path = tmp_path / "transactions.csv"
+    path.write_text(CSV)
+
+    df = load_transactions(str(path))
+    assert df is not None
+    assert df['AccountHistoryDays'].isna().tolist() == [True, False]
+    assert df['AccountHistoryDays'].iloc[1] == 120
+    assert pd.isna(df['AvgDailySpend'].iloc[1])
+
+    chunks = list(load_transactions_in_chunks(str(path), chunksize=1))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+
+
+def write_sorted_transactions(tmp_path, rows: int = 1_000) -> pd.DataFrame:
+    df = pd.DataFrame({
+        'TransactionID': [f"T{index}" for index in range(rows)],
+        'AccountID': [f"A{index % 13}" for index in range(rows)],
+        'Timestamp': pd.date_range("2024-01-01", periods=rows, freq="min"),
+        'Amount': [float(index) for index in range(rows)],
+        'Location': ["London"] * rows,
+    })
+    df.to_csv(tmp_path / "transactions.csv", index=False)
+    df.to_parquet(tmp_path / "transactions.parquet", index=False, row_group_size=300)
+    df.to_feather(tmp_path / "transactions.feather", chunksize=128)
+    return df
+
+
+@pytest.mark.parametrize("file_name", ["transactions.csv", "transactions.parquet", "transactions.feather"])
+def test_chunks_of_every_format_match_the_full_load(tmp_path, file_name):
+    write_sorted_transactions(tmp_path)
+    path = str(tmp_path / file_name)
+
+    chunks = list(load_transactions_in_chunks(path, chunksize=250))
+
+    assert [len(chunk) for chunk in chunks] == [250, 250, 250, 250]
+    assert all(isinstance(chunk['AccountID'].dtype, pd.CategoricalDtype) for chunk in chunks)
+    streamed = pd.concat(chunks, ignore_index=True).astype({'AccountID': str, 'Location': str})
+    full = load_transactions(path).astype({'AccountID': str, 'Location': str})
+    pd.testing.assert_frame_equal(streamed, full)
+
+
+def test_csv_chunks_prefer_an_up_to_date_parquet_copy(tmp_path):
+    write_sorted_transactions(tmp_path)
+    path = tmp_path / "transactions.csv"
+    # A Parquet copy newer than the CSV is read instead, so an unparseable CSV is never opened
+    path.write_bytes(b"\xff\xfe not a csv")
+    parquet_path = tmp_path / "transactions.parquet"
+    os.utime(parquet_path, (path.stat().st_mtime + 1,) * 2)
+
+    assert sum(len(chunk) for chunk in load_transactions_in_chunks(str(path), chunksize=400)) == 1_000
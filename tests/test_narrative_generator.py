@@ -0,0 +1,74 @@
+import time
+import pytest
+import src.narrative_generator as narrative_generator
+from src.narrative_generator import FAILED_NARRATIVE, NarrativeGenerator, TokenBucket
+from fake_model import FakeModel, make_records
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Records the backoff bound of every retry instead of sleeping."""
+    bounds = []
+    monkeypatch.setattr(narrative_generator.random, "uniform", lambda low, high: bounds.append(high) or 0.0)
+    return bounds
+
+
+def test_retries_rate_limit_errors_with_exponential_backoff(backoffs, monkeypatch):
+    monkeypatch.setattr(narrative_generator, "NARRATIVE_BACKOFF_BASE_SECONDS", 1.0)
+    monkeypatch.setattr(narrative_generator, "NARRATIVE_BACKOFF_MAX_SECONDS", 5.0)
+    model = FakeModel(failure_rate=1.0)
+    generator = NarrativeGenerator(model=model, requests_per_minute=0, max_retries=4)
+
+    assert generator.generate_narrative(make_records(1)[0]) == FAILED_NARRATIVE
+    assert len(model.prompts) == 5
+    assert backoffs == [1.0, 2.0, 4.0, 5.0]
+
+
+def test_recovers_after_transient_failures(backoffs):
+    # With this seed the first three calls fail
+    model = FakeModel(failure_rate=0.5, seed=4)
+    generator = NarrativeGenerator(model=model, requests_per_minute=0, max_retries=20)
+
+    assert generator.generate_narrative(make_records(1)[0]) == "Narrative for TXN00000."
+    assert 0 < model.failures == len(model.prompts) - 1 == len(backoffs)
+
+
+def test_does_not_retry_other_errors(backoffs):
+    def reply(prompt):
+        raise ValueError("400 Invalid argument")
+
+    model = FakeModel(reply=reply)
+    generator = NarrativeGenerator(model=model, requests_per_minute=0, max_retries=5)
+
+    assert generator.generate_narrative(make_records(1)[0]) == FAILED_NARRATIVE
+    assert len(model.prompts) == 1
+    assert backoffs == []
+
+
+def test_token_bucket_caps_the_request_rate():
+    bucket = TokenBucket(requests_per_minute=1200)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    # One token is available at once, then 20 per second
+    assert time.monotonic() - started >= 0.45
+
+
+def test_rate_limit_is_shared_by_all_workers():
+    model = FakeModel()
+    generator = NarrativeGenerator(model=model, max_workers=8, requests_per_minute=1200)
+    started = time.monotonic()
+    generator.generate_narratives(make_records(11))
+    assert time.monotonic() - started >= 0.45
+    assert len(model.prompts) == 11
+
+
+def test_generate_narratives_keeps_record_order_under_concurrency(backoffs):
+    records = make_records(60)
+    model = FakeModel(latency=(0.0, 0.02), failure_rate=0.2, seed=7)
+    generator = NarrativeGenerator(model=model, max_workers=8, requests_per_minute=0, max_retries=10)
+
+    narratives = generator.generate_narratives(records)
+
+    assert model.failures > 0
+    assert narratives == [f"Narrative for {record['TransactionID']}." for record in records]
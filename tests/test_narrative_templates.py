@@ -0,0 +1,87 @@
+from src.narrative_generator import FAILED_NARRATIVE, NarrativeGenerator
+from src.narrative_templates import amount_band, fill_template, group_by_signature, parse_template, signature
+from fake_model import FakeModel, make_records, single_reply
+
+TEMPLATE = "Transaction {transaction_id} of {amount} in {location} at {time} was flagged."
+
+
+def template_reply(template: str):
+    """Stub reply: `template` for template prompts, a plain narrative for single prompts."""
+    def reply(prompt):
+        return template if "summary template" in prompt else single_reply(prompt)
+    return reply
+
+
+def template_prompts(model) -> list:
+    return [prompt for prompt in model.prompts if "summary template" in prompt]
+
+
+def test_group_by_signature_splits_templated_and_individual():
+    common = make_records(4)
+    rare = {**make_records(1)[0], 'TransactionID': "RARE", 'AnomalyType': "Odd Hours"}
+    large = {**make_records(1)[0], 'TransactionID': "LARGE", 'Amount': 50_000.0}
+    entries = list(enumerate(common + [rare, large, {**large, 'TransactionID': "LARGE2"}, {**large, 'TransactionID': "LARGE3"}]))
+
+    templated, individual = group_by_signature(entries, min_group=3, bespoke_signatures=["* | * | 10000+"])
+
+    assert list(templated) == [signature(common[0])]
+    assert [position for position, _ in templated[signature(common[0])]] == [0, 1, 2, 3]
+    assert [position for position, _ in individual] == [4, 5, 6, 7]
+
+
+def test_amount_bands():
+    assert [amount_band(value, [100, 1_000]) for value in (5, 100, 999, 1_000, None, float('nan'))] == [
+        "<100", "100-1000", "100-1000", "1000+", "unknown", "unknown"
+    ]
+
+
+def test_parse_template_rejects_missing_or_unknown_placeholders():
+    assert parse_template(f' "{TEMPLATE}"\n') == TEMPLATE
+    assert parse_template("A transaction in {location} at {time} was flagged.") is None
+    assert parse_template(TEMPLATE + " Merchant: {merchant}.") is None
+
+
+def test_fill_template():
+    record = make_records(1)[0]
+    assert fill_template(TEMPLATE, record) == "Transaction TXN00000 of $100.00 in Lagos at 02:00:00 was flagged."
+
+
+def narrate(model, records, batch_prompts=False):
+    generator = NarrativeGenerator(model=model, max_workers=2, requests_per_minute=0, template_min_group=3)
+    return generator.generate_narratives(records, batch_prompts=batch_prompts, templates=True)
+
+
+def test_group_is_narrated_from_one_template():
+    records = make_records(6)
+    model = FakeModel(reply=template_reply(TEMPLATE))
+
+    narratives = narrate(model, records)
+
+    assert len(model.prompts) == 1
+    assert narratives == [fill_template(TEMPLATE, record) for record in records]
+
+
+def test_unusable_template_falls_back_to_individual_prompts():
+    records = make_records(4)
+    model = FakeModel(reply=template_reply("A transaction in {location} was flagged."))
+
+    narratives = narrate(model, records)
+
+    assert len(template_prompts(model)) == 1
+    assert len(model.prompts) == 1 + len(records)
+    assert narratives == [f"Narrative for {record['TransactionID']}." for record in records]
+
+
+def test_member_that_cannot_be_filled_fails_alone():
+    records = make_records(5)
+    records[3]['Timestamp'] = None
+    for batch_prompts in (False, True):
+        model = FakeModel(reply=template_reply(TEMPLATE))
+
+        narratives = narrate(model, records, batch_prompts=batch_prompts)
+
+        assert len(model.prompts) == 1
+        assert narratives[3] == FAILED_NARRATIVE
+        assert [narrative for position, narrative in enumerate(narratives) if position != 3] == [
+            fill_template(TEMPLATE, record) for position, record in enumerate(records) if position != 3
+        ]
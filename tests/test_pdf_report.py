@@ -0,0 +1,13 @@
+import pandas as pd
+from src.pdf_report import IncidentPDF, _render_incident
+
+
+def test_incident_without_optional_fields_renders():
+    anomaly = {
+        'TransactionID': "T1", 'AccountID': "A1", 'Timestamp': pd.Timestamp("2024-01-01 02:00:00"),
+        'Amount': 25_000.0, 'AnomalyType': "High Value", 'Narrative': "Narrative not generated.",
+    }
+    pdf = IncidentPDF()
+    pdf.add_page()
+    _render_incident(pdf, anomaly, "2024-01-01 03:00:00")
+    assert pdf.page_no() == 1
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+from src.report_generator import ReportSink
+
+
+def rows(ids) -> list:
+    return [
+        {'TransactionID': f"T{index}", 'AccountID': "A1", 'Timestamp': "2024-01-01 10:00:00", 'Amount': 1.0,
+         'Location': "London", 'AnomalyType': "High Value", 'Narrative': "n/a"}
+        for index in ids
+    ]
+
+
+def test_parquet_resume_after_a_crash_during_flush(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = ReportSink("report.parquet", flush_rows=2)
+    sink.write(rows(range(4)))
+    sink.flush()
+    # A crash while writing the next part leaves a truncated temporary file behind
+    with open(os.path.join(sink.path, "part-00001.parquet.tmp"), "wb") as f:
+        f.write(b"PAR1 truncated")
+
+    resumed = ReportSink("report.parquet", flush_rows=2)
+    assert resumed.written_ids == {f"T{index}" for index in range(4)}
+    resumed.write(rows(range(2, 6)))
+    resumed.close()
+
+    assert not [name for name in os.listdir(resumed.path) if name.endswith(".tmp")]
+    report = pd.read_parquet(resumed.path)
+    assert sorted(report['TransactionID']) == [f"T{index}" for index in range(6)]
+
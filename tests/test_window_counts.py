@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.rules import WindowIndex, window_counts
+
+WINDOW = pd.Timedelta('10min')
+
+
+def random_transactions(rng, rows: int, accounts: int, minutes: int) -> pd.DataFrame:
+    """Unsorted transactions on whole minutes, so many timestamps tie, plus single-row accounts."""
+    account_ids = [f"ACC{i}" for i in rng.integers(0, accounts, rows)]
+    account_ids[:3] = ["ONLY1", "ONLY2", "ONLY3"]
+    timestamps = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, minutes, rows), unit='min')
+    return pd.DataFrame({'AccountID': account_ids, 'Timestamp': timestamps})
+
+
+def pandas_counts(df: pd.DataFrame, window) -> np.ndarray:
+    """The pandas reference: a time-based rolling count per account, on data stably sorted by (account, time)."""
+    ordered = df.assign(Row=np.arange(len(df))).sort_values(['AccountID', 'Timestamp'], kind='stable')
+    counts = ordered.groupby('AccountID', sort=False).rolling(window, on='Timestamp')['Row'].count()
+    # The result follows the sorted row order; map it back to the input order
+    expected = np.empty(len(df), dtype=np.int64)
+    expected[ordered['Row'].to_numpy()] = counts.to_numpy()
+    return expected
+
+
+def kernel_inputs(df: pd.DataFrame) -> tuple:
+    group_codes, _ = pd.factorize(df['AccountID'])
+    return group_codes, pd.DatetimeIndex(df['Timestamp']).as_unit('ns').asi8
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("rows, accounts, minutes", [(200, 10, 60), (2_000, 300, 600), (5_000, 20, 120)])
+def test_matches_pandas_rolling_count(seed, rows, accounts, minutes):
+    df = random_transactions(np.random.default_rng(seed), rows, accounts, minutes)
+    counts = window_counts(*kernel_inputs(df), WINDOW.value)
+    np.testing.assert_array_equal(counts, pandas_counts(df, WINDOW))
+
+
+def test_single_rows_and_empty_input():
+    df = pd.DataFrame({'AccountID': ['A', 'B', 'C'], 'Timestamp': pd.to_datetime(['2024-01-01 00:05', '2024-01-01 00:00', '2024-01-01 00:01'])})
+    np.testing.assert_array_equal(window_counts(*kernel_inputs(df), WINDOW.value), [1, 1, 1])
+    assert len(window_counts(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), WINDOW.value)) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_per_row_windows(seed):
+    rng = np.random.default_rng(seed)
+    df = random_transactions(rng, 2_000, 50, 240)
+    choices = [pd.Timedelta('5min'), WINDOW, pd.Timedelta('30min')]
+    picks = rng.integers(0, len(choices), len(df))
+    windows = np.array([choices[pick].value for pick in picks], dtype=np.int64)
+
+    expected = np.empty(len(df), dtype=np.int64)
+    for index, window in enumerate(choices):
+        expected[picks == index] = pandas_counts(df, window)[picks == index]
+    np.testing.assert_array_equal(window_counts(*kernel_inputs(df), windows), expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_history_rows_count_but_are_not_reported(seed):
+    rng = np.random.default_rng(seed)
+    history = random_transactions(rng, 1_000, 40, 90)
+    chunk = random_transactions(rng, 1_000, 40, 90)
+    # The chunk starts where the history ends, overlapping its last window and tying on its last minute
+    chunk['Timestamp'] += history['Timestamp'].max() - chunk['Timestamp'].min() - pd.Timedelta('5min')
+    combined = pd.concat([history, chunk], ignore_index=True)
+
+    group_codes, timestamps = kernel_inputs(combined)
+    index = WindowIndex(group_codes, timestamps, skip=len(history))
+    np.testing.assert_array_equal(index.counts(WINDOW.value), pandas_counts(combined, WINDOW)[len(history):])
+
+    windows = np.full(len(chunk), pd.Timedelta('20min').value, dtype=np.int64)
+    np.testing.assert_array_equal(index.counts(windows), pandas_counts(combined, pd.Timedelta('20min'))[len(history):])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_missing_timestamps_never_form_a_window(seed):
+    rng = np.random.default_rng(seed)
+    df = random_transactions(rng, 1_000, 20, 60)
+    missing = rng.random(len(df)) < 0.05
+    df.loc[missing, 'Timestamp'] = pd.NaT
+
+    index = WindowIndex(*kernel_inputs(df))
+    counts = index.counts(WINDOW.value)
+
+    np.testing.assert_array_equal(index.valid, ~missing)
+    np.testing.assert_array_equal(counts[~missing], pandas_counts(df[~missing].reset_index(drop=True), WINDOW))
+
+
+def test_missing_timestamp_does_not_shift_its_account():
+    timestamps = pd.to_datetime([None] + [f"2024-01-01 10:0{minute}:00" for minute in range(6)])
+    index = WindowIndex(np.zeros(7, dtype=np.int64), pd.DatetimeIndex(timestamps).as_unit('ns').asi8)
+    np.testing.assert_array_equal(index.counts(WINDOW.value)[index.valid], [1, 2, 3, 4, 5, 6])
+    assert not index.valid[0]